@@ -12,42 +12,48 @@ if sys.version_info[0] == 3 and 10 > sys.version_info[1] >= 8 and sys.platform.s
 elif sys.version_info[0] == 3 and sys.version_info[1] >= 10 and sys.platform.startswith('win'):
     asyncio.set_event_loop(asyncio.ProactorEventLoop())
 
-# Log file path
-bot_log_path = os.path.abspath(os.path.join(sys.path[0], 'log'))
-if not os.path.exists(bot_log_path):
-    os.makedirs(bot_log_path)
 
-# Custom logger
-log_info_name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-INFO.log'
-log_error_name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-ERROR.log'
-log_info_path = os.path.join(bot_log_path, log_info_name)
-log_error_path = os.path.join(bot_log_path, log_error_name)
+# 进程池子进程 (spawn) 会以 __mp_main__ 重新导入本文件, 初始化 nonebot 及加载插件只能在主进程中进行
+if __name__ == '__main__':
+    # Log file path
+    bot_log_path = os.path.abspath(os.path.join(sys.path[0], 'log'))
+    if not os.path.exists(bot_log_path):
+        os.makedirs(bot_log_path)
 
-logger.add(log_info_path, rotation='00:00', diagnose=False, level='INFO', format=default_format, encoding='utf-8')
-logger.add(log_error_path, rotation='00:00', diagnose=False, level='ERROR', format=default_format, encoding='utf-8')
+    # Custom logger
+    log_info_name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-INFO.log'
+    log_error_name = f'{datetime.now().strftime("%Y%m%d-%H%M%S")}-ERROR.log'
+    log_info_path = os.path.join(bot_log_path, log_info_name)
+    log_error_path = os.path.join(bot_log_path, log_error_name)
 
-# Add extra debug log file
-# log_debug_name = f'{datetime.today().strftime("%Y%m%d-%H%M%S")}-DEBUG.log'
-# log_debug_path = os.path.join(bot_log_path, log_debug_name)
-# logger.add(log_debug_path, rotation='00:00', diagnose=False, level='DEBUG', format=default_format, encoding='utf-8')
+    logger.add(log_info_path, rotation='00:00', diagnose=False, level='INFO', format=default_format, encoding='utf-8')
+    logger.add(log_error_path, rotation='00:00', diagnose=False, level='ERROR', format=default_format, encoding='utf-8')
 
-# You can pass some keyword args config to init function
-nonebot.init()
+    # Add extra debug log file
+    # log_debug_name = f'{datetime.today().strftime("%Y%m%d-%H%M%S")}-DEBUG.log'
+    # log_debug_path = os.path.join(bot_log_path, log_debug_name)
+    # logger.add(log_debug_path, rotation='00:00', diagnose=False, level='DEBUG', format=default_format, encoding='utf-8')
 
-# 获取 driver 用于初始化
-driver = nonebot.get_driver()
+    # You can pass some keyword args config to init function
+    nonebot.init()
 
-# 注册 cqhttp adapter
-driver.register_adapter(OneBotAdapter)
+    # 获取 driver 用于初始化
+    driver = nonebot.get_driver()
 
-# 加载插件
-nonebot.load_plugins('omega_miya/service')
-nonebot.load_plugins('omega_miya/plugins')
+    # 注册 cqhttp adapter
+    driver.register_adapter(OneBotAdapter)
 
-# Modify some config / config depends on loaded configs
-# config = nonebot.get_driver().config
-# do something...
+    # 启动时创建用于图片编码等 CPU 密集型任务的进程池, 关闭时结束子进程
+    from omega_miya.utils.process_utils import start_process_pool, shutdown_process_pool
+    driver.on_startup(start_process_pool)
+    driver.on_shutdown(shutdown_process_pool)
 
+    # 加载插件
+    nonebot.load_plugins('omega_miya/service')
+    nonebot.load_plugins('omega_miya/plugins')
+
+    # Modify some config / config depends on loaded configs
+    # config = nonebot.get_driver().config
+    # do something...
 
-if __name__ == '__main__':
     nonebot.run()
@@ -9,7 +9,7 @@
 """
 
 from .schemas import (DatabaseErrorInfo, AuthSetting, BiliDynamic, EmailBox, History, PixivisionArticle,
-                      Plugin, Statistic, SystemSetting, WordBank)
+                      Plugin, ScheduleJob, Statistic, SystemSetting, WordBank)
 from .internal import (InternalBotGroup, InternalBotUser, InternalBotGuild, InternalGuildChannel,
                        InternalOneBotV11Bot, InternalSubscriptionSource, InternalPixiv)
 from .exception import DatabaseQueryError, DatabaseUpgradeError, DatabaseDeleteError
@@ -27,6 +27,7 @@ __all__ = [
     'History',
     'PixivisionArticle',
     'Plugin',
+    'ScheduleJob',
     'Statistic',
     'SystemSetting',
     'WordBank',
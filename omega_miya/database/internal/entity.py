@@ -9,7 +9,8 @@
 """
 
 from pydantic import BaseModel, root_validator
-from typing import Type, Literal, List, Union, Optional
+import time
+from typing import Type, Literal, Dict, Iterable, List, Tuple, Union, Optional
 from datetime import timedelta, datetime, date
 from omega_miya.result import BoolResult
 
@@ -181,6 +182,53 @@ class GroupUserRelation(BaseRelation):
         return 'group_user'
 
 
+_SUBSCRIBED_ENTITY_CACHE_EXPIRE_TIME: int = 300
+"""订阅源已订阅 Entity 的缓存有效时间, 单位秒, 约为订阅源的一个检查周期"""
+
+
+class _SubscribedEntityCache(object):
+    """订阅源已订阅 Entity 的缓存
+
+    - 以 (sub_type, sub_id) 为键缓存查询结果, 同一检查周期内多次向同一订阅源的订阅者发送消息时不再重复查询
+    - 添加或删除订阅时使对应订阅源的缓存失效, 查询期间发生过失效的结果不写入缓存
+    """
+
+    def __init__(self, expire_time: int):
+        self.expire_time = expire_time
+        self.version: int = 0
+        self._cache: Dict[Tuple[str, str], Tuple[float, List["BaseInternalEntity"]]] = {}
+
+    def get(self, sub_type: str, sub_id: str) -> Optional[List["BaseInternalEntity"]]:
+        """获取未过期的缓存"""
+        cached = self._cache.get((sub_type, sub_id))
+        if cached is None:
+            return None
+
+        cached_at, entities = cached
+        if time.time() - cached_at >= self.expire_time:
+            self._cache.pop((sub_type, sub_id), None)
+            return None
+        return list(entities)
+
+    def set_many(self, sub_type: str, entities: Dict[str, List["BaseInternalEntity"]], version: int) -> None:
+        """写入缓存, version 为开始查询时的缓存版本"""
+        if version != self.version:
+            return
+
+        now = time.time()
+        for key in [k for k, (cached_at, _) in self._cache.items() if now - cached_at >= self.expire_time]:
+            self._cache.pop(key, None)
+        self._cache.update({(sub_type, sub_id): (now, list(v)) for sub_id, v in entities.items()})
+
+    def invalidate(self, sub_type: str, sub_id: str) -> None:
+        """使订阅源的缓存失效"""
+        self.version += 1
+        self._cache.pop((sub_type, sub_id), None)
+
+
+_subscribed_entity_cache = _SubscribedEntityCache(expire_time=_SUBSCRIBED_ENTITY_CACHE_EXPIRE_TIME)
+
+
 class BaseInternalEntity(object):
     """封装后用于插件调用的数据库关联实体基类"""
     _base_relation_model: Type[BaseRelation] = BaseRelation
@@ -247,10 +295,14 @@ class BaseInternalEntity(object):
         return _re_m, _e_m, _bs_m
 
     @classmethod
-    async def init_from_index_id(cls, id_: int) -> "BaseInternalEntity":
-        """从索引 id 实例化"""
-        relation, entity, bot_self = await cls.query_related_entity_by_index_id(id_=id_)
-        parent_entity = (await Entity.query_by_index_id(id_=relation.parent_entity_id)).result
+    def init_from_models(
+            cls,
+            relation: RelatedEntityModel,
+            entity: EntityModel,
+            parent_entity: EntityModel,
+            bot_self: BotSelfModel
+    ) -> "BaseInternalEntity":
+        """从已查询的 RelatedEntityModel 及其对应 EntityModel, 父 EntityModel, BotSelfModel 实例化"""
         model = {
             'bot_self_id': bot_self.self_id,
             'relation_type': relation.relation_type,
@@ -280,6 +332,58 @@ class BaseInternalEntity(object):
         new_related_entity.relation_model = relation
         return new_related_entity
 
+    @classmethod
+    async def init_from_index_id(cls, id_: int) -> "BaseInternalEntity":
+        """从索引 id 实例化"""
+        relation, entity, bot_self = await cls.query_related_entity_by_index_id(id_=id_)
+        parent_entity = (await Entity.query_by_index_id(id_=relation.parent_entity_id)).result
+        return cls.init_from_models(relation=relation, entity=entity, parent_entity=parent_entity, bot_self=bot_self)
+
+    @classmethod
+    async def query_all_by_subscribed_sources(
+            cls,
+            sub_type: str,
+            sub_ids: Iterable[str],
+            *,
+            relation_type: Optional[Iterable[str]] = ('bot_group', 'bot_user', 'guild_channel')
+    ) -> Dict[str, List["BaseInternalEntity"]]:
+        """查询已订阅多个同类型订阅源的全部内部 Entity 对象
+
+        所有未缓存的订阅源只执行一次联合查询, 结果按订阅源缓存, 在订阅源添加或删除订阅前的一个检查周期内有效
+
+        :param sub_type: 订阅源类型
+        :param sub_ids: 订阅源 id
+        :param relation_type: 筛选 relation_type, None 为不限制
+        :return: Dict[sub_id, List[BaseInternalEntity]], 没有订阅者的订阅源对应空列表
+        """
+        sub_ids = set(sub_ids)
+        result = {}
+        for sub_id in sub_ids:
+            cached_entities = _subscribed_entity_cache.get(sub_type=sub_type, sub_id=sub_id)
+            if cached_entities is not None:
+                result[sub_id] = cached_entities
+
+        query_sub_ids = sub_ids - result.keys()
+        if query_sub_ids:
+            cache_version = _subscribed_entity_cache.version
+            query_result = await RelatedEntity.query_all_subscribed_related_entity_by_sources(
+                sub_type=sub_type, sub_ids=query_sub_ids)
+
+            queried_entities: Dict[str, List[BaseInternalEntity]] = {sub_id: [] for sub_id in query_sub_ids}
+            for sub_id, _re, _e, _pe, _bs in query_result:
+                queried_entities[sub_id].append(BaseInternalEntity.init_from_models(
+                    relation=RelatedEntityModel.from_orm(_re), entity=EntityModel.from_orm(_e),
+                    parent_entity=EntityModel.from_orm(_pe), bot_self=BotSelfModel.from_orm(_bs)
+                ))
+
+            _subscribed_entity_cache.set_many(sub_type=sub_type, entities=queried_entities, version=cache_version)
+            result.update(queried_entities)
+
+        if relation_type is not None:
+            relation_type = set(relation_type)
+            result = {k: [x for x in v if x.relation_type in relation_type] for k, v in result.items()}
+        return result
+
     async def get_bot_self_model(self) -> BotSelfModel:
         """获取并初始化 bot_self_model"""
         if not isinstance(self.bot_self_model, BotSelfModel):
@@ -856,7 +960,9 @@ class BaseInternalEntity(object):
             return BoolResult(
                 error=True, info=f'Query subscription source failed, {subscription_source.info}', result=False)
         subscription = Subscription(sub_source_id=subscription_source.result.id, entity_id=related_entity.id)
-        return await subscription.add_upgrade_unique_self(sub_info=sub_info)
+        result = await subscription.add_upgrade_unique_self(sub_info=sub_info)
+        _subscribed_entity_cache.invalidate(sub_type=sub_type, sub_id=sub_id)
+        return result
 
     async def delete_subscription(self, sub_type: str, sub_id: str) -> BoolResult:
         """删除订阅"""
@@ -866,7 +972,9 @@ class BaseInternalEntity(object):
             return BoolResult(
                 error=True, info=f'Query subscription source failed, {subscription_source.info}', result=False)
         subscription = Subscription(sub_source_id=subscription_source.result.id, entity_id=related_entity.id)
-        return await subscription.query_and_delete_unique_self()
+        result = await subscription.query_and_delete_unique_self()
+        _subscribed_entity_cache.invalidate(sub_type=sub_type, sub_id=sub_id)
+        return result
 
     async def query_all_subscribed_source(self, sub_type: Optional[str] = None) -> List[SubscriptionSourceModel]:
         """查询全部已订阅的订阅源
@@ -105,6 +105,11 @@ class InternalPixiv(object):
         """查询用户的全部作品 pid"""
         return (await PixivArtwork.query_all_pid_by_uid(uid=uid)).result
 
+    @classmethod
+    async def query_recent_pids(cls, limit: int) -> List[int]:
+        """查询最新的作品 pid"""
+        return (await PixivArtwork.query_recent_pids(limit=limit)).result
+
     async def exist(self) -> (int, bool):
         """判断该作品是否在数据库中已存在
 
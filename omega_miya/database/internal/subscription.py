@@ -8,12 +8,14 @@
 @Software       : PyCharm 
 """
 
+import ujson as json
 from enum import Enum, unique
 from pydantic import BaseModel
-from typing import List, Literal, Type, Optional
+from typing import Dict, List, Literal, Type, Optional, Union
 from omega_miya.result import BoolResult
 
 from ..schemas.subscription_source import SubscriptionSource, SubscriptionSourceModel
+from ..schemas.subscription_source_state import SubscriptionSourceState
 from ..schemas.entity import Entity, EntityModel
 from ..schemas.related_entity import RelatedEntity, RelatedEntityModel
 
@@ -91,6 +93,45 @@ class InternalSubscriptionSource(object):
             sub_type=self.subscription_source.sub_type.value
         ).add_upgrade_unique_self(sub_user_name=sub_user_name, sub_info=sub_info)
 
+    @staticmethod
+    def _load_state(state: Optional[str]) -> Dict[str, str]:
+        """解析订阅源状态表中保存的状态"""
+        if state is None:
+            return {}
+        return {str(k): str(v) for k, v in json.loads(state).items()}
+
+    @classmethod
+    async def query_all_state_by_sub_type(cls, sub_type: str) -> Dict[str, Dict[str, str]]:
+        """查询符合 sub_type 的全部订阅源的状态
+
+        :return: Dict[sub_id, 状态字典]
+        """
+        source_result = await cls.query_all_by_sub_type(sub_type=sub_type)
+        state_result = dict(await SubscriptionSourceState.query_all_by_sub_type(sub_type=sub_type))
+        return {x.sub_id: cls._load_state(state=state_result.get(x.sub_id)) for x in source_result}
+
+    async def query_state(self) -> Dict[str, str]:
+        """获取订阅源保存的状态"""
+        subscription = await self.get_subscription_source_model()
+        state_result = await SubscriptionSourceState(sub_source_id=subscription.id).query()
+        return self._load_state(state=state_result.result.state if state_result.success else None)
+
+    async def update_state(self, **kwargs: Union[str, int, None]) -> BoolResult:
+        """更新订阅源保存的状态, 值为 None 的项将被移除
+
+        状态保存在单独的订阅源状态表中, 不影响订阅源信息, 重新添加订阅源时也不会被覆盖
+        """
+        subscription = await self.get_subscription_source_model()
+        state = await self.query_state()
+        for key, value in kwargs.items():
+            if value is None:
+                state.pop(key, None)
+            else:
+                state[key] = str(value)
+
+        return await SubscriptionSourceState(sub_source_id=subscription.id).add_upgrade_unique_self(
+            state=json.dumps(state, ensure_ascii=False))
+
     async def delete(self) -> BoolResult:
         """仅删除订阅源信息"""
         return await SubscriptionSource(
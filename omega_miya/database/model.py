@@ -9,7 +9,7 @@
 """
 
 from sqlalchemy import Sequence, ForeignKey
-from sqlalchemy import Column, Integer, BigInteger, Float, String, Date, DateTime
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Date, DateTime, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from .config import database_config
@@ -357,6 +357,9 @@ class SubscriptionSourceOrm(Base):
     subscription_source_subscription = relationship('SubscriptionOrm',
                                                     back_populates='subscription_back_subscription_source',
                                                     cascade='all, delete-orphan', passive_deletes=True)
+    subscription_source_state = relationship('SubscriptionSourceStateOrm',
+                                             back_populates='state_back_subscription_source',
+                                             cascade='all, delete-orphan', passive_deletes=True, uselist=False)
 
     def __repr__(self):
         return f"<SubscriptionSourceOrm(sub_type='{self.sub_type}', sub_id='{self.sub_id}', " \
@@ -364,6 +367,28 @@ class SubscriptionSourceOrm(Base):
                f"created_at='{self.created_at}', updated_at='{self.updated_at}')>"
 
 
+class SubscriptionSourceStateOrm(Base):
+    """订阅源状态表, 存放订阅源检查时使用的状态, 如已确认的最新作品及检查间隔等"""
+    __tablename__ = f'{database_config.db_prefix}subscription_source_state'
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+
+    id = Column(Integer, Sequence('sub_source_state_id_seq'), primary_key=True, nullable=False, index=True,
+                unique=True)
+    sub_source_id = Column(Integer, ForeignKey(SubscriptionSourceOrm.id, ondelete='CASCADE'), nullable=False,
+                           index=True, unique=True)
+    state = Column(String(4096), nullable=False, comment='订阅源状态, json 格式')
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+    # 设置级联和关系加载
+    state_back_subscription_source = relationship(SubscriptionSourceOrm, back_populates='subscription_source_state',
+                                                  lazy='joined', innerjoin=True)
+
+    def __repr__(self):
+        return f"<SubscriptionSourceStateOrm(sub_source_id='{self.sub_source_id}', state='{self.state}', " \
+               f"created_at='{self.created_at}', updated_at='{self.updated_at}')>"
+
+
 class SubscriptionOrm(Base):
     """订阅表"""
     __tablename__ = f'{database_config.db_prefix}subscription'
@@ -507,6 +532,26 @@ class WordBankOrm(Base):
                f"result_word='{self.result_word}', created_at='{self.created_at}', updated_at='{self.updated_at}')>"
 
 
+class ScheduleJobOrm(Base):
+    """计划任务表, 存放需要持久化的 APScheduler 计划任务"""
+    __tablename__ = f'{database_config.db_prefix}schedule_job'
+    __table_args__ = {'mysql_engine': 'InnoDB', 'mysql_charset': 'utf8mb4'}
+
+    # 表结构
+    id = Column(Integer, Sequence('schedule_job_id_seq'), primary_key=True, nullable=False, index=True, unique=True)
+    job_store = Column(String(64), nullable=False, index=True, comment='任务所属 jobstore 名称')
+    job_id = Column(String(128), nullable=False, index=True, unique=True, comment='任务 ID')
+    next_run_time = Column(Float, nullable=True, index=True, comment='下次运行时间戳, 为空时任务已暂停')
+    job_state = Column(LargeBinary, nullable=False, comment='序列化的任务状态')
+    created_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<ScheduleJobOrm(job_store='{self.job_store}', job_id='{self.job_id}', " \
+               f"next_run_time='{self.next_run_time}', created_at='{self.created_at}', " \
+               f"updated_at='{self.updated_at}')>"
+
+
 __all__ = [
     'Base',
     'SystemSettingOrm',
@@ -523,10 +568,12 @@ __all__ = [
     'EmailBoxOrm',
     'EmailBoxBindOrm',
     'SubscriptionSourceOrm',
+    'SubscriptionSourceStateOrm',
     'SubscriptionOrm',
     'BiliDynamicOrm',
     'PixivArtworkOrm',
     'PixivArtworkPageOrm',
     'PixivisionArticleOrm',
-    'WordBankOrm'
+    'WordBankOrm',
+    'ScheduleJobOrm'
 ]
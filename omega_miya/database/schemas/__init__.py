@@ -23,10 +23,12 @@ from .pixiv_artwork_page import PixivArtworkPage
 from .pixivision_article import PixivisionArticle
 from .plugin import Plugin
 from .related_entity import RelatedEntity
+from .schedule_job import ScheduleJob
 from .sign_in import SignIn
 from .statistic import Statistic
 from .subscription import Subscription
 from .subscription_source import SubscriptionSource
+from .subscription_source_state import SubscriptionSourceState
 from .system_setting import SystemSetting
 from .word_bank import WordBank
 
@@ -47,10 +49,12 @@ __all__ = [
     'PixivisionArticle',
     'Plugin',
     'RelatedEntity',
+    'ScheduleJob',
     'SignIn',
     'Statistic',
     'Subscription',
     'SubscriptionSource',
+    'SubscriptionSourceState',
     'SystemSetting',
     'WordBank'
 ]
@@ -12,7 +12,7 @@ from typing import List, Optional
 from datetime import datetime
 from sqlalchemy import update, delete, desc
 from sqlalchemy.future import select
-from omega_miya.result import BoolResult
+from omega_miya.result import BoolResult, IntListResult
 from .base_model import (BaseDatabaseModel, BaseDatabase, Select, Update, Delete,
                          DatabaseModelResult, DatabaseModelListResult)
 from ..model import BiliDynamicOrm
@@ -119,6 +119,13 @@ class BiliDynamic(BaseDatabase):
             where(cls.orm_model.uid == uid).order_by(cls.orm_model.dynamic_id)
         return BiliDynamicModelListResult.parse_obj(await cls._query_all(stmt=stmt))
 
+    @classmethod
+    async def query_recent_dynamic_ids(cls, limit: int) -> IntListResult:
+        """查询最近的动态 id"""
+        stmt = select(cls.orm_model.dynamic_id).with_for_update(read=True).\
+            order_by(desc(cls.orm_model.dynamic_id)).limit(limit)
+        return IntListResult(error=False, info='Success', result=(await cls._query_custom_all(stmt=stmt)))
+
 
 __all__ = [
     'BiliDynamic'
@@ -285,6 +285,12 @@ class PixivArtwork(BaseDatabase):
             where(cls.orm_model.uid == uid).order_by(desc(cls.orm_model.pid))
         return IntListResult(error=False, info='Success', result=(await cls._query_custom_all(stmt=stmt)))
 
+    @classmethod
+    async def query_recent_pids(cls, limit: int) -> IntListResult:
+        """查询最新的作品 pid"""
+        stmt = select(cls.orm_model.pid).with_for_update(read=True).order_by(desc(cls.orm_model.pid)).limit(limit)
+        return IntListResult(error=False, info='Success', result=(await cls._query_custom_all(stmt=stmt)))
+
     @classmethod
     async def count_all(
             cls,
@@ -10,9 +10,9 @@
 
 from typing import List, Optional
 from datetime import datetime
-from sqlalchemy import update, delete
+from sqlalchemy import update, delete, desc
 from sqlalchemy.future import select
-from omega_miya.result import BoolResult
+from omega_miya.result import BoolResult, IntListResult
 from .base_model import (BaseDatabaseModel, BaseDatabase, Select, Update, Delete,
                          DatabaseModelResult, DatabaseModelListResult)
 from ..model import PixivisionArticleOrm
@@ -123,6 +123,12 @@ class PixivisionArticle(BaseDatabase):
     async def query_all(cls) -> PixivisionArticleModelListResult:
         return PixivisionArticleModelListResult.parse_obj(await cls._query_all())
 
+    @classmethod
+    async def query_all_aid(cls) -> IntListResult:
+        """查询全部特辑 aid"""
+        stmt = select(cls.orm_model.aid).with_for_update(read=True).order_by(desc(cls.orm_model.aid))
+        return IntListResult(error=False, info='Success', result=(await cls._query_custom_all(stmt=stmt)))
+
 
 __all__ = [
     'PixivisionArticle'
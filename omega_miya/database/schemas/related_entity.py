@@ -8,14 +8,16 @@
 @Software       : PyCharm 
 """
 
-from typing import Literal, List, Optional
+from typing import Literal, Iterable, List, Tuple, Optional
 from datetime import datetime
 from sqlalchemy import update, delete
 from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
 from omega_miya.result import BoolResult
 from .base_model import (BaseDatabaseModel, BaseDatabase, Select, Update, Delete,
                          DatabaseModelResult, DatabaseModelListResult)
-from ..model import BotSelfOrm, EntityOrm, RelatedEntityOrm, AuthSettingOrm, SubscriptionOrm
+from ..model import (BotSelfOrm, EntityOrm, RelatedEntityOrm, AuthSettingOrm,
+                     SubscriptionSourceOrm, SubscriptionOrm)
 
 
 RELATION_TYPE = Literal[
@@ -218,6 +220,32 @@ class RelatedEntity(BaseDatabase):
             stmt = stmt.where(cls.orm_model.relation_type == relation_type)
         return RelatedEntityModelListResult.parse_obj(await cls._query_all(stmt=stmt))
 
+    @classmethod
+    async def query_all_subscribed_related_entity_by_sources(
+            cls,
+            sub_type: str,
+            sub_ids: Iterable[str]
+    ) -> List[Tuple[str, RelatedEntityOrm, EntityOrm, EntityOrm, BotSelfOrm]]:
+        """一次性查询已订阅多个同类型订阅源的 RelatedEntity 及其对应 Entity, 父 Entity, BotSelf
+
+        :param sub_type: 订阅源类型
+        :param sub_ids: 订阅源 id
+        :return: List[Tuple[sub_id, RelatedEntityOrm, EntityOrm, ParentEntityOrm, BotSelfOrm]]
+        """
+        parent_entity_orm = aliased(EntityOrm)
+        stmt = select(SubscriptionSourceOrm.sub_id, cls.orm_model, EntityOrm, parent_entity_orm, BotSelfOrm).\
+            with_for_update(read=True).\
+            select_from(SubscriptionSourceOrm).\
+            join(SubscriptionOrm, onclause=SubscriptionOrm.sub_source_id == SubscriptionSourceOrm.id).\
+            join(cls.orm_model, onclause=SubscriptionOrm.entity_id == cls.orm_model.id).\
+            join(EntityOrm, onclause=cls.orm_model.entity_id == EntityOrm.id).\
+            join(parent_entity_orm, onclause=cls.orm_model.parent_entity_id == parent_entity_orm.id).\
+            join(BotSelfOrm, onclause=cls.orm_model.bot_id == BotSelfOrm.id).\
+            where(SubscriptionSourceOrm.sub_type == sub_type).\
+            where(SubscriptionSourceOrm.sub_id.in_(list(sub_ids))).\
+            order_by(SubscriptionSourceOrm.sub_id, cls.orm_model.entity_id)
+        return [tuple(x) for x in await cls._query_custom_all(stmt=stmt, scalar=False)]
+
 
 __all__ = [
     'RELATION_TYPE',
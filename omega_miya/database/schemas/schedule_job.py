@@ -0,0 +1,132 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/26 20:14
+@FileName       : schedule_job.py
+@Project        : nonebot2_miya
+@Description    : ScheduleJob model
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import update, delete
+from sqlalchemy.future import select
+from omega_miya.result import BoolResult
+from .base_model import (BaseDatabaseModel, BaseDatabase, Select, Update, Delete,
+                         DatabaseModelResult, DatabaseModelListResult)
+from ..model import ScheduleJobOrm
+
+
+class ScheduleJobUniqueModel(BaseDatabaseModel):
+    """数据库对象唯一性模型"""
+    job_id: str
+
+
+class ScheduleJobRequireModel(ScheduleJobUniqueModel):
+    """数据库对象变更请求必须数据模型"""
+    job_store: str
+    next_run_time: Optional[float]
+    job_state: bytes
+
+
+class ScheduleJobModel(ScheduleJobRequireModel):
+    """数据库对象完整模型"""
+    id: int
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class ScheduleJobModelResult(DatabaseModelResult):
+    """数据库查询结果基类"""
+    result: Optional["ScheduleJobModel"]
+
+
+class ScheduleJobModelListResult(DatabaseModelListResult):
+    """ScheduleJob 查询结果类"""
+    result: List["ScheduleJobModel"]
+
+
+class ScheduleJob(BaseDatabase):
+    orm_model = ScheduleJobOrm
+    unique_model = ScheduleJobUniqueModel
+    require_model = ScheduleJobRequireModel
+    data_model = ScheduleJobModel
+    self_model: ScheduleJobUniqueModel
+
+    def __init__(self, job_id: str):
+        self.self_model = ScheduleJobUniqueModel(job_id=job_id)
+
+    @classmethod
+    def _make_all_select(cls) -> Select:
+        stmt = select(cls.orm_model).with_for_update(read=True).order_by(cls.orm_model.next_run_time)
+        return stmt
+
+    def _make_unique_self_select(self) -> Select:
+        stmt = select(self.orm_model).with_for_update(read=True).\
+            where(self.orm_model.job_id == self.self_model.job_id).\
+            order_by(self.orm_model.job_id)
+        return stmt
+
+    def _make_unique_self_update(self, new_model: ScheduleJobRequireModel) -> Update:
+        stmt = update(self.orm_model).\
+            where(self.orm_model.job_id == self.self_model.job_id).\
+            values(**new_model.dict()).\
+            values(updated_at=datetime.now()).\
+            execution_options(synchronize_session="fetch")
+        return stmt
+
+    def _make_unique_self_delete(self) -> Delete:
+        stmt = delete(self.orm_model).\
+            where(self.orm_model.job_id == self.self_model.job_id).\
+            execution_options(synchronize_session="fetch")
+        return stmt
+
+    async def update_unique_self(self, job_store: str, next_run_time: Optional[float], job_state: bytes) -> BoolResult:
+        return await self._update_unique_self(new_model=self.require_model(
+            job_id=self.self_model.job_id,
+            job_store=job_store,
+            next_run_time=next_run_time,
+            job_state=job_state
+        ))
+
+    async def add_upgrade_unique_self(
+            self,
+            job_store: str,
+            next_run_time: Optional[float],
+            job_state: bytes
+    ) -> BoolResult:
+        return await self._add_upgrade_unique_self(new_model=self.require_model(
+            job_id=self.self_model.job_id,
+            job_store=job_store,
+            next_run_time=next_run_time,
+            job_state=job_state
+        ))
+
+    async def query(self) -> ScheduleJobModelResult:
+        return ScheduleJobModelResult.parse_obj(await self.query_unique_self())
+
+    @classmethod
+    async def query_all(cls) -> ScheduleJobModelListResult:
+        return ScheduleJobModelListResult.parse_obj(await cls._query_all())
+
+    @classmethod
+    async def query_all_by_job_store(cls, job_store: str) -> ScheduleJobModelListResult:
+        """查询 jobstore 中的全部任务, 按下次运行时间排序"""
+        stmt = select(cls.orm_model).with_for_update(read=True).\
+            where(cls.orm_model.job_store == job_store).\
+            order_by(cls.orm_model.next_run_time)
+        return ScheduleJobModelListResult.parse_obj(await cls._query_all(stmt=stmt))
+
+    @classmethod
+    async def delete_all_by_job_store(cls, job_store: str) -> BoolResult:
+        """删除 jobstore 中的全部任务"""
+        stmt = delete(cls.orm_model).\
+            where(cls.orm_model.job_store == job_store).\
+            execution_options(synchronize_session="fetch")
+        return await cls._execute(stmt=stmt)
+
+
+__all__ = [
+    'ScheduleJob'
+]
@@ -0,0 +1,118 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/28 21:40
+@FileName       : subscription_source_state.py
+@Project        : nonebot2_miya
+@Description    : SubscriptionSourceState model
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+from typing import List, Optional, Tuple
+from datetime import datetime
+from sqlalchemy import update, delete
+from sqlalchemy.future import select
+from omega_miya.result import BoolResult
+from .base_model import (BaseDatabaseModel, BaseDatabase, Select, Update, Delete,
+                         DatabaseModelResult, DatabaseModelListResult)
+from ..model import SubscriptionSourceOrm, SubscriptionSourceStateOrm
+
+
+class SubscriptionSourceStateUniqueModel(BaseDatabaseModel):
+    """数据库对象唯一性模型"""
+    sub_source_id: int
+
+
+class SubscriptionSourceStateRequireModel(SubscriptionSourceStateUniqueModel):
+    """数据库对象变更请求必须数据模型"""
+    state: str
+
+
+class SubscriptionSourceStateModel(SubscriptionSourceStateRequireModel):
+    """数据库对象完整模型"""
+    id: int
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class SubscriptionSourceStateModelResult(DatabaseModelResult):
+    """数据库查询结果基类"""
+    result: Optional["SubscriptionSourceStateModel"]
+
+
+class SubscriptionSourceStateModelListResult(DatabaseModelListResult):
+    """SubscriptionSourceState 查询结果类"""
+    result: List["SubscriptionSourceStateModel"]
+
+
+class SubscriptionSourceState(BaseDatabase):
+    orm_model = SubscriptionSourceStateOrm
+    unique_model = SubscriptionSourceStateUniqueModel
+    require_model = SubscriptionSourceStateRequireModel
+    data_model = SubscriptionSourceStateModel
+    self_model: SubscriptionSourceStateUniqueModel
+
+    def __init__(self, sub_source_id: int):
+        self.self_model = SubscriptionSourceStateUniqueModel(sub_source_id=sub_source_id)
+
+    @classmethod
+    def _make_all_select(cls) -> Select:
+        stmt = select(cls.orm_model).with_for_update(read=True).order_by(cls.orm_model.sub_source_id)
+        return stmt
+
+    def _make_unique_self_select(self) -> Select:
+        stmt = select(self.orm_model).with_for_update(read=True).\
+            where(self.orm_model.sub_source_id == self.self_model.sub_source_id).\
+            order_by(self.orm_model.sub_source_id)
+        return stmt
+
+    def _make_unique_self_update(self, new_model: SubscriptionSourceStateRequireModel) -> Update:
+        stmt = update(self.orm_model).\
+            where(self.orm_model.sub_source_id == self.self_model.sub_source_id).\
+            values(**new_model.dict()).\
+            values(updated_at=datetime.now()).\
+            execution_options(synchronize_session="fetch")
+        return stmt
+
+    def _make_unique_self_delete(self) -> Delete:
+        stmt = delete(self.orm_model).\
+            where(self.orm_model.sub_source_id == self.self_model.sub_source_id).\
+            execution_options(synchronize_session="fetch")
+        return stmt
+
+    async def update_unique_self(self, state: str) -> BoolResult:
+        return await self._update_unique_self(new_model=self.require_model(
+            sub_source_id=self.self_model.sub_source_id,
+            state=state
+        ))
+
+    async def add_upgrade_unique_self(self, state: str) -> BoolResult:
+        return await self._add_upgrade_unique_self(new_model=self.require_model(
+            sub_source_id=self.self_model.sub_source_id,
+            state=state
+        ))
+
+    async def query(self) -> SubscriptionSourceStateModelResult:
+        return SubscriptionSourceStateModelResult.parse_obj(await self.query_unique_self())
+
+    @classmethod
+    async def query_all(cls) -> SubscriptionSourceStateModelListResult:
+        return SubscriptionSourceStateModelListResult.parse_obj(await cls._query_all())
+
+    @classmethod
+    async def query_all_by_sub_type(cls, sub_type: str) -> List[Tuple[str, str]]:
+        """查询同一类型全部订阅源的状态
+
+        :return: List[Tuple[sub_id, state]]
+        """
+        stmt = select(SubscriptionSourceOrm.sub_id, cls.orm_model.state).with_for_update(read=True).\
+            join(SubscriptionSourceOrm, onclause=cls.orm_model.sub_source_id == SubscriptionSourceOrm.id).\
+            where(SubscriptionSourceOrm.sub_type == sub_type).\
+            order_by(SubscriptionSourceOrm.sub_id)
+        return [tuple(x) for x in await cls._query_custom_all(stmt=stmt, scalar=False)]
+
+
+__all__ = [
+    'SubscriptionSourceState',
+    'SubscriptionSourceStateModel'
+]
@@ -2,79 +2,180 @@
 @Author         : Ailitonia
 @Date           : 2022/05/02 23:50
 @FileName       : monitor.py
-@Project        : nonebot2_miya 
+@Project        : nonebot2_miya
 @Description    : Bilibili Dynamic monitor
 @GitHub         : https://github.com/Ailitonia
-@Software       : PyCharm 
+@Software       : PyCharm
 """
 
+import math
+import time
+import asyncio
+from dataclasses import dataclass
 from typing import Literal
 from nonebot.log import logger
 from omega_miya.web_resource.bilibili import BilibiliUser
 from omega_miya.web_resource.bilibili.exception import BilibiliApiError
-from omega_miya.utils.apscheduler import scheduler, reschedule_job
-from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
+from omega_miya.utils.apscheduler import scheduler
+from omega_miya.utils.process_utils import run_async_catching_exception
 
-from .utils import query_all_bili_user_dynamic_subscription_source, send_bili_user_new_dynamics
+from .utils import (query_all_bili_user_dynamic_subscription_source, query_bili_user_dynamic_subscriber_count,
+                    send_bili_user_new_dynamics)
 
 
 _MONITOR_JOB_ID: Literal['bili_user_dynamic_update_monitor'] = 'bili_user_dynamic_update_monitor'
 """动态检查的定时任务 ID"""
 _AVERAGE_CHECKING_PER_MINUTE: float = 7.5
 """期望平均每分钟检查动态的用户数(数值大小影响风控概率, 请谨慎调整)"""
-_CHECKING_DELAY_UNDER_RATE_LIMITING: int = 20
-"""被风控时的延迟间隔"""
+_CHECKING_TICK_INTERVAL: float = 60 / _AVERAGE_CHECKING_PER_MINUTE
+"""每次检查之间的间隔, 单位秒, 每次只检查一个用户, 使请求均匀分布"""
+_MIN_USER_CHECKING_INTERVAL: int = 120
+"""同一用户两次检查之间的最小间隔, 单位秒"""
+_SOURCE_REFRESH_INTERVAL: int = 300
+"""从数据库刷新订阅用户列表的间隔, 单位秒"""
+_SUBSCRIBER_COUNT_REFRESH_INTERVAL: int = 3600
+"""刷新各用户订阅者数量的间隔, 单位秒"""
+_ACTIVE_USER_DURATION: int = 3 * 24 * 3600
+"""最新动态在该时间内的用户视为活跃用户, 单位秒"""
+_ACTIVE_USER_WEIGHT: float = 3.0
+"""活跃用户的检查频率倍数"""
+_MAX_BACKOFF_FACTOR: float = 20 * 60 / _CHECKING_TICK_INTERVAL
+"""被风控时检查间隔的最大倍数, 即最多降低到每 20 分钟检查一次"""
+_BACKOFF_RECOVERY_RATE: float = 0.75
+"""检查成功后检查间隔倍数的恢复比例"""
+
+
+@dataclass
+class _UserCheckingState:
+    """用户动态检查状态"""
+    uid: int
+    pass_: float = 0  # 虚拟时间, 每次检查后增加 1/权重, 总是检查虚拟时间最小的用户
+    subscriber_count: int = 1
+    last_checked_at: float = 0
+    last_active_at: float = 0
+    failed_count: int = 0
+
+    @property
+    def weight(self) -> float:
+        """检查权重, 订阅者越多、最近越活跃的用户检查越频繁"""
+        weight = 1 + math.log2(1 + self.subscriber_count)
+        if time.time() - self.last_active_at < _ACTIVE_USER_DURATION:
+            weight *= _ACTIVE_USER_WEIGHT
+        return weight
+
+    @property
+    def stride(self) -> float:
+        return 1 / self.weight
+
+
+class BiliDynamicCheckingPacer(object):
+    """Bilibili 用户动态检查调度
+
+    按固定间隔每次只检查一个用户, 请求在时间上均匀分布, 各用户按权重分配检查次数(stride scheduling),
+    API 异常时整体按倍数放慢检查节奏并在成功后逐渐恢复, 单个用户的其他异常只推迟该用户的检查
+    """
+
+    def __init__(self) -> None:
+        self._states: dict[int, _UserCheckingState] = {}
+        self._source_refreshed_at: float = 0
+        self._subscriber_count_refreshed_at: float = 0
+        self._backoff_factor: float = 1.0
+        self._resume_at: float = 0
+        self._select_lock = asyncio.Lock()
+
+    async def _refresh_subscriber_count(self, states: list[_UserCheckingState]) -> None:
+        counts = await run_async_catching_exception(query_bili_user_dynamic_subscriber_count)(
+            uids=[x.uid for x in states])
+        if isinstance(counts, Exception):
+            return
+        for state in states:
+            state.subscriber_count = counts.get(state.uid, state.subscriber_count)
+
+    async def _refresh_sources(self) -> None:
+        """定期从数据库刷新订阅用户列表, 新增用户从当前最小虚拟时间开始参与调度"""
+        now = time.time()
+        if now - self._source_refreshed_at < _SOURCE_REFRESH_INTERVAL:
+            return
+        self._source_refreshed_at = now
+
+        subscribed_uid = set(await query_all_bili_user_dynamic_subscription_source())
+        for uid in [x for x in self._states.keys() if x not in subscribed_uid]:
+            self._states.pop(uid)
+
+        min_pass = min((x.pass_ for x in self._states.values()), default=0)
+        new_states = [_UserCheckingState(uid=uid, pass_=min_pass) for uid in subscribed_uid if uid not in self._states]
+        self._states.update({x.uid: x for x in new_states})
+
+        if now - self._subscriber_count_refreshed_at >= _SUBSCRIBER_COUNT_REFRESH_INTERVAL:
+            self._subscriber_count_refreshed_at = now
+            await self._refresh_subscriber_count(states=list(self._states.values()))
+        elif new_states:
+            await self._refresh_subscriber_count(states=new_states)
+
+    def _select_next(self) -> _UserCheckingState | None:
+        """选出虚拟时间最小且满足最小检查间隔的用户"""
+        now = time.time()
+        candidates = [x for x in self._states.values() if now - x.last_checked_at >= _MIN_USER_CHECKING_INTERVAL]
+        return min(candidates, key=lambda x: x.pass_, default=None)
+
+    def _update_backoff(self, *, rate_limited: bool) -> None:
+        if rate_limited:
+            self._backoff_factor = min(self._backoff_factor * 2, _MAX_BACKOFF_FACTOR)
+        else:
+            self._backoff_factor = max(self._backoff_factor * _BACKOFF_RECOVERY_RATE, 1.0)
+        self._resume_at = time.time() + _CHECKING_TICK_INTERVAL * (self._backoff_factor - 1)
+
+    async def tick(self) -> None:
+        """检查一个用户的动态更新"""
+        if self._select_lock.locked() or time.time() < self._resume_at:
+            return
+
+        async with self._select_lock:
+            await self._refresh_sources()
+            state = self._select_next()
+            if state is None:
+                return
+            state.last_checked_at = time.time()
+            state.pass_ += state.stride
+
+        try:
+            latest_timestamp = await send_bili_user_new_dynamics(BilibiliUser(uid=state.uid))
+        except BilibiliApiError as e:
+            # 如果 API 异常则大概率被风控, 放慢整体检查节奏
+            self._update_backoff(rate_limited=True)
+            logger.warning(f'BilibiliUserDynamicSubscriptionMonitor | Fetch bilibili user({state.uid}) dynamic data '
+                           f'failed, maybe under the rate limiting, slow down checking to '
+                           f'{_CHECKING_TICK_INTERVAL * self._backoff_factor:.1f} second(s) per user, {e}')
+        except Exception as e:
+            # 其他异常仅推迟该用户的下一次检查
+            state.failed_count += 1
+            state.pass_ += state.stride * 2 ** min(state.failed_count, 6)
+            logger.error(f'BilibiliUserDynamicSubscriptionMonitor | Checking bilibili user({state.uid}) '
+                         f'dynamic failed, {e}')
+        else:
+            state.failed_count = 0
+            if latest_timestamp is not None:
+                state.last_active_at = max(state.last_active_at, latest_timestamp)
+            self._update_backoff(rate_limited=False)
+
+
+bili_dynamic_checking_pacer = BiliDynamicCheckingPacer()
 
 
 @run_async_catching_exception
 async def bili_user_dynamic_update_monitor() -> None:
     """Bilibili 用户动态订阅 作品更新监控"""
-    logger.debug('BilibiliUserDynamicSubscriptionMonitor | Started checking bilibili user dynamics update')
-
-    # 获取所有已添加的 Bilibili 用户动态订阅源
-    subscribed_uid = await query_all_bili_user_dynamic_subscription_source()
-    if not subscribed_uid:
-        logger.debug('BilibiliUserDynamicSubscriptionMonitor | No bilibili user dynamic subscription, ignore')
-        return
-
-    # 避免风控, 根据订阅的用户数动态调整检查时间间隔
-    monitor_job = scheduler.get_job(job_id=_MONITOR_JOB_ID)
-    if monitor_job is not None:
-        interval_min = int(len(subscribed_uid) // _AVERAGE_CHECKING_PER_MINUTE)
-        interval_min = interval_min if interval_min > 2 else 2
-        reschedule_job(job=monitor_job, trigger_mode='interval', minutes=interval_min)
-
-    # 检查新作品并发送消息
-    tasks = [send_bili_user_new_dynamics(BilibiliUser(uid=uid)) for uid in subscribed_uid]
-    sent_result = await semaphore_gather(tasks=tasks, semaphore_num=5, return_exceptions=True, filter_exception=False)
-    if any(e for e in sent_result if isinstance(e, BilibiliApiError)):
-        # 如果 API 异常则大概率被风控, 推迟下一次检查
-        if monitor_job is not None:
-            reschedule_job(job=monitor_job, trigger_mode='interval', minutes=_CHECKING_DELAY_UNDER_RATE_LIMITING)
-        logger.warning('BilibiliUserDynamicSubscriptionMonitor | Fetch bilibili dynamic data failed, '
-                       f'maybe under the rate limiting, '
-                       f'delay the next checking until after {_CHECKING_DELAY_UNDER_RATE_LIMITING} minutes')
-
-    logger.debug('BilibiliUserDynamicSubscriptionMonitor | Bilibili user dynamic update checking completed')
+    await bili_dynamic_checking_pacer.tick()
 
 
 scheduler.add_job(
     bili_user_dynamic_update_monitor,
-    'cron',
-    # year=None,
-    # month=None,
-    # day='*/1',
-    # week=None,
-    # day_of_week=None,
-    # hour=None,
-    minute='*/1',
-    # second='*/50',
-    # start_date=None,
-    # end_date=None,
-    # timezone=None,
+    'interval',
+    seconds=_CHECKING_TICK_INTERVAL,
     id=_MONITOR_JOB_ID,
     coalesce=True,
-    misfire_grace_time=120
+    max_instances=3,
+    misfire_grace_time=30
 )
 
 
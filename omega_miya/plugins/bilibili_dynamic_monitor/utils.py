@@ -9,30 +9,48 @@
 """
 
 from typing import Literal, Iterable
+from nonebot import get_driver
 from nonebot.log import logger
-from nonebot.exception import ActionFailed
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment, Message
 
 from omega_miya.database import InternalSubscriptionSource, BiliDynamic, EventEntityHelper
-from omega_miya.database import InternalBotUser, InternalBotGroup, InternalGuildChannel
 from omega_miya.database.internal.entity import BaseInternalEntity
 from omega_miya.result import BoolResult
 from omega_miya.web_resource.bilibili import BilibiliUser, BilibiliDynamic
 from omega_miya.web_resource.bilibili.model import BilibiliDynamicCard
-from omega_miya.utils.process_utils import run_async_catching_exception, run_async_delay, semaphore_gather
-from omega_miya.utils.message_tools import MessageSender
+from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
+from omega_miya.utils.message_delivery import media_staging, message_delivery_queue
+from omega_miya.utils.seen_filter import SeenIdFilter
 
 
 _DYNAMIC_SUB_TYPE: Literal['bili_dynamic'] = 'bili_dynamic'
 """Bilibili 动态订阅 SubscriptionSource 的 sub_type"""
+_SEEN_DYNAMIC_FILTER_SIZE: int = 20000
+"""内存中记录的已收录动态数量"""
+
+
+async def _load_recent_dynamic_ids() -> list[int]:
+    return (await BiliDynamic.query_recent_dynamic_ids(limit=_SEEN_DYNAMIC_FILTER_SIZE)).result
+
+
+_seen_dynamic_filter: SeenIdFilter[int] = SeenIdFilter(
+    name='BiliDynamic', warm_up_loader=_load_recent_dynamic_ids, max_size=_SEEN_DYNAMIC_FILTER_SIZE)
+"""已收录动态过滤器, 检查新动态时只对其中没有的动态查询数据库"""
+
+
+@get_driver().on_startup
+async def _warm_up_seen_dynamic_filter() -> None:
+    await _seen_dynamic_filter.warm_up()
 
 
 async def add_dynamic_into_database(dynamic: BilibiliDynamicCard) -> BoolResult:
     """在数据库中添加动态信息(仅新增不更新)"""
     result = await BiliDynamic(dynamic_id=dynamic.desc.dynamic_id).add_only(
         dynamic_type=dynamic.desc.type, uid=dynamic.desc.uid, content=dynamic.card.output_std_model().content)
+    if not result.error:
+        _seen_dynamic_filter.add(dynamic.desc.dynamic_id)
     return result
 
 
@@ -105,38 +123,35 @@ async def query_all_bili_user_dynamic_subscription_source() -> list[int]:
     return result
 
 
-async def _query_subscribed_entity_by_bili_user(bili_user: BilibiliUser) -> list[BaseInternalEntity]:
-    """根据 Bilibili 用户查询已经订阅了这个用户的内部 Entity 对象"""
-    sub_source = InternalSubscriptionSource(sub_type=_DYNAMIC_SUB_TYPE, sub_id=str(bili_user.uid))
-    subscribed_related_entity = await sub_source.query_all_subscribed_related_entity()
+async def query_bili_user_dynamic_subscriber_count(uids: Iterable[int]) -> dict[int, int]:
+    """批量获取订阅了 Bilibili 用户动态的群组及用户数量, 所有用户只执行一次联合查询
+
+    :return: Dict[uid, 订阅者数量]
+    """
+    subscribed_entity = await BaseInternalEntity.query_all_by_subscribed_sources(
+        sub_type=_DYNAMIC_SUB_TYPE, sub_ids=[str(x) for x in uids])
+    return {int(sub_id): len(entities) for sub_id, entities in subscribed_entity.items()}
 
-    init_tasks = []
-    for related_entity in subscribed_related_entity:
-        match related_entity.relation_type:
-            case 'bot_group':
-                init_tasks.append(InternalBotGroup.init_from_index_id(id_=related_entity.id))
-            case 'bot_user':
-                init_tasks.append(InternalBotUser.init_from_index_id(id_=related_entity.id))
-            case 'guild_channel':
-                init_tasks.append(InternalGuildChannel.init_from_index_id(id_=related_entity.id))
 
-    entity_result = await semaphore_gather(tasks=init_tasks, semaphore_num=50, return_exceptions=False)
-    return list(entity_result)
+async def _query_subscribed_entity_by_bili_user(bili_user: BilibiliUser) -> list[BaseInternalEntity]:
+    """根据 Bilibili 用户查询已经订阅了这个用户的内部 Entity 对象"""
+    sub_id = str(bili_user.uid)
+    subscribed_entity = await BaseInternalEntity.query_all_by_subscribed_sources(
+        sub_type=_DYNAMIC_SUB_TYPE, sub_ids=[sub_id])
+    return subscribed_entity[sub_id]
 
 
 async def _check_new_dynamic(dynamics: Iterable[BilibiliDynamicCard]) -> list[BilibiliDynamicCard]:
     """检查的新动态(数据库中没有的)"""
 
-    async def _dynamic_exists(dynamic: BilibiliDynamicCard) -> (BilibiliDynamicCard, bool):
+    async def _dynamic_exists(dynamic_id: int) -> bool:
         """判断该动态是否在数据库中已存在"""
-        exist = await BiliDynamic(dynamic_id=dynamic.desc.dynamic_id).exist()
-        return dynamic, exist
+        return await BiliDynamic(dynamic_id=dynamic_id).exist()
 
-    check_tasks = [_dynamic_exists(dynamic=dynamic) for dynamic in dynamics]
-    check_result = await semaphore_gather(tasks=check_tasks, semaphore_num=50, return_exceptions=False)
-
-    new_dynamic = [x[0] for x in check_result if not x[1]]
-    return new_dynamic
+    dynamics = {x.desc.dynamic_id: x for x in dynamics}
+    new_dynamic_ids = await _seen_dynamic_filter.filter_unseen(
+        ids=dynamics.keys(), exist_checker=_dynamic_exists, semaphore_num=50)
+    return [dynamics[x] for x in new_dynamic_ids]
 
 
 async def _get_dynamic_message(dynamic: BilibiliDynamicCard) -> str | Message:
@@ -145,7 +160,8 @@ async def _get_dynamic_message(dynamic: BilibiliDynamicCard) -> str | Message:
 
     # 下载动态中包含的图片
     if dynamic.output_img_urls:
-        img_download_tasks = [BilibiliDynamic.download_file(url=url) for url in dynamic.output_img_urls]
+        img_download_tasks = [media_staging.stage_url(url=url, loader=BilibiliDynamic.get_file_content)
+                              for url in dynamic.output_img_urls]
         img_download_result = await semaphore_gather(tasks=img_download_tasks, semaphore_num=9)
         send_message += Message(MessageSegment.image(file=x.file_uri) for x in img_download_result)
         send_message += '\n'
@@ -154,34 +170,23 @@ async def _get_dynamic_message(dynamic: BilibiliDynamicCard) -> str | Message:
     return send_message
 
 
-async def _msg_sender(entity: BaseInternalEntity, message: str | Message) -> int:
-    """向 entity 发送消息"""
-    try:
-        msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
-        sent_msg_id = await msg_sender.send_internal_entity_msg(entity=entity, message=message)
-    except KeyError:
-        logger.debug(f'BilibiliUserDynamicSubscriptionMonitor | Bot({entity.bot_id}) not online, '
-                     f'message to {entity.relation.relation_type.upper()}({entity.entity_id}) has be canceled')
-        sent_msg_id = 0
-    except ActionFailed as e:
-        logger.warning(f'BilibiliUserDynamicSubscriptionMonitor | Bot({entity.bot_id}) failed to send message to '
-                       f'{entity.relation.relation_type.upper()}({entity.entity_id}) with ActionFailed, {e}')
-        sent_msg_id = 0
-    return sent_msg_id
-
-
-@run_async_delay(delay_time=5)
-async def send_bili_user_new_dynamics(bili_user: BilibiliUser) -> None:
-    """向已订阅的用户或群发送 Bilibili 用户动态更新"""
+async def send_bili_user_new_dynamics(bili_user: BilibiliUser) -> int | None:
+    """向已订阅的用户或群发送 Bilibili 用户动态更新
+
+    :return: 用户最新一条动态的发布时间戳, 没有动态时返回 None
+    """
     logger.debug(f'BilibiliUserDynamicSubscriptionMonitor | Start checking bilibili user({bili_user.uid}) new dynamics')
     dynamic_data = await bili_user.query_dynamics()
-    new_dynamics = await _check_new_dynamic(dynamics=dynamic_data.all_cards)
+    all_cards = list(dynamic_data.all_cards)
+    latest_timestamp = max((x.desc.timestamp for x in all_cards), default=None)
+
+    new_dynamics = await _check_new_dynamic(dynamics=all_cards)
     if new_dynamics:
         logger.info(f'BilibiliUserDynamicSubscriptionMonitor | Confirmed Bilibili user({bili_user.uid}) '
                     f'new dynamic: {", ".join(str(x.desc.dynamic_id) for x in new_dynamics)}')
     else:
         logger.debug(f'BilibiliUserDynamicSubscriptionMonitor | Bilibili user({bili_user.uid}) has not new dynamics')
-        return
+        return latest_timestamp
 
     subscribed_entity = await _query_subscribed_entity_by_bili_user(bili_user=bili_user)
     # 获取动态消息内容
@@ -192,10 +197,10 @@ async def send_bili_user_new_dynamics(bili_user: BilibiliUser) -> None:
     add_artwork_tasks = [add_dynamic_into_database(dynamic=dynamic) for dynamic in new_dynamics]
     await semaphore_gather(tasks=add_artwork_tasks, semaphore_num=10, return_exceptions=False)
 
-    # 向订阅者发送新动态信息
-    send_tasks = [_msg_sender(entity=entity, message=send_message)
-                  for entity in subscribed_entity for send_message in send_messages]
-    await semaphore_gather(tasks=send_tasks, semaphore_num=2, return_exceptions=True)
+    # 向订阅者投递新动态信息
+    await message_delivery_queue.broadcast(entities=subscribed_entity, messages=send_messages,
+                                           coalesce_key=f'bili_dynamic_{bili_user.uid}')
+    return latest_timestamp
 
 
 __all__ = [
@@ -203,5 +208,6 @@ __all__ = [
     'delete_bili_user_dynamic_sub',
     'query_subscribed_bili_user_dynamic_sub_source',
     'query_all_bili_user_dynamic_subscription_source',
+    'query_bili_user_dynamic_subscriber_count',
     'send_bili_user_new_dynamics'
 ]
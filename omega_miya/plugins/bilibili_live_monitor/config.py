@@ -8,8 +8,10 @@
 @Software       : PyCharm 
 """
 
+from dataclasses import dataclass
 from nonebot import get_driver, logger
 from pydantic import BaseModel, ValidationError
+from omega_miya.local_resource import TmpResource
 
 
 class BilibiliLiveMonitorPluginConfig(BaseModel):
@@ -17,12 +19,23 @@ class BilibiliLiveMonitorPluginConfig(BaseModel):
 
     # 发送消息通知时尝试@全体
     bilibili_live_monitor_enable_group_at_all_notice: bool = False
+    # 批量查询直播间状态时单次请求的用户数量
+    bilibili_live_monitor_query_chunk_size: int = 50
+    # 批量查询直播间状态时的请求并发数
+    bilibili_live_monitor_query_concurrency: int = 2
 
     class Config:
         extra = "ignore"
 
 
+@dataclass
+class BilibiliLiveMonitorPluginResourceConfig:
+    # 直播间状态持久化文件, 重启后恢复直播间状态
+    default_live_status_file: TmpResource = TmpResource('bilibili_live_monitor', 'live_status.json')
+
+
 try:
+    bilibili_live_monitor_plugin_resource_config = BilibiliLiveMonitorPluginResourceConfig()
     bilibili_live_monitor_plugin_config = BilibiliLiveMonitorPluginConfig.parse_obj(get_driver().config)
 except ValidationError as e:
     import sys
@@ -31,5 +44,6 @@ except ValidationError as e:
 
 
 __all__ = [
-    'bilibili_live_monitor_plugin_config'
+    'bilibili_live_monitor_plugin_config',
+    'bilibili_live_monitor_plugin_resource_config'
 ]
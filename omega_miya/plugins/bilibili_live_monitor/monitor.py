@@ -9,7 +9,7 @@
 """
 
 from nonebot.log import logger
-from omega_miya.utils.apscheduler import scheduler
+from omega_miya.utils.apscheduler import scheduler, add_monitored_job
 from omega_miya.utils.process_utils import run_async_catching_exception
 
 from .utils import send_bili_live_room_update
@@ -26,7 +26,7 @@ async def bili_live_room_update_monitor() -> None:
     logger.debug('BilibiliLiveRoomSubscriptionMonitor | Bilibili user live room update checking completed')
 
 
-scheduler.add_job(
+add_monitored_job(
     bili_live_room_update_monitor,
     'cron',
     # year=None,
@@ -41,7 +41,7 @@ scheduler.add_job(
     # end_date=None,
     # timezone=None,
     id='bili_live_room_update_monitor',
-    coalesce=True,
+    jitter=5,
     misfire_grace_time=20
 )
 
@@ -8,24 +8,26 @@
 @Software       : PyCharm 
 """
 
+import ujson as json
 from typing import Literal
 from datetime import datetime
 from nonebot import get_driver, logger
-from nonebot.exception import ActionFailed
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment, Message
 
-from omega_miya.database import (InternalBotUser, InternalBotGroup, InternalGuildChannel,
-                                 InternalSubscriptionSource, EventEntityHelper)
+from omega_miya.database import InternalSubscriptionSource, EventEntityHelper
 from omega_miya.database.internal.entity import BaseInternalEntity
 from omega_miya.result import BoolResult
+from omega_miya.local_resource import TmpResource
 from omega_miya.web_resource.bilibili import BilibiliLiveRoom
 from omega_miya.web_resource.bilibili.model.live_room import BilibiliLiveRoomDataModel
 from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
 from omega_miya.utils.message_tools import MessageSender
+from omega_miya.utils.message_delivery import media_staging, message_delivery_queue
 
 from .config import bilibili_live_monitor_plugin_config as plugin_config
+from .config import bilibili_live_monitor_plugin_resource_config as plugin_resource_config
 from .model import (BilibiliLiveRoomStatus, BilibiliLiveRoomTitleChange, BilibiliLiveRoomStartLiving,
                     BilibiliLiveRoomStartLivingWithUpdateTitle, BilibiliLiveRoomStopLiving,
                     BilibiliLiveRoomStopLivingWithPlaylist, BilibiliLiveRoomStatusUpdate)
@@ -35,6 +37,10 @@ _LIVE_SUB_TYPE: Literal['bili_live'] = 'bili_live'
 """Bilibili 直播间订阅 SubscriptionSource 的 sub_type"""
 _LIVE_STATUS: dict[int, BilibiliLiveRoomStatus] = {}
 """Bilibili 直播间状态缓存, {用户UID: 直播间状态}"""
+_LIVE_STATUS_FILE: TmpResource = plugin_resource_config.default_live_status_file
+"""Bilibili 直播间状态持久化文件"""
+_LIVE_STATUS_CHANGED: bool = False
+"""直播间状态缓存是否有尚未写入文件的变化"""
 
 
 def upgrade_live_room_status(
@@ -46,7 +52,7 @@ def upgrade_live_room_status(
 
     :return: 更新后的直播间状态(如有)
     """
-    global _LIVE_STATUS
+    global _LIVE_STATUS, _LIVE_STATUS_CHANGED
     exist_status = _LIVE_STATUS.get(live_room_data.uid, None)
     if exist_status is None and live_user_name is None:
         raise ValueError(f'upgrade new live room status must provide "live_user_name" parameter')
@@ -60,6 +66,9 @@ def upgrade_live_room_status(
         'live_user_name': live_user_name
     })
     _LIVE_STATUS.update({live_room_data.uid: new_status})
+    if exist_status is None or exist_status.dict() != new_status.dict():
+        _LIVE_STATUS_CHANGED = True
+
     if isinstance(exist_status, BilibiliLiveRoomStatus):
         update = new_status - exist_status
     else:
@@ -80,16 +89,63 @@ async def _query_and_upgrade_live_room_status(live_room: BilibiliLiveRoom) -> Bo
     return BoolResult(error=False, info='Success', result=True)
 
 
+async def _load_live_status() -> dict[int, BilibiliLiveRoomStatus]:
+    """从文件中读取上次保存的直播间状态"""
+    if not _LIVE_STATUS_FILE.is_file:
+        return {}
+    async with _LIVE_STATUS_FILE.async_open('r', encoding='utf8') as af:
+        data = json.loads(await af.read())
+    return {int(uid): BilibiliLiveRoomStatus.parse_obj(status) for uid, status in data.items()}
+
+
+async def save_live_status(*, force: bool = False) -> None:
+    """将直播间状态缓存写入文件, 仅在状态有变化时写入"""
+    global _LIVE_STATUS_CHANGED
+    if not _LIVE_STATUS_CHANGED and not force:
+        return
+
+    _LIVE_STATUS_CHANGED = False
+    data = json.dumps({uid: status.dict() for uid, status in _LIVE_STATUS.items()}, ensure_ascii=False)
+    tmp_file = TmpResource(_LIVE_STATUS_FILE.resolve_path + '.tmp')
+    try:
+        async with tmp_file.async_open('w', encoding='utf8') as af:
+            await af.write(data)
+        tmp_file.path.replace(_LIVE_STATUS_FILE.path)
+    except Exception as e:
+        _LIVE_STATUS_CHANGED = True
+        logger.warning(f'BilibiliLiveRoomMonitor | Saving live room status failed, {e}')
+
+
 @get_driver().on_startup
 @run_async_catching_exception
 async def _init_all_subscription_source_live_room_status() -> None:
-    """启动时初始化所有订阅源中直播间的状态"""
+    """启动时初始化所有订阅源中直播间的状态
+
+    优先恢复上次保存的直播间状态, 使重启期间发生的开播/下播在下一次检查时正常通知, 仅对没有记录的直播间单独查询
+    """
     logger.opt(colors=True).info(f'<lc>BilibiliLiveRoomMonitor</lc> | Initializing live room status')
     source_result = await InternalSubscriptionSource.query_all_by_sub_type(sub_type=_LIVE_SUB_TYPE)
-    init_tasks = [_query_and_upgrade_live_room_status(live_room=BilibiliLiveRoom(room_id=int(sub.sub_id)))
-                  for sub in source_result]
+    subscribed_room_ids = {int(sub.sub_id) for sub in source_result}
+
+    saved_status = await run_async_catching_exception(_load_live_status)()
+    if isinstance(saved_status, Exception):
+        logger.warning(f'BilibiliLiveRoomMonitor | Loading saved live room status failed, {saved_status}')
+        saved_status = {}
+    _LIVE_STATUS.update({uid: status for uid, status in saved_status.items()
+                         if status.live_room_id in subscribed_room_ids})
+
+    restored_room_ids = {x.live_room_id for x in _LIVE_STATUS.values()}
+    init_tasks = [_query_and_upgrade_live_room_status(live_room=BilibiliLiveRoom(room_id=room_id))
+                  for room_id in subscribed_room_ids if room_id not in restored_room_ids]
     await semaphore_gather(tasks=init_tasks, semaphore_num=10, return_exceptions=False)
-    logger.opt(colors=True).success(f'<lc>BilibiliLiveRoomMonitor</lc> | Live room status initializing completed')
+    await save_live_status(force=True)
+    logger.opt(colors=True).success(f'<lc>BilibiliLiveRoomMonitor</lc> | Live room status initializing completed, '
+                                    f'{len(restored_room_ids)} restored, {len(init_tasks)} queried')
+
+
+@get_driver().on_shutdown
+async def _save_live_room_status() -> None:
+    await save_live_status()
 
 
 async def _add_bili_live_room_sub_source(live_room: BilibiliLiveRoom) -> BoolResult:
@@ -141,23 +197,9 @@ async def query_subscribed_bili_live_room_sub_source(bot: Bot, event: MessageEve
     return sub_id_result
 
 
-async def _query_subscribed_entity_by_live_room(room_id: str) -> list[BaseInternalEntity]:
-    """根据 Bilibili 直播间房间号查询已经订阅了这个用户的内部 Entity 对象"""
-    sub_source = InternalSubscriptionSource(sub_type=_LIVE_SUB_TYPE, sub_id=room_id)
-    subscribed_related_entity = await sub_source.query_all_subscribed_related_entity()
-
-    init_tasks = []
-    for related_entity in subscribed_related_entity:
-        match related_entity.relation_type:
-            case 'bot_group':
-                init_tasks.append(InternalBotGroup.init_from_index_id(id_=related_entity.id))
-            case 'bot_user':
-                init_tasks.append(InternalBotUser.init_from_index_id(id_=related_entity.id))
-            case 'guild_channel':
-                init_tasks.append(InternalGuildChannel.init_from_index_id(id_=related_entity.id))
-
-    entity_result = await semaphore_gather(tasks=init_tasks, semaphore_num=50, return_exceptions=False)
-    return list(entity_result)
+async def _query_subscribed_entity_by_live_rooms(room_ids: list[str]) -> dict[str, list[BaseInternalEntity]]:
+    """根据 Bilibili 直播间房间号批量查询已经订阅了这些直播间的内部 Entity 对象"""
+    return await BaseInternalEntity.query_all_by_subscribed_sources(sub_type=_LIVE_SUB_TYPE, sub_ids=room_ids)
 
 
 async def _get_live_room_update_message(
@@ -192,7 +234,8 @@ async def _get_live_room_update_message(
 
     # 下载直播间封面图
     if live_room_data.cover:
-        cover_img = await run_async_catching_exception(BilibiliLiveRoom.download_file)(url=live_room_data.cover)
+        cover_img = await run_async_catching_exception(media_staging.stage_url)(
+            url=live_room_data.cover, loader=BilibiliLiveRoom.get_file_content)
         if not isinstance(cover_img, Exception):
             send_message += '\n'
             send_message += MessageSegment.image(file=cover_img.file_uri)
@@ -203,13 +246,12 @@ async def _get_live_room_update_message(
     return send_message
 
 
-async def _msg_sender(entity: BaseInternalEntity, message: str | Message) -> int:
-    """向 entity 发送消息"""
-    try:
-        msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
-
-        # 通知群组时检查能不能@全体成员
-        if plugin_config.bilibili_live_monitor_enable_group_at_all_notice and entity.relation_type == 'bot_group':
+async def _enqueue_message(entity: BaseInternalEntity, message: str | Message) -> None:
+    """向 entity 投递消息"""
+    # 通知群组时检查能不能@全体成员
+    if plugin_config.bilibili_live_monitor_enable_group_at_all_notice and entity.relation_type == 'bot_group':
+        try:
+            msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
             at_all_remain = await run_async_catching_exception(msg_sender.bot.get_group_at_all_remain)(
                 group_id=entity.entity_id)
             if (not isinstance(at_all_remain, Exception)
@@ -217,37 +259,42 @@ async def _msg_sender(entity: BaseInternalEntity, message: str | Message) -> int
                     and at_all_remain.remain_at_all_count_for_group
                     and at_all_remain.remain_at_all_count_for_uin):
                 message = MessageSegment.at(user_id='all') + message
+        except KeyError:
+            logger.debug(f'BilibiliLiveRoomMonitor | Bot({entity.bot_id}) not online, skip checking at all remain')
 
-        sent_msg_id = await msg_sender.send_internal_entity_msg(entity=entity, message=message)
-    except KeyError:
-        logger.debug(f'BilibiliLiveRoomMonitor | Bot({entity.bot_id}) not online, '
-                     f'message to {entity.relation.relation_type.upper()}({entity.entity_id}) has be canceled')
-        sent_msg_id = 0
-    except ActionFailed as e:
-        logger.warning(f'BilibiliLiveRoomMonitor | Bot({entity.bot_id}) failed to send message to '
-                       f'{entity.relation.relation_type.upper()}({entity.entity_id}) with ActionFailed, {e}')
-        sent_msg_id = 0
-    return sent_msg_id
+    message_delivery_queue.enqueue(entity=entity, message=message)
 
 
-async def _process_bili_live_room_update(live_room_data: BilibiliLiveRoomDataModel) -> None:
+async def _process_bili_live_room_update(
+        live_room_data: BilibiliLiveRoomDataModel,
+        update_data: BilibiliLiveRoomStatusUpdate,
+        subscribed_entity: list[BaseInternalEntity]
+) -> None:
     """处理 Bilibili 直播间状态更新"""
-    logger.debug(f'BilibiliLiveRoomMonitor | Checking bilibili live room({live_room_data.room_id}) status')
-    update_data = upgrade_live_room_status(live_room_data=live_room_data)
-    if update_data is None or not update_data.is_update:
-        logger.debug(f'BilibiliLiveRoomMonitor | Bilibili live room({live_room_data.room_id}) holding')
-        return
-    else:
-        logger.info(f'BilibiliLiveRoomMonitor | Bilibili live room({live_room_data.room_id}) '
-                    f'status update, {update_data.update}')
-
     send_msg = await _get_live_room_update_message(live_room_data=live_room_data, update_data=update_data)
-    subscribed_entity = await _query_subscribed_entity_by_live_room(room_id=str(live_room_data.room_id))
 
-    # 向订阅者发送直播间更新信息
-    send_tasks = [_msg_sender(entity=entity, message=send_msg)
-                  for entity in subscribed_entity if send_msg is not None]
-    await semaphore_gather(tasks=send_tasks, semaphore_num=2, return_exceptions=True)
+    # 向订阅者投递直播间更新信息
+    if send_msg is not None:
+        for entity in subscribed_entity:
+            await _enqueue_message(entity=entity, message=send_msg)
+
+
+async def _query_live_room_status(uid_list: list[int]) -> dict[int, BilibiliLiveRoomDataModel]:
+    """分批查询用户直播间状态, 单批失败时只跳过该批用户"""
+    chunk_size = plugin_config.bilibili_live_monitor_query_chunk_size
+    chunks = [uid_list[i:i + chunk_size] for i in range(0, len(uid_list), chunk_size)]
+    tasks = [BilibiliLiveRoom.query_live_room_by_uid_list(uid_list=chunk) for chunk in chunks]
+    chunk_results = await semaphore_gather(
+        tasks=tasks, semaphore_num=plugin_config.bilibili_live_monitor_query_concurrency, return_exceptions=True)
+
+    room_status_data = {}
+    for chunk, result in zip(chunks, chunk_results):
+        if isinstance(result, BaseException) or result.error:
+            logger.error(f'BilibiliLiveRoomMonitor | Error occurred in checking live room status of '
+                         f'uid {chunk[0]}~{chunk[-1]}, {result}')
+            continue
+        room_status_data.update(result.data)
+    return room_status_data
 
 
 async def send_bili_live_room_update() -> None:
@@ -256,14 +303,33 @@ async def send_bili_live_room_update() -> None:
     if not uid_list:
         return
 
-    room_status_data = await BilibiliLiveRoom.query_live_room_by_uid_list(uid_list=uid_list)
-    if room_status_data.error:
-        logger.error(f'BilibiliLiveRoomMonitor | Error occurred in checking live room status, {room_status_data}')
+    room_status_data = await _query_live_room_status(uid_list=uid_list)
+    if not room_status_data:
         return
 
-    # 处理直播间状态更新并向订阅者发送直播间更新信息
-    send_tasks = [_process_bili_live_room_update(live_room_data=data) for uid, data in room_status_data.data.items()]
-    await semaphore_gather(tasks=send_tasks, semaphore_num=3, return_exceptions=True)
+    # 检查直播间状态更新
+    updated_rooms = []
+    for live_room_data in room_status_data.values():
+        logger.debug(f'BilibiliLiveRoomMonitor | Checking bilibili live room({live_room_data.room_id}) status')
+        update_data = upgrade_live_room_status(live_room_data=live_room_data)
+        if update_data is None or not update_data.is_update:
+            logger.debug(f'BilibiliLiveRoomMonitor | Bilibili live room({live_room_data.room_id}) holding')
+            continue
+        logger.info(f'BilibiliLiveRoomMonitor | Bilibili live room({live_room_data.room_id}) '
+                    f'status update, {update_data.update}')
+        updated_rooms.append((live_room_data, update_data))
+
+    # 一次性查询所有更新直播间的订阅者, 并向订阅者发送直播间更新信息
+    if updated_rooms:
+        subscribed_entity = await _query_subscribed_entity_by_live_rooms(
+            room_ids=[str(x.room_id) for x, _ in updated_rooms])
+        send_tasks = [
+            _process_bili_live_room_update(live_room_data=live_room_data, update_data=update_data,
+                                           subscribed_entity=subscribed_entity[str(live_room_data.room_id)])
+            for live_room_data, update_data in updated_rooms
+        ]
+        await semaphore_gather(tasks=send_tasks, semaphore_num=3, return_exceptions=True)
+    await save_live_status()
 
 
 __all__ = [
@@ -22,16 +22,22 @@ from omega_miya.service import init_processor_state
 from omega_miya.service.gocqhttp_guild_patch.permission import GUILD
 from omega_miya.utils.process_utils import run_async_catching_exception
 from omega_miya.utils.message_tools import MessageSender, MessageTools
+from omega_miya.web_resource import HttpFetcher
 from omega_miya.web_resource.image_searcher import ComplexImageSearcher, TraceMoe
 from omega_miya.onebot_api import GoCqhttpBot
 
+from .config import image_searcher_plugin_config
+from .local_index import local_image_index
+from .monitor import scheduler
+
 
 __plugin_meta__ = PluginMetadata(
     name="识图搜番",
     description="【识图搜番插件】\n"
-                "使用 SauceNAO/iqdb/ascii2d/trace.moe 识别各类图片、插画、番剧",
+                "使用本地图库及 SauceNAO/iqdb/ascii2d/trace.moe 识别各类图片、插画、番剧",
     usage="/识图 [图片]\n"
           "/搜番 [图片]",
+    config=image_searcher_plugin_config.__class__,
     extra={"author": "Ailitonia"},
 )
 
@@ -89,11 +95,28 @@ async def handle_parser(bot: Bot, event: MessageEvent, state: T_State,
             state.update({'anime_mode': False})
 
 
+async def _search_local_image_index(url: str) -> list[Message]:
+    """下载待识别的图片并在本地图库中检索"""
+    image_content = (await HttpFetcher().get_bytes(url=url)).result
+    return await local_image_index.searching_result(image=image_content)
+
+
 @image_searcher.got('image', prompt='请发送你想要识别的图片:', parameterless=[Depends(parse_image('image'))])
 async def handle_sticker(bot: Bot, matcher: Matcher, event: MessageEvent, state: T_State, image: str = ArgStr('image')):
     anime_mode: bool = state.get('anime_mode', False)
     url = image.strip()
 
+    # 优先在本地图库中检索, 命中时不再请求远程识图引擎
+    if not anime_mode and image_searcher_plugin_config.image_searcher_plugin_enable_local_index:
+        local_result = await run_async_catching_exception(_search_local_image_index)(url=url)
+        if isinstance(local_result, Exception):
+            logger.warning(f'ImageSearcher | 本地图库识图失败, {local_result}')
+        elif local_result:
+            await MessageSender(bot=bot).send_node_custom_and_recall(
+                event=event, recall_time=90, message_list=local_result
+            )
+            await matcher.finish()
+
     await matcher.send('获取识别结果中, 请稍候~')
     if anime_mode:
         searching_result = await run_async_catching_exception(TraceMoe(image_url=url).searching_result)()
@@ -0,0 +1,51 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/22 21:15
+@FileName       : config.py
+@Project        : nonebot2_miya
+@Description    : Image Searcher Plugin Config
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+from dataclasses import dataclass
+from nonebot import get_driver, logger
+from pydantic import BaseModel, ValidationError
+from omega_miya.local_resource import TmpResource
+
+
+class ImageSearcherPluginConfig(BaseModel):
+    """ImageSearcher 插件配置"""
+    # 启用本地图库识图, 使用已缓存的 Pixiv 作品图片建立感知哈希索引, 命中时不再请求远程识图引擎
+    # 首次建立索引需要对全部已缓存的图片计算哈希, 图片较多时会持续占用较多 CPU, 请按需开启
+    image_searcher_plugin_enable_local_index: bool = False
+    # 本地图库识图允许的最大汉明距离(64 位哈希), 越小越严格
+    image_searcher_plugin_local_index_max_distance: int = 6
+    # 本地图库识图单次返回的结果数量上限
+    image_searcher_plugin_local_index_result_limit: int = 3
+    # 本地图库索引增量更新间隔, 单位分钟
+    image_searcher_plugin_local_index_update_interval: int = 30
+
+    class Config:
+        extra = "ignore"
+
+
+@dataclass
+class ImageSearcherPluginResourceConfig:
+    # 本地图库感知哈希索引文件
+    default_local_index_file: TmpResource = TmpResource('image_searcher', 'local_index.msgpack')
+
+
+try:
+    image_searcher_plugin_resource_config = ImageSearcherPluginResourceConfig()
+    image_searcher_plugin_config = ImageSearcherPluginConfig.parse_obj(get_driver().config)
+except ValidationError as e:
+    import sys
+    logger.opt(colors=True).critical(f'<r>ImageSearcher 插件配置格式验证失败</r>, 错误信息:\n{e}')
+    sys.exit(f'ImageSearcher 插件配置格式验证失败, {e}')
+
+
+__all__ = [
+    'image_searcher_plugin_config',
+    'image_searcher_plugin_resource_config'
+]
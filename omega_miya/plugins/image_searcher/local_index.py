@@ -0,0 +1,218 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/22 21:20
+@FileName       : local_index.py
+@Project        : nonebot2_miya
+@Description    : 本地图库感知哈希索引, 对已缓存的 Pixiv 作品图片进行识图
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import re
+import asyncio
+import msgpack
+from dataclasses import dataclass
+
+from nonebot.log import logger
+from nonebot.adapters.onebot.v11.message import Message, MessageSegment
+
+from omega_miya.database import InternalPixiv
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.image_utils import BKTree, image_hash, image_hash_files
+from omega_miya.utils.process_utils import run_sync, run_sync_in_process, run_async_catching_exception
+from omega_miya.web_resource.pixiv.config import pixiv_resource_config
+
+from .config import image_searcher_plugin_config, image_searcher_plugin_resource_config
+
+
+_PAGE_FILE_PATTERN: re.Pattern = re.compile(r'^(\d+)_(original|regular|small|thumb_mini)_p(\d+)$')
+"""Pixiv 作品图片缓存文件名, {pid}_{url_type}_p{page}"""
+
+_HASH_CHUNK_SIZE: int = 256
+"""单次提交到进程池计算哈希的文件数"""
+
+_DUMP_INTERVAL_CHUNKS: int = 16
+"""首次建立索引等新增文件较多时, 每完成多少批计算写入一次索引文件, 避免中断后全部重新计算"""
+
+_INVALID_HASH: int = -1
+"""无法读取的文件, 记录在索引中避免重复计算"""
+
+_REBUILD_DEAD_RATIO: float = 0.25
+"""BK 树中已失效的哈希值超过该比例时重建"""
+
+
+@dataclass
+class LocalSearchingResult:
+    """本地图库识图结果"""
+    pid: int
+    page: int
+    file_name: str
+    distance: int
+
+    @property
+    def similarity(self) -> float:
+        return (1 - self.distance / 64) * 100
+
+    @property
+    def url_type(self) -> str:
+        return _PAGE_FILE_PATTERN.match(self.file_name).group(2)
+
+    async def get_output_message(self) -> Message:
+        """将识别结果转换为消息, 作品在数据库中时附带标题及作者"""
+        source = f'Pixiv 本地图库 - PID: {self.pid}, P{self.page}'
+        artwork = await run_async_catching_exception(InternalPixiv(pid=self.pid).get_artwork_model)()
+        if not isinstance(artwork, Exception):
+            source = f'Pixiv 本地图库 - 「{artwork.title}」/「{artwork.uname}」'
+
+        message = f'识图引擎: local\n来源: {source}\n相似度: {self.similarity:.2f}%\n' \
+                  f'来源地址:\nhttps://www.pixiv.net/artworks/{self.pid}'
+        if self.url_type != 'original':
+            image_file = pixiv_resource_config.default_artwork_folder(self.file_name)
+            message = message + '\n' + MessageSegment.image(image_file.file_uri)
+        return Message(message)
+
+
+class LocalImageIndex(object):
+    """本地图库感知哈希索引
+
+    - 增量扫描 Pixiv 作品图片缓存文件夹, 仅对新增的文件计算 pHash, 结果持久化到索引文件
+    - 哈希值保存在 BK 树中, 按汉明距离检索, 已删除文件的哈希值在失效比例过高时重建
+    """
+    _source_folder: TmpResource = pixiv_resource_config.default_artwork_folder
+    _index_file: TmpResource = image_searcher_plugin_resource_config.default_local_index_file
+
+    def __init__(self) -> None:
+        self._entries: dict[str, int] | None = None  # 文件名 -> 哈希值
+        self._hash_files: dict[int, set[str]] = {}  # 哈希值 -> 文件名
+        self._tree: BKTree = BKTree()
+        self._update_lock = asyncio.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._hash_files)
+
+    def _load_index(self) -> dict[str, int]:
+        if not self._index_file.is_file:
+            return {}
+        try:
+            with self._index_file.open('rb') as f:
+                return msgpack.unpackb(f.read(), raw=False)
+        except Exception as e:
+            logger.warning(f'LocalImageIndex | Loading index file failed, index will be rebuilt, {e}')
+            return {}
+
+    def _dump_index(self, entries: dict[str, int]) -> None:
+        tmp_file = self._index_file.path.with_suffix('.tmp')
+        tmp_file.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_file.open('wb') as f:
+            f.write(msgpack.packb(entries, use_bin_type=True))
+        tmp_file.replace(self._index_file.path)
+
+    def _scan_source_folder(self) -> set[str]:
+        if not self._source_folder.is_dir:
+            return set()
+        with os.scandir(self._source_folder.path) as it:
+            return {x.name for x in it if x.is_file() and _PAGE_FILE_PATTERN.match(x.name)}
+
+    def _add_entry(self, file_name: str, hash_: int) -> None:
+        self._entries[file_name] = hash_
+        if hash_ == _INVALID_HASH:
+            return
+        if hash_ not in self._hash_files:
+            self._hash_files[hash_] = set()
+            self._tree.add(hash_)
+        self._hash_files[hash_].add(file_name)
+
+    def _remove_entry(self, file_name: str) -> None:
+        hash_ = self._entries.pop(file_name, _INVALID_HASH)
+        files = self._hash_files.get(hash_)
+        if files is None:
+            return
+        files.discard(file_name)
+        if not files:
+            self._hash_files.pop(hash_)
+
+    def _rebuild_tree(self) -> None:
+        tree = BKTree()
+        for hash_ in self._hash_files.keys():
+            tree.add(hash_)
+        self._tree = tree
+
+    async def _ensure_loaded(self) -> None:
+        if self._entries is None:
+            entries = await run_sync(self._load_index)()
+            self._entries = {}
+            for file_name, hash_ in entries.items():
+                self._add_entry(file_name=file_name, hash_=hash_)
+
+    async def update(self) -> int:
+        """增量更新索引, 添加新缓存的图片并移除已被清理的图片
+
+        :return: 新增的文件数量
+        """
+        async with self._update_lock:
+            await self._ensure_loaded()
+            on_disk = await run_sync(self._scan_source_folder)()
+
+            removed_files = [x for x in self._entries.keys() if x not in on_disk]
+            for file_name in removed_files:
+                self._remove_entry(file_name=file_name)
+            if len(self._tree) - self.size > len(self._tree) * _REBUILD_DEAD_RATIO:
+                await run_sync(self._rebuild_tree)()
+
+            new_files = sorted(x for x in on_disk if x not in self._entries)
+            for chunk_index, i in enumerate(range(0, len(new_files), _HASH_CHUNK_SIZE), start=1):
+                chunk = new_files[i:i + _HASH_CHUNK_SIZE]
+                hashes = await run_sync_in_process(image_hash_files)(
+                    [str(self._source_folder(x).path) for x in chunk], invalid_hash=_INVALID_HASH)
+                for file_name, hash_ in zip(chunk, hashes):
+                    self._add_entry(file_name=file_name, hash_=hash_)
+                if chunk_index % _DUMP_INTERVAL_CHUNKS == 0:
+                    await run_sync(self._dump_index)(entries=self._entries.copy())
+
+            if removed_files or new_files:
+                await run_sync(self._dump_index)(entries=self._entries.copy())
+
+        logger.debug(f'LocalImageIndex | Index updated, {len(new_files)} added, {len(removed_files)} removed, '
+                     f'{self.size} hash(es) in total')
+        return len(new_files)
+
+    async def search(self, image: bytes, *, max_distance: int, limit: int) -> list[LocalSearchingResult]:
+        """在本地图库中检索相似图片, 同一作品页面只返回距离最近的一个文件
+
+        :param image: 待识别的图片内容
+        :param max_distance: 允许的最大汉明距离
+        :param limit: 结果数量上限
+        """
+        await self._ensure_loaded()
+        if not self._hash_files:
+            return []
+
+        query_hash = await run_sync(image_hash)(image)
+        results: dict[tuple[int, int], LocalSearchingResult] = {}
+        for hash_, distance in self._tree.search(hash_=query_hash, max_distance=max_distance):
+            for file_name in self._hash_files.get(hash_, ()):
+                pid, _, page = _PAGE_FILE_PATTERN.match(file_name).groups()
+                key = (int(pid), int(page))
+                if key not in results or distance < results[key].distance:
+                    results[key] = LocalSearchingResult(pid=int(pid), page=int(page),
+                                                        file_name=file_name, distance=distance)
+        return sorted(results.values(), key=lambda x: x.distance)[:limit]
+
+    async def searching_result(self, image: bytes) -> list[Message]:
+        """在本地图库中检索相似图片并转换为消息"""
+        searching_result = await self.search(
+            image=image,
+            max_distance=image_searcher_plugin_config.image_searcher_plugin_local_index_max_distance,
+            limit=image_searcher_plugin_config.image_searcher_plugin_local_index_result_limit
+        )
+        return [await x.get_output_message() for x in searching_result]
+
+
+local_image_index = LocalImageIndex()
+
+
+__all__ = [
+    'local_image_index'
+]
@@ -0,0 +1,44 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/22 21:48
+@FileName       : monitor.py
+@Project        : nonebot2_miya
+@Description    : 本地图库索引定时更新
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import asyncio
+from nonebot import get_driver
+from omega_miya.utils.process_utils import run_async_catching_exception
+from omega_miya.utils.apscheduler import scheduler, add_monitored_job
+
+from .config import image_searcher_plugin_config
+from .local_index import local_image_index
+
+
+@run_async_catching_exception
+async def local_image_index_update_monitor() -> None:
+    """增量更新本地图库索引"""
+    await local_image_index.update()
+
+
+if image_searcher_plugin_config.image_searcher_plugin_enable_local_index:
+    @get_driver().on_startup
+    async def _init_local_image_index() -> None:
+        """启动时在后台更新本地图库索引"""
+        asyncio.create_task(local_image_index_update_monitor())
+
+    add_monitored_job(
+        local_image_index_update_monitor,
+        'interval',
+        minutes=image_searcher_plugin_config.image_searcher_plugin_local_index_update_interval,
+        id='image_searcher_local_index_update',
+        jitter=60,
+        misfire_grace_time=120
+    )
+
+
+__all__ = [
+    'scheduler'
+]
@@ -8,7 +8,6 @@
 @Software       : PyCharm
 """
 
-import asyncio
 import re
 from copy import deepcopy
 from nonebot.log import logger
@@ -22,19 +21,20 @@ from nonebot.permission import SUPERUSER
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.permission import GROUP, PRIVATE_FRIEND
-from nonebot.adapters.onebot.v11.message import Message
+from nonebot.adapters.onebot.v11.message import Message, MessageSegment
 from nonebot.params import CommandArg, ArgStr, ShellCommandArgs
 
 from omega_miya.service import init_processor_state
 from omega_miya.service.gocqhttp_guild_patch.permission import GUILD, GUILD_SUPERUSER
+from omega_miya.service.omega_api import register_get_route, BaseApiModel, BaseApiReturn
 from omega_miya.database import InternalPixiv
-from omega_miya.web_resource.pixiv import PixivArtwork
 from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
 from omega_miya.utils.message_tools import MessageSender
 
-from .config import moe_plugin_config
-from .utils import (has_allow_r18_node, prepare_send_image, get_database_import_pids, add_artwork_into_database,
-                    get_query_argument_parser, parse_from_query_parser)
+from .config import moe_plugin_config, moe_plugin_resource_config
+from .image_pool import moe_image_pool
+from .importer import moe_database_importer
+from .utils import has_allow_r18_node, prepare_send_image, get_query_argument_parser, parse_from_query_parser
 
 
 __plugin_meta__ = PluginMetadata(
@@ -50,7 +50,7 @@ __plugin_meta__ = PluginMetadata(
           "仅限管理员使用:\n"
           "/图库统计\n"
           "/图库查询 [关键词, ...]\n"
-          "/导入图库",
+          "/导入图库 [setu/moe/进度/继续/重试]",
     config=moe_plugin_config.__class__,
     extra={"author": "Ailitonia"},
 )
@@ -106,22 +106,30 @@ async def handle_parse_success(bot: Bot, event: MessageEvent, matcher: Matcher,
     num_limit = moe_plugin_config.moe_plugin_query_image_limit
     num = args.num if args.num <= num_limit else num_limit
 
-    artworks = await InternalPixiv.query_by_condition(
-        keywords=keywords,
-        num=num,
-        nsfw_tag=nsfw_tag,
-        classified=args.classified,
-        acc_mode=args.acc_mode,
-        order_mode=args.order
-    )
-    if not artworks:
-        await matcher.finish('找不到涩图QAQ')
-
-    await matcher.send('稍等, 正在下载图片~')
+    # 无关键词的随机查询优先从预处理图片池中获取
+    pool_images = []
+    if moe_image_pool.enabled and not keywords and args.order == 'random':
+        pool_images = await moe_image_pool.take(nsfw_tag=nsfw_tag, classified=args.classified, num=num)
+    send_messages = [MessageSegment.image(file=x.file_uri) for x in pool_images]
+
+    if len(send_messages) < num:
+        artworks = await InternalPixiv.query_by_condition(
+            keywords=keywords,
+            num=num - len(send_messages),
+            nsfw_tag=nsfw_tag,
+            classified=args.classified,
+            acc_mode=args.acc_mode,
+            order_mode=args.order
+        )
+        if not artworks and not send_messages:
+            await matcher.finish('找不到涩图QAQ')
+
+        if artworks:
+            await matcher.send('稍等, 正在下载图片~')
+            image_message_tasks = [prepare_send_image(pid=x.pid) for x in artworks]
+            message_result = await semaphore_gather(tasks=image_message_tasks, semaphore_num=5, filter_exception=True)
+            send_messages.extend(message_result)
 
-    image_message_tasks = [prepare_send_image(pid=x.pid) for x in artworks]
-    message_result = await semaphore_gather(tasks=image_message_tasks, semaphore_num=5, filter_exception=True)
-    send_messages = list(message_result)
     if not send_messages:
         await matcher.finish('所有图片都获取失败了QAQ, 可能是网络原因或作品被删除, 请稍后再试')
     await MessageSender(bot=bot).send_msgs_and_recall(event=event, message_list=send_messages,
@@ -165,22 +173,30 @@ async def handle_parse_success(bot: Bot, event: MessageEvent, matcher: Matcher,
     num_limit = moe_plugin_config.moe_plugin_query_image_limit
     num = args.num if args.num <= num_limit else num_limit
 
-    artworks = await InternalPixiv.query_by_condition(
-        keywords=keywords,
-        num=num,
-        nsfw_tag=0,
-        classified=args.classified,
-        acc_mode=args.acc_mode,
-        order_mode=args.order
-    )
-    if not artworks:
-        await matcher.finish('找不到萌图QAQ')
+    # 无关键词的随机查询优先从预处理图片池中获取
+    pool_images = []
+    if moe_image_pool.enabled and not keywords and args.order == 'random':
+        pool_images = await moe_image_pool.take(nsfw_tag=0, classified=args.classified, num=num)
+    send_messages = [MessageSegment.image(file=x.file_uri) for x in pool_images]
+
+    if len(send_messages) < num:
+        artworks = await InternalPixiv.query_by_condition(
+            keywords=keywords,
+            num=num - len(send_messages),
+            nsfw_tag=0,
+            classified=args.classified,
+            acc_mode=args.acc_mode,
+            order_mode=args.order
+        )
+        if not artworks and not send_messages:
+            await matcher.finish('找不到萌图QAQ')
+
+        if artworks:
+            await matcher.send('稍等, 正在下载图片~')
+            image_message_tasks = [prepare_send_image(pid=x.pid) for x in artworks]
+            message_result = await semaphore_gather(tasks=image_message_tasks, semaphore_num=5, filter_exception=True)
+            send_messages.extend(message_result)
 
-    await matcher.send('稍等, 正在下载图片~')
-
-    image_message_tasks = [prepare_send_image(pid=x.pid) for x in artworks]
-    message_result = await semaphore_gather(tasks=image_message_tasks, semaphore_num=5, filter_exception=True)
-    send_messages = list(message_result)
     if not send_messages:
         await matcher.finish('所有图片都获取失败了QAQ, 可能是网络原因或作品被删除, 请稍后再试')
     await MessageSender(bot=bot).send_msgs_and_recall(event=event, message_list=send_messages,
@@ -254,7 +270,7 @@ async def handle_parse_import(state: T_State, cmd_arg: Message = CommandArg()):
         state.update({'pids': []})
 
 
-@database_import.got('mode', prompt='请输入导入模式:\n【setu/moe】')
+@database_import.got('mode', prompt='请输入导入模式:\n【setu/moe/进度/继续/重试】')
 async def handle_database_import(state: T_State, matcher: Matcher, mode: str = ArgStr('mode')):
     mode = mode.strip()
     match mode:
@@ -262,38 +278,75 @@ async def handle_database_import(state: T_State, matcher: Matcher, mode: str = A
             nsfw_tag = 0
         case 'setu':
             nsfw_tag = 1
+        case '进度' | 'status':
+            await matcher.finish(moe_database_importer.progress.get_text())
+            return
+        case '继续' | 'resume':
+            if moe_database_importer.is_running:
+                await matcher.finish('已有正在进行的导入任务, 请使用【/导入图库 进度】查看')
+            if not await moe_database_importer.resume():
+                await matcher.finish('没有可以继续的导入任务')
+            await matcher.finish('已从检查点继续导入任务, 可使用【/导入图库 进度】查看进度')
+            return
+        case '重试' | 'retry':
+            if moe_database_importer.is_running:
+                await matcher.finish('已有正在进行的导入任务, 请使用【/导入图库 进度】查看')
+            retry_count = await moe_database_importer.retry_failed()
+            if retry_count == 0:
+                await matcher.finish('上次导入任务中没有失败的作品')
+            await matcher.finish(f'开始重新导入失败的作品, 总计: {retry_count}, 可使用【/导入图库 进度】查看进度')
+            return
         case _:
-            await matcher.reject('不支持的导入模式参数, 请在【setu/moe】中选择并重新输入:')
+            await matcher.reject('不支持的导入模式参数, 请在【setu/moe/进度/继续/重试】中选择并重新输入:')
             return
 
+    if moe_database_importer.is_running:
+        await matcher.finish('已有正在进行的导入任务, 请使用【/导入图库 进度】查看')
+
     pids: list[int] = [int(x) for x in state.get('pids', [])]
     if not pids:
         await matcher.send('尝试从文件中读取导入文件列表')
-        pids = await get_database_import_pids()
-    if not pids:
-        await matcher.finish('导入列表不存在, 详情请查看日志')
-    pids = sorted(list(set(pids)), reverse=True)
-    all_count = len(pids)
-    await matcher.send(f'已获取导入列表, 总计: {all_count}, 开始获取作品信息~')
-
-    # 应对 pixiv 流控, 对获取作品信息进行分段处理
-    handle_pids = []
-    fail_count = 0
-    while pids:
-        while len(handle_pids) < 20:
-            try:
-                handle_pids.append(pids.pop())
-            except IndexError:
-                break
-
-        tasks = [add_artwork_into_database(PixivArtwork(pid), nsfw_tag=nsfw_tag, add_only=False) for pid in handle_pids]
-        handle_pids.clear()
-        import_result = await semaphore_gather(tasks=tasks, semaphore_num=20)
-        fail_count += len([x for x in import_result if isinstance(x, Exception)])
-
-        if pids:
-            logger.info(f'MoeDatabaseImport | 导入操作中, 剩余: {len(pids)}, 预计时间: {int(len(pids) * 1.52)} 秒')
-            await asyncio.sleep(int((len(pids) if len(pids) < 20 else 20) * 1.5))
-
-    logger.success(f'MoeDatabaseImport | 导入操作已完成, 成功: {all_count - fail_count}, 总计: {all_count}')
-    await matcher.finish(f'导入操作已完成, 成功: {all_count - fail_count}, 总计: {all_count}')
+    try:
+        await moe_database_importer.start(nsfw_tag=nsfw_tag, pids=pids, add_only=False)
+    except Exception as e:
+        logger.error(f'MoeDatabaseImport | 创建导入任务失败, {e}, 请确认导入文件'
+                     f'{moe_plugin_resource_config.default_database_import_file.resolve_path}存在')
+        await matcher.finish('创建导入任务失败, 详情请查看日志')
+    await matcher.finish('已开始导入, 可使用【/导入图库 进度】查看进度, 中断后可使用【/导入图库 继续】从检查点继续')
+
+
+@register_get_route(path='/moe/import-progress', enabled=moe_plugin_config.moe_plugin_enable_import_progress_api)
+async def _handle_import_progress() -> BaseApiReturn:
+    """api 查询图库导入进度"""
+    class _ReturnBody(BaseApiModel):
+        running: bool
+        total: int
+        skipped: int
+        succeeded: int
+        failed: int
+        remaining: int
+        rate: float
+        eta_seconds: int | None
+        started_at: str | None
+        finished_at: str | None
+
+    class _Return(BaseApiReturn):
+        body: _ReturnBody
+
+    progress = moe_database_importer.progress
+    return _Return(
+        error=False,
+        body=_ReturnBody(
+            running=progress.running,
+            total=progress.total,
+            skipped=progress.skipped,
+            succeeded=progress.succeeded,
+            failed=progress.failed,
+            remaining=progress.remaining,
+            rate=round(progress.rate, 2),
+            eta_seconds=None if progress.eta is None else int(progress.eta.total_seconds()),
+            started_at=None if progress.started_at is None else progress.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            finished_at=None if progress.finished_at is None else progress.finished_at.strftime('%Y-%m-%d %H:%M:%S')
+        ),
+        message='Success'
+    )
@@ -29,6 +29,20 @@ class MoePluginConfig(BaseModel):
     moe_plugin_moe_auto_recall_time: int = 90
     # 涩图默认自动撤回消息时间(设置 0 为不撤回)
     moe_plugin_setu_auto_recall_time: int = 30
+    # 预处理图片池中每个分类保持的图片数量, 无关键词的随机查询优先从图片池中获取已处理好的图片(设置 0 为禁用)
+    moe_plugin_image_pool_size: int = 0
+    # 预处理图片池占用磁盘空间上限, 单位 MB
+    moe_plugin_image_pool_disk_budget: int = 512
+    # 预处理图片池定时补充间隔, 单位分钟
+    moe_plugin_image_pool_refill_interval: int = 10
+    # 导入图库时获取作品信息的并发数
+    moe_plugin_import_fetch_concurrency: int = 5
+    # 导入图库时获取作品信息的速率限制, 每秒请求数
+    moe_plugin_import_rate_limit: float = 1.0
+    # 导入图库时获取作品信息失败的重试次数
+    moe_plugin_import_retry_limit: int = 3
+    # 是否启用查询图库导入进度的 api
+    moe_plugin_enable_import_progress_api: bool = False
 
     class Config:
         extra = "ignore"
@@ -38,6 +52,10 @@ class MoePluginConfig(BaseModel):
 class MoePluginResourceConfig:
     # 默认导入图库时读取的 pids 文件路径
     default_database_import_file: TmpResource = TmpResource('moe_import_pid.txt')
+    # 导入图库任务及进度检查点文件夹
+    default_import_checkpoint_folder: TmpResource = TmpResource('moe', 'import')
+    # 预处理图片池文件夹
+    default_image_pool_folder: TmpResource = TmpResource('moe', 'image_pool')
 
 
 try:
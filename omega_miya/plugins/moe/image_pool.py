@@ -0,0 +1,213 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/18 16:22
+@FileName       : image_pool.py
+@Project        : nonebot2_miya
+@Description    : Moe 预处理图片池, 后台预先下载并处理图片, 随机查询时直接取用
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import time
+import shutil
+import asyncio
+from collections import deque
+from nonebot import get_driver
+from nonebot.log import logger
+
+from omega_miya.database import InternalPixiv
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.process_utils import run_async_catching_exception, run_sync, semaphore_gather
+from omega_miya.utils.apscheduler import add_monitored_job
+
+from .config import moe_plugin_config, moe_plugin_resource_config
+from .utils import process_artwork_image
+
+
+_CONSUMED_FOLDER_NAME: str = 'consumed'
+"""已取出图片的暂存文件夹"""
+
+_CONSUMED_KEEP_TIME: int = 1800
+"""已取出的图片文件保留时间, 单位秒, 保证图片发送完成前不会被删除"""
+
+
+class MoeImagePool(object):
+    """Moe 预处理图片池
+
+    按 nsfw_tag 及 classified 分桶保存已经完成噪点及水印处理的图片, 无关键词的随机查询直接从池中取出,
+    取出后在后台补充, 并由定时任务在磁盘空间上限内补足各桶, 池中的图片在重启后仍然可用
+    """
+    _pool_folder: TmpResource = moe_plugin_resource_config.default_image_pool_folder
+    _consumed_folder: TmpResource = _pool_folder(_CONSUMED_FOLDER_NAME)
+    _pool_size: int = moe_plugin_config.moe_plugin_image_pool_size
+    _disk_budget: int = moe_plugin_config.moe_plugin_image_pool_disk_budget * 1024 * 1024
+    _default_buckets: tuple[tuple[int, int], ...] = ((0, 1), (1, 1))  # 默认补充的分桶, (nsfw_tag, classified)
+
+    def __init__(self):
+        self._buckets: dict[str, deque[int]] | None = None
+        self._refill_locks: dict[str, asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._pool_size > 0
+
+    @staticmethod
+    def get_bucket_name(nsfw_tag: int, classified: int) -> str:
+        return f'{nsfw_tag}_{classified}'
+
+    @staticmethod
+    def parse_bucket_name(bucket: str) -> tuple[int, int]:
+        nsfw_tag, classified = bucket.split('_', maxsplit=1)
+        return int(nsfw_tag), int(classified)
+
+    def _get_pool_file(self, bucket: str, pid: int) -> TmpResource:
+        return self._pool_folder(bucket, f'{pid}.jpg')
+
+    def _scan_pool_folder(self) -> dict[str, deque[int]]:
+        """扫描图片池文件夹, 恢复已处理好的图片"""
+        buckets = {self.get_bucket_name(*x): deque() for x in self._default_buckets}
+        if not self._pool_folder.is_dir:
+            return buckets
+
+        with os.scandir(self._pool_folder.path) as it:
+            bucket_folders = [x for x in it if x.is_dir() and x.name != _CONSUMED_FOLDER_NAME]
+        for bucket_folder in bucket_folders:
+            try:
+                self.parse_bucket_name(bucket_folder.name)
+            except ValueError:
+                continue
+            with os.scandir(bucket_folder.path) as it:
+                pids = [x.name.removesuffix('.jpg') for x in it if x.is_file() and x.name.endswith('.jpg')]
+            buckets[bucket_folder.name] = deque(int(x) for x in pids if x.isdigit())
+        return buckets
+
+    def _get_disk_usage(self) -> int:
+        if not self._pool_folder.is_dir:
+            return 0
+        return sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(self._pool_folder.path)
+            for file in files
+        )
+
+    def _clear_consumed(self) -> int:
+        """清理已取出并超过保留时间的图片文件"""
+        if not self._consumed_folder.is_dir:
+            return 0
+
+        count = 0
+        now = time.time()
+        for file in self._consumed_folder.path.iterdir():
+            if now - file.stat().st_mtime > _CONSUMED_KEEP_TIME:
+                file.unlink(missing_ok=True)
+                count += 1
+        return count
+
+    async def _get_buckets(self) -> dict[str, deque[int]]:
+        if self._buckets is None:
+            self._buckets = await run_sync(self._scan_pool_folder)()
+        return self._buckets
+
+    async def _add_image(self, bucket: str, pid: int) -> int:
+        """处理作品图片并放入图片池"""
+        artwork_image = await process_artwork_image(pid=pid)
+        pool_file = self._get_pool_file(bucket=bucket, pid=pid)
+        pool_file.path.parent.mkdir(parents=True, exist_ok=True)
+        # 处理结果文件由图片处理缓存管理, 这里只复制一份
+        await run_sync(shutil.copyfile)(artwork_image.path, pool_file.path)
+        (await self._get_buckets())[bucket].append(pid)
+        return pid
+
+    async def take(self, nsfw_tag: int, classified: int, num: int) -> list[TmpResource]:
+        """从图片池中取出已处理好的图片, 池中数量不足时仅返回已有的图片, 取出后在后台补充
+
+        :param nsfw_tag: nsfw 标签值
+        :param classified: 已标记标签项
+        :param num: 需要的图片数量
+        """
+        buckets = await self._get_buckets()
+        bucket = self.get_bucket_name(nsfw_tag=nsfw_tag, classified=classified)
+        pids = buckets.setdefault(bucket, deque())
+
+        taken_images = []
+        while pids and len(taken_images) < num:
+            pid = pids.popleft()
+            pool_file = self._get_pool_file(bucket=bucket, pid=pid)
+            consumed_file = self._consumed_folder(f'{bucket}_{pid}.jpg')
+            try:
+                consumed_file.path.parent.mkdir(parents=True, exist_ok=True)
+                pool_file.path.replace(consumed_file.path)
+                consumed_file.path.touch()
+            except OSError as e:
+                logger.warning(f'MoeImagePool | Taking image {pid} from bucket({bucket}) failed, {e}')
+                continue
+            taken_images.append(consumed_file)
+
+        asyncio.create_task(run_async_catching_exception(self.refill)(bucket=bucket))
+        return taken_images
+
+    async def refill(self, bucket: str) -> int:
+        """补充图片池中指定的分桶
+
+        :return: 新增的图片数量
+        """
+        buckets = await self._get_buckets()
+        lock = self._refill_locks.setdefault(bucket, asyncio.Lock())
+        if lock.locked():
+            return 0
+
+        async with lock:
+            pids = buckets.setdefault(bucket, deque())
+            missing_num = self._pool_size - len(pids)
+            if missing_num <= 0:
+                return 0
+
+            if await run_sync(self._get_disk_usage)() >= self._disk_budget:
+                logger.warning(f'MoeImagePool | Disk budget exceeded, skip refilling bucket({bucket})')
+                return 0
+
+            nsfw_tag, classified = self.parse_bucket_name(bucket=bucket)
+            artworks = await InternalPixiv.query_by_condition(
+                keywords=None, num=missing_num, nsfw_tag=nsfw_tag, classified=classified, order_mode='random')
+            tasks = [self._add_image(bucket=bucket, pid=x.pid) for x in artworks if x.pid not in pids]
+            added_pids = await semaphore_gather(tasks=tasks, semaphore_num=3, filter_exception=True)
+
+        logger.debug(f'MoeImagePool | Bucket({bucket}) refilled {len(added_pids)} image(s)')
+        return len(added_pids)
+
+    async def refill_all(self) -> None:
+        """清理已取出的图片并补充所有分桶"""
+        await run_sync(self._clear_consumed)()
+        for bucket in list((await self._get_buckets()).keys()):
+            await self.refill(bucket=bucket)
+
+
+moe_image_pool = MoeImagePool()
+
+
+@run_async_catching_exception
+async def refill_moe_image_pool() -> None:
+    """定时补充预处理图片池"""
+    await moe_image_pool.refill_all()
+
+
+if moe_image_pool.enabled:
+    @get_driver().on_startup
+    async def _init_moe_image_pool() -> None:
+        """启动时在后台补充预处理图片池"""
+        asyncio.create_task(refill_moe_image_pool())
+
+    add_monitored_job(
+        refill_moe_image_pool,
+        'interval',
+        minutes=moe_plugin_config.moe_plugin_image_pool_refill_interval,
+        id='moe_image_pool_refill',
+        jitter=60,
+        misfire_grace_time=120
+    )
+
+
+__all__ = [
+    'moe_image_pool'
+]
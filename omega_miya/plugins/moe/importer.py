@@ -0,0 +1,387 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/21 20:18
+@FileName       : importer.py
+@Project        : nonebot2_miya
+@Description    : Moe 图库导入, 分段流水线处理并记录检查点, 支持中断后继续及重试失败作品
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+import shutil
+import asyncio
+import ujson as json
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Literal
+
+from nonebot.log import logger
+
+from omega_miya.local_resource import TmpResource
+from omega_miya.web_resource.pixiv import PixivArtwork
+from omega_miya.web_resource.pixiv.model import PixivArtworkCompleteDataModel
+from omega_miya.utils.process_utils import run_sync
+
+from .config import moe_plugin_config, moe_plugin_resource_config
+from .utils import write_artwork_into_database
+
+
+_WRITE_BATCH_SIZE: int = 20
+"""写入数据库的批次大小, 每批写入完成后记录一次检查点"""
+
+_WRITE_BATCH_TIMEOUT: float = 5.0
+"""等待凑满一批的最长时间, 单位秒"""
+
+_WRITE_CONCURRENCY: int = 5
+"""单批次内写入数据库的并发数"""
+
+_RETRY_BACKOFF: float = 5.0
+"""获取作品信息失败重试的基础等待时间, 单位秒, 按重试次数指数增加"""
+
+
+class _RateLimiter(object):
+    """简单的令牌间隔限速器, 所有获取作品信息的 worker 共享"""
+
+    def __init__(self, rate: float) -> None:
+        self._interval: float = 1 / rate if rate > 0 else 0
+        self._next_time: float = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+
+
+@dataclass
+class ImportProgress:
+    """图库导入进度"""
+    total: int = 0
+    skipped: int = 0  # 检查点中已处理过的作品
+    succeeded: int = 0
+    failed: int = 0
+    running: bool = False
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
+    failed_reasons: dict[int, str] = field(default_factory=dict)
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def remaining(self) -> int:
+        return max(self.total - self.skipped - self.processed, 0)
+
+    @property
+    def rate(self) -> float:
+        """处理速度, 每分钟作品数"""
+        if self.started_at is None:
+            return 0
+        end_time = self.finished_at or datetime.now()
+        elapsed = (end_time - self.started_at).total_seconds()
+        return self.processed / elapsed * 60 if elapsed > 0 else 0
+
+    @property
+    def eta(self) -> timedelta | None:
+        if not self.running or self.rate <= 0:
+            return None
+        return timedelta(seconds=int(self.remaining / self.rate * 60))
+
+    def get_text(self) -> str:
+        status = '导入中' if self.running else '已停止'
+        text = f'图库导入状态: {status}\n' \
+               f'总计: {self.total}, 已跳过: {self.skipped}\n' \
+               f'成功: {self.succeeded}, 失败: {self.failed}, 剩余: {self.remaining}\n' \
+               f'速度: {self.rate:.1f} 作品/分钟'
+        if self.eta is not None:
+            text += f', 预计剩余时间: {self.eta}'
+        return text
+
+
+class MoeDatabaseImporter(object):
+    """Moe 图库导入
+
+    - 从导入文件中逐行读取 PID, 不在内存中保留完整列表, 因此文件中重复的 PID 会被重复导入
+    - 获取作品信息和写入数据库分为两个阶段, 通过有界队列连接, 获取阶段多个 worker 共享速率限制, 失败时退避重试
+    - 每批写入完成后将成功及失败的 PID 追加至检查点文件, 中断后继续导入时跳过已处理的作品
+    """
+    _checkpoint_folder: TmpResource = moe_plugin_resource_config.default_import_checkpoint_folder
+    _task_file: TmpResource = _checkpoint_folder('task.json')
+    _source_file: TmpResource = _checkpoint_folder('source.txt')
+    _processed_file: TmpResource = _checkpoint_folder('processed.txt')
+    _failed_file: TmpResource = _checkpoint_folder('failed.txt')
+
+    _fetch_concurrency: int = moe_plugin_config.moe_plugin_import_fetch_concurrency
+    _rate_limit: float = moe_plugin_config.moe_plugin_import_rate_limit
+    _retry_limit: int = moe_plugin_config.moe_plugin_import_retry_limit
+
+    def __init__(self) -> None:
+        self._task: asyncio.Task | None = None
+        self.progress = ImportProgress()
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @staticmethod
+    def _read_pids(file: TmpResource) -> set[int]:
+        if not file.is_file:
+            return set()
+        with file.open('r', encoding='utf8') as f:
+            return {int(x) for x in (line.strip() for line in f) if x.isdigit()}
+
+    @staticmethod
+    def _count_pids(file: TmpResource) -> int:
+        with file.open('r', encoding='utf8') as f:
+            return sum(1 for line in f if line.strip().isdigit())
+
+    def _prepare_task(self, nsfw_tag: int, add_only: bool, source: Literal['file', 'list', 'failed']) -> None:
+        """写入任务信息并清空上次的检查点"""
+        self._checkpoint_folder.path.mkdir(parents=True, exist_ok=True)
+        with self._task_file.open('w', encoding='utf8') as f:
+            f.write(json.dumps({'nsfw_tag': nsfw_tag, 'add_only': add_only, 'source': source,
+                                'created_at': datetime.now().isoformat()}))
+        if source != 'failed':
+            self._processed_file.path.unlink(missing_ok=True)
+        self._failed_file.path.unlink(missing_ok=True)
+
+    def _load_task(self) -> dict | None:
+        if not self._task_file.is_file or not self._source_file.is_file:
+            return None
+        with self._task_file.open('r', encoding='utf8') as f:
+            return json.loads(f.read())
+
+    def _write_source_from_pids(self, pids: list[int]) -> None:
+        self._checkpoint_folder.path.mkdir(parents=True, exist_ok=True)
+        with self._source_file.open('w', encoding='utf8') as f:
+            f.writelines(f'{pid}\n' for pid in pids)
+
+    def _write_source_from_file(self, file: TmpResource) -> None:
+        self._checkpoint_folder.path.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(file.path, self._source_file.path)
+
+    async def _append_checkpoint(self, file: TmpResource, pids: list[int]) -> None:
+        if not pids:
+            return
+        async with file.async_open('a', encoding='utf8') as af:
+            await af.write(''.join(f'{pid}\n' for pid in pids))
+
+    async def _produce(self, fetch_queue: asyncio.Queue, handled_pids: set[int]) -> None:
+        """逐行读取导入列表, 跳过检查点中已处理的作品"""
+        async with self._source_file.async_open('r', encoding='utf8') as af:
+            async for line in af:
+                line = line.strip()
+                if not line.isdigit():
+                    continue
+                pid = int(line)
+                if pid in handled_pids:
+                    self.progress.skipped += 1
+                    continue
+                await fetch_queue.put(pid)
+
+    async def _fetch_artwork(self, pid: int, limiter: _RateLimiter) -> PixivArtworkCompleteDataModel:
+        """获取作品信息, 失败时退避重试"""
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            try:
+                return await PixivArtwork(pid=pid).get_artwork_model()
+            except Exception as e:
+                attempt += 1
+                if attempt > self._retry_limit:
+                    raise e
+                logger.debug(f'MoeDatabaseImporter | Fetching artwork {pid} failed, retry {attempt}, {e}')
+                await asyncio.sleep(_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+    async def _fetch(self, fetch_queue: asyncio.Queue, write_queue: asyncio.Queue, limiter: _RateLimiter) -> None:
+        while True:
+            pid = await fetch_queue.get()
+            if pid is None:
+                return
+            try:
+                artwork_data = await self._fetch_artwork(pid=pid, limiter=limiter)
+                await write_queue.put((pid, artwork_data))
+            except Exception as e:
+                self.progress.failed_reasons[pid] = str(e)
+                await write_queue.put((pid, None))
+
+    async def _write_batch(
+            self,
+            batch: list[tuple[int, PixivArtworkCompleteDataModel | None]],
+            nsfw_tag: int,
+            add_only: bool
+    ) -> None:
+        """写入一批作品信息并记录检查点"""
+        semaphore = asyncio.Semaphore(_WRITE_CONCURRENCY)
+
+        async def _write(pid: int, artwork_data: PixivArtworkCompleteDataModel | None) -> bool:
+            if artwork_data is None:
+                return False
+            async with semaphore:
+                try:
+                    result = await write_artwork_into_database(pid=pid, artwork_data=artwork_data,
+                                                               nsfw_tag=nsfw_tag, add_only=add_only)
+                except Exception as e:
+                    self.progress.failed_reasons[pid] = str(e)
+                    return False
+            if result.error:
+                self.progress.failed_reasons[pid] = str(result.info)
+            return not result.error
+
+        results = await asyncio.gather(*(_write(pid, data) for pid, data in batch))
+        succeeded_pids = [pid for (pid, _), result in zip(batch, results) if result]
+        failed_pids = [pid for (pid, _), result in zip(batch, results) if not result]
+
+        await self._append_checkpoint(file=self._processed_file, pids=succeeded_pids)
+        await self._append_checkpoint(file=self._failed_file, pids=failed_pids)
+        self.progress.succeeded += len(succeeded_pids)
+        self.progress.failed += len(failed_pids)
+
+    async def _write(self, write_queue: asyncio.Queue, nsfw_tag: int, add_only: bool) -> None:
+        finished = False
+        while not finished:
+            batch = []
+            item = await write_queue.get()
+            if item is None:
+                return
+            batch.append(item)
+
+            deadline = time.monotonic() + _WRITE_BATCH_TIMEOUT
+            while len(batch) < _WRITE_BATCH_SIZE:
+                try:
+                    item = await asyncio.wait_for(write_queue.get(), timeout=max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+
+            await self._write_batch(batch=batch, nsfw_tag=nsfw_tag, add_only=add_only)
+            logger.info(f'MoeDatabaseImporter | 导入操作中, 成功: {self.progress.succeeded}, '
+                        f'失败: {self.progress.failed}, 剩余: {self.progress.remaining}')
+
+    async def _run(self, nsfw_tag: int, add_only: bool) -> None:
+        handled_pids = await run_sync(self._read_pids)(file=self._processed_file)
+        handled_pids.update(await run_sync(self._read_pids)(file=self._failed_file))
+
+        self.progress = ImportProgress(total=await run_sync(self._count_pids)(file=self._source_file),
+                                       running=True, started_at=datetime.now())
+        logger.info(f'MoeDatabaseImporter | 开始导入图库, 总计: {self.progress.total}, '
+                    f'已处理: {len(handled_pids)}')
+
+        fetch_queue: asyncio.Queue[int | None] = asyncio.Queue(maxsize=self._fetch_concurrency * 2)
+        write_queue: asyncio.Queue = asyncio.Queue(maxsize=_WRITE_BATCH_SIZE * 2)
+        limiter = _RateLimiter(rate=self._rate_limit)
+
+        fetchers = [
+            asyncio.create_task(self._fetch(fetch_queue=fetch_queue, write_queue=write_queue, limiter=limiter))
+            for _ in range(self._fetch_concurrency)
+        ]
+
+        async def _feed() -> None:
+            """读取导入列表, 完成后通知所有获取 worker 退出"""
+            await self._produce(fetch_queue=fetch_queue, handled_pids=handled_pids)
+            for _ in fetchers:
+                await fetch_queue.put(None)
+
+        async def _close_write_queue() -> None:
+            """所有获取 worker 退出后通知写入阶段退出"""
+            await asyncio.gather(*fetchers)
+            await write_queue.put(None)
+
+        writer = asyncio.create_task(self._write(write_queue=write_queue, nsfw_tag=nsfw_tag, add_only=add_only))
+        tasks = [asyncio.create_task(_feed()), *fetchers, asyncio.create_task(_close_write_queue()), writer]
+        try:
+            # 任意阶段异常时立即中止, 避免其他阶段阻塞在有界队列上
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_EXCEPTION)
+                for task in done:
+                    if task.exception() is not None:
+                        raise task.exception()
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.progress.running = False
+            self.progress.finished_at = datetime.now()
+
+        logger.success(f'MoeDatabaseImporter | 导入操作已完成, 成功: {self.progress.succeeded}, '
+                       f'失败: {self.progress.failed}, 跳过: {self.progress.skipped}')
+
+    def _start(self, nsfw_tag: int, add_only: bool) -> None:
+        async def _run_catching_exception() -> None:
+            try:
+                await self._run(nsfw_tag=nsfw_tag, add_only=add_only)
+            except Exception as e:
+                logger.error(f'MoeDatabaseImporter | 导入操作异常中止, 可使用继续导入从检查点恢复, {e}')
+
+        self._task = asyncio.create_task(_run_catching_exception())
+
+    async def start(self, nsfw_tag: int, *, pids: list[int] | None = None, add_only: bool = False) -> None:
+        """开始新的导入任务, 清空上次的检查点
+
+        :param nsfw_tag: 导入作品的 nsfw_tag
+        :param pids: 导入的作品 PID 列表, 为空时从导入文件中读取
+        :param add_only: 仅添加不存在的作品, 不更新已有作品信息
+        """
+        if self.is_running:
+            raise RuntimeError('import task is running')
+
+        if pids:
+            await run_sync(self._write_source_from_pids)(pids=pids)
+            source = 'list'
+        else:
+            await run_sync(self._write_source_from_file)(file=moe_plugin_resource_config.default_database_import_file)
+            source = 'file'
+        await run_sync(self._prepare_task)(nsfw_tag=nsfw_tag, add_only=add_only, source=source)
+        self._start(nsfw_tag=nsfw_tag, add_only=add_only)
+
+    async def resume(self) -> bool:
+        """从检查点继续上次的导入任务
+
+        :return: 是否存在可以继续的任务
+        """
+        if self.is_running:
+            raise RuntimeError('import task is running')
+
+        task_info = await run_sync(self._load_task)()
+        if task_info is None:
+            return False
+        self._start(nsfw_tag=task_info['nsfw_tag'], add_only=task_info['add_only'])
+        return True
+
+    async def retry_failed(self) -> int:
+        """重新导入上次任务中失败的作品
+
+        :return: 需要重试的作品数量
+        """
+        if self.is_running:
+            raise RuntimeError('import task is running')
+
+        task_info = await run_sync(self._load_task)()
+        failed_pids = await run_sync(self._read_pids)(file=self._failed_file)
+        if task_info is None or not failed_pids:
+            return 0
+
+        await run_sync(self._write_source_from_pids)(pids=sorted(failed_pids))
+        await run_sync(self._prepare_task)(nsfw_tag=task_info['nsfw_tag'], add_only=task_info['add_only'],
+                                           source='failed')
+        self._start(nsfw_tag=task_info['nsfw_tag'], add_only=task_info['add_only'])
+        return len(failed_pids)
+
+
+moe_database_importer = MoeDatabaseImporter()
+
+
+__all__ = [
+    'moe_database_importer'
+]
@@ -10,7 +10,6 @@
 
 from typing import Literal
 from pydantic import BaseModel
-from nonebot.log import logger
 from nonebot.matcher import Matcher
 from nonebot.rule import ArgumentParser, Namespace
 from nonebot.adapters.onebot.v11.bot import Bot
@@ -21,10 +20,11 @@ from omega_miya.database import InternalPixiv, EventEntityHelper
 from omega_miya.result import BoolResult
 from omega_miya.local_resource import TmpResource
 from omega_miya.web_resource.pixiv import PixivArtwork
-from omega_miya.utils.process_utils import run_async_catching_exception, run_sync
-from omega_miya.utils.image_utils import ImageUtils
+from omega_miya.web_resource.pixiv.model import PixivArtworkCompleteDataModel
+from omega_miya.utils.process_utils import run_async_catching_exception
+from omega_miya.utils.image_utils import image_variant_cache
 
-from .config import moe_plugin_config, moe_plugin_resource_config
+from .config import moe_plugin_config
 
 
 _ALLOW_R18_NODE = moe_plugin_config.moe_plugin_allow_r18_node
@@ -50,26 +50,21 @@ async def has_allow_r18_node(bot: Bot, event: MessageEvent, matcher: Matcher) ->
     return allow_r18
 
 
-@run_async_catching_exception
-async def prepare_send_image(pid: int) -> MessageSegment:
-    """预处理待发送图片
+async def process_artwork_image(pid: int) -> TmpResource:
+    """下载作品图片并进行噪点及水印处理
 
     :param pid: 作品 PID
-    :return: 发送的消息
+    :return: 处理后的图片文件
     """
 
     async def _handle_noise(image: TmpResource) -> TmpResource:
         """噪点处理图片"""
-        _image = await run_sync(ImageUtils.init_from_file)(file=image)
-        await run_sync(_image.gaussian_noise)(sigma=16)
-        await run_sync(_image.mark)(text=f'Pixiv | {pid}')
-        return await _image.save(file_name=f'{image.path.name}_noise_sigma16_marked.jpg')
+        return await image_variant_cache.get_variant(
+            source=image, operations=[('gaussian_noise', {'sigma': 16}), ('mark', {'text': f'Pixiv | {pid}'})])
 
     async def _handle_mark(image: TmpResource) -> TmpResource:
         """标记水印"""
-        _image = await run_sync(ImageUtils.init_from_file)(file=image)
-        await run_sync(_image.mark)(text=f'Pixiv | {pid}')
-        return await _image.save(file_name=f'{image.path.name}_marked.jpg')
+        return await image_variant_cache.get_variant(source=image, operations=[('mark', {'text': f'Pixiv | {pid}'})])
 
     internal_artwork = InternalPixiv(pid=pid)
     database_artwork_data = await internal_artwork.get_artwork_model()
@@ -82,7 +77,17 @@ async def prepare_send_image(pid: int) -> MessageSegment:
         artwork_image = await _handle_noise(image=artwork_image)
     else:
         artwork_image = await _handle_mark(image=artwork_image)
+    return artwork_image
+
+
+@run_async_catching_exception
+async def prepare_send_image(pid: int) -> MessageSegment:
+    """预处理待发送图片
 
+    :param pid: 作品 PID
+    :return: 发送的消息
+    """
+    artwork_image = await process_artwork_image(pid=pid)
     return MessageSegment.image(file=artwork_image.file_uri)
 
 
@@ -117,49 +122,45 @@ def parse_from_query_parser(args: Namespace) -> QueryArguments:
     return QueryArguments.from_orm(args)
 
 
-async def add_artwork_into_database(
-        artwork: PixivArtwork,
+async def write_artwork_into_database(
+        pid: int,
+        artwork_data: PixivArtworkCompleteDataModel,
         nsfw_tag: int,
         *,
         upgrade_pages: bool = True,
         add_only: bool = True
 ) -> BoolResult:
-    """在数据库中添加作品信息"""
-    artwork_data = await artwork.get_artwork_model()
+    """将已获取的作品信息写入数据库"""
     nsfw_tag = 2 if artwork_data.is_r18 else nsfw_tag
     classified = 2 if artwork_data.is_ai else 1
     if add_only:
-        result = await InternalPixiv(pid=artwork.pid).add_only(artwork_data=artwork_data, nsfw_tag=nsfw_tag,
-                                                               classified=classified, upgrade_pages=upgrade_pages)
+        result = await InternalPixiv(pid=pid).add_only(artwork_data=artwork_data, nsfw_tag=nsfw_tag,
+                                                       classified=classified, upgrade_pages=upgrade_pages)
     else:
-        result = await InternalPixiv(pid=artwork.pid).add_upgrade(artwork_data=artwork_data, nsfw_tag=nsfw_tag,
-                                                                  classified=classified, upgrade_pages=upgrade_pages)
+        result = await InternalPixiv(pid=pid).add_upgrade(artwork_data=artwork_data, nsfw_tag=nsfw_tag,
+                                                          classified=classified, upgrade_pages=upgrade_pages)
     return result
 
 
-@run_async_catching_exception
-async def _get_database_import_pids() -> list[int]:
-    """从本地文件中读取需要导入数据库的图片 PID"""
-    async with moe_plugin_resource_config.default_database_import_file.async_open('r', encoding='utf-8') as af:
-        pids = [int(x.strip()) for x in await af.readlines() if x.strip().isdigit()]
-    return pids
-
-
-async def get_database_import_pids() -> list[int]:
-    """从本地文件中读取需要导入数据库的图片 PID"""
-    pids = await _get_database_import_pids()
-    if isinstance(pids, Exception):
-        logger.error(f'MoeDatabaseImport | 从文件中读取导入文件列表失败, {pids}, '
-                     f'请确认导入文件{moe_plugin_resource_config.default_database_import_file.resolve_path}存在')
-        pids = []
-    return pids
+async def add_artwork_into_database(
+        artwork: PixivArtwork,
+        nsfw_tag: int,
+        *,
+        upgrade_pages: bool = True,
+        add_only: bool = True
+) -> BoolResult:
+    """在数据库中添加作品信息"""
+    artwork_data = await artwork.get_artwork_model()
+    return await write_artwork_into_database(pid=artwork.pid, artwork_data=artwork_data, nsfw_tag=nsfw_tag,
+                                             upgrade_pages=upgrade_pages, add_only=add_only)
 
 
 __all__ = [
     'has_allow_r18_node',
+    'process_artwork_image',
     'prepare_send_image',
     'get_query_argument_parser',
     'parse_from_query_parser',
-    'add_artwork_into_database',
-    'get_database_import_pids'
+    'write_artwork_into_database',
+    'add_artwork_into_database'
 ]
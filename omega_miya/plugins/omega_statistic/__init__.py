@@ -22,8 +22,11 @@ from nonebot.params import CommandArg, ArgStr
 
 from omega_miya.service import init_processor_state
 from omega_miya.service.gocqhttp_guild_patch import GuildMessageEvent, GUILD
+from omega_miya.service.omega_api import register_get_route, BaseApiModel, BaseApiReturn
+from omega_miya.web_resource.http_fetcher import http_fetcher_metrics
 
-from .utils import draw_statistics
+from .config import statistic_config
+from .utils import draw_statistics, format_http_metrics
 
 
 __plugin_meta__ = PluginMetadata(
@@ -35,7 +38,9 @@ __plugin_meta__ = PluginMetadata(
           "- 本月\n"
           "- 本年\n"
           "- 全部\n"
-          "- 所有",
+          "- 所有\n\n"
+          "仅限超级用户:\n"
+          "/网络统计 [重置]",
     extra={"author": "Ailitonia"},
 )
 
@@ -104,3 +109,39 @@ async def handle_help_message(bot: Bot, matcher: Matcher, event: MessageEvent, c
         await matcher.finish('生成统计图表失败QAQ')
 
     await matcher.finish(MessageSegment.image(statistic_image.file_uri))
+
+
+http_statistic = on_command(
+    'http_statistic',
+    state=init_processor_state(name='http_statistic', enable_processor=False),
+    aliases={'网络统计', '请求统计'},
+    permission=SUPERUSER,
+    priority=10,
+    block=True
+)
+
+
+@http_statistic.handle()
+async def handle_http_statistic(matcher: Matcher, cmd_arg: Message = CommandArg()):
+    if cmd_arg.extract_plain_text().strip() == '重置':
+        http_fetcher_metrics.reset()
+        await matcher.finish('网络请求统计已重置')
+    await matcher.finish(format_http_metrics())
+
+
+@register_get_route(path='/statistic/http-metrics', enabled=statistic_config.statistic_enable_http_metrics_api)
+async def _handle_http_metrics() -> BaseApiReturn:
+    """api 查询网络请求统计"""
+    class _ReturnBody(BaseApiModel):
+        start_time: str
+        hosts: dict[str, dict]
+
+    class _Return(BaseApiReturn):
+        body: _ReturnBody
+
+    return _Return(
+        error=False,
+        body=_ReturnBody(start_time=http_fetcher_metrics.start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                         hosts=http_fetcher_metrics.snapshot()),
+        message='Success'
+    )
@@ -0,0 +1,34 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/11 21:36
+@FileName       : config.py
+@Project        : nonebot2_miya
+@Description    : 统计插件配置
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+from nonebot import get_driver, logger
+from pydantic import BaseModel, ValidationError
+
+
+class StatisticConfig(BaseModel):
+    """统计插件配置"""
+    # 是否启用网络请求统计查询 api
+    statistic_enable_http_metrics_api: bool = False
+
+    class Config:
+        extra = "ignore"
+
+
+try:
+    statistic_config = StatisticConfig.parse_obj(get_driver().config)
+except ValidationError as e:
+    import sys
+    logger.opt(colors=True).critical(f'<r>Statistic 插件配置格式验证失败</r>, 错误信息:\n{e}')
+    sys.exit(f'Statistic 插件配置格式验证失败, {e}')
+
+
+__all__ = [
+    'statistic_config'
+]
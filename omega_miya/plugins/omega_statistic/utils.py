@@ -15,6 +15,7 @@ from matplotlib import font_manager
 from matplotlib import pyplot as plt
 
 from omega_miya.database import Statistic
+from omega_miya.web_resource.http_fetcher import http_fetcher_metrics
 from omega_miya.local_resource import LocalResource, TmpResource
 from omega_miya.utils.process_utils import run_sync, run_async_catching_exception
 
@@ -71,6 +72,31 @@ async def draw_statistics(
     return save_file
 
 
+def format_http_metrics(*, limit: int = 15) -> str:
+    """格式化网络请求统计信息, 按总等待时间由高到低排序
+
+    :param limit: 显示的 host 数量上限
+    """
+    sorted_hosts = http_fetcher_metrics.get_sorted_hosts()
+    start_time = http_fetcher_metrics.start_time.strftime('%Y-%m-%d %H:%M:%S')
+    if not sorted_hosts:
+        return f'自 {start_time} 以来没有网络请求记录'
+
+    host_text = []
+    for host, metrics in sorted_hosts[:limit]:
+        status_text = ', '.join(f'{k}: {v}' for k, v in sorted(metrics.status_count.items()))
+        host_text.append(
+            f'{host}\n'
+            f'请求 {metrics.request_count} 次, 重试 {metrics.retry_count} 次, 异常 {metrics.error_count} 次\n'
+            f'总耗时 {metrics.latency_sum:.2f}s, 平均 {metrics.latency_avg:.3f}s, '
+            f'P95≤{metrics.latency_quantile(0.95)}s, 最大 {metrics.latency_max:.3f}s\n'
+            f'接收 {metrics.bytes_received / 1024 / 1024:.2f}MB, 发送 {metrics.bytes_sent / 1024 / 1024:.2f}MB\n'
+            f'状态码 {status_text if status_text else "无"}'
+        )
+    return f'自 {start_time} 以来的网络请求统计:\n\n' + '\n\n'.join(host_text)
+
+
 __all__ = [
-    'draw_statistics'
+    'draw_statistics',
+    'format_http_metrics'
 ]
@@ -19,12 +19,25 @@ class PixivPluginConfig(BaseModel):
     pixiv_plugin_allow_r18_node: Literal['allow_r18'] = 'allow_r18'
     # pixiv 画师订阅 SubscriptionSource 的 sub_type
     pixiv_plugin_user_subscription_type: Literal['pixiv_user'] = 'pixiv_user'
+    # pixiv 画师订阅检查新作品时完整核对全部作品的间隔, 单位秒, 其余时间仅检查 pid 大于已记录最大值的作品
+    pixiv_plugin_user_subscription_full_check_interval: int = 86400
+    # pixiv 画师订阅检查新作品的最小及最大间隔, 单位分钟, 按画师最近发布作品的频率在两者之间自动调整
+    pixiv_plugin_user_subscription_min_polling_interval: int = 5
+    pixiv_plugin_user_subscription_max_polling_interval: int = 1440
     # 默认自动撤回消息时间
     pixiv_plugin_auto_recall_time: int = 30
     # 单个作品发送图片数量限制, 避免单个作品图过多导致一次性发送过多图导致网络堵塞和风控
     pixiv_plugin_artwork_preview_page_limiting: int = 10
     # 启动 gif 动图生成, 针对动图作品生成 gif 图片, 消耗资源较大, 请谨慎开启
     pixiv_plugin_enable_generate_gif: bool = False
+    # 动图作品生成的图片格式, webp 体积更小且生成更快, 但部分客户端可能无法正常显示
+    pixiv_plugin_ugoira_format: Literal['gif', 'webp'] = 'gif'
+    # 每天排行榜更新后预先获取日榜、周榜、月榜并生成预览图缓存
+    pixiv_plugin_enable_ranking_prewarm: bool = True
+    # 启动时从数据库中预加载最近收录的作品信息缓存的数量, 为 0 时不预加载
+    pixiv_plugin_artwork_cache_warm_up_num: int = 0
+    # 预加载时是否从 Pixiv 获取缓存中不存在的作品信息, 作品数量较多时会产生大量请求, 请谨慎开启
+    pixiv_plugin_artwork_cache_warm_up_fetch_missing: bool = False
 
     class Config:
         extra = "ignore"
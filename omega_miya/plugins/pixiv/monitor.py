@@ -9,11 +9,12 @@
 """
 
 from nonebot.log import logger
-from omega_miya.web_resource.pixiv import PixivUser
+from omega_miya.web_resource.pixiv import PixivArtwork, PixivRanking, PixivUser
 from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
-from omega_miya.utils.apscheduler import scheduler
+from omega_miya.utils.apscheduler import scheduler, add_monitored_job
 
-from .utils import query_all_pixiv_user_subscription_source, send_pixiv_user_new_artworks
+from .config import pixiv_plugin_config
+from .utils import query_due_pixiv_user_subscription_source, send_pixiv_user_new_artworks
 
 
 @run_async_catching_exception
@@ -21,10 +22,10 @@ async def pixiv_user_artwork_update_monitor() -> None:
     """Pixiv 用户订阅 作品更新监控"""
     logger.debug('PixivUserSubscriptionMonitor | Started checking pixiv user artworks update')
 
-    # 获取所有已添加的 Pixiv 用户订阅源
-    subscribed_uid = await query_all_pixiv_user_subscription_source()
+    # 获取已到检查时间的 Pixiv 用户订阅源, 长期未更新的用户检查间隔更长
+    subscribed_uid = await query_due_pixiv_user_subscription_source()
     if not subscribed_uid:
-        logger.debug('PixivUserSubscriptionMonitor | No pixiv user subscription, ignore')
+        logger.debug('PixivUserSubscriptionMonitor | No pixiv user subscription need checking, ignore')
         return
 
     # 检查新作品并发送消息
@@ -34,7 +35,7 @@ async def pixiv_user_artwork_update_monitor() -> None:
     logger.debug('PixivUserSubscriptionMonitor | Pixiv user artworks update checking completed')
 
 
-scheduler.add_job(
+add_monitored_job(
     pixiv_user_artwork_update_monitor,
     'cron',
     # year=None,
@@ -49,11 +50,53 @@ scheduler.add_job(
     # end_date=None,
     # timezone=None,
     id='pixiv_user_artwork_update_monitor',
-    coalesce=True,
+    jitter=60,
     misfire_grace_time=120
 )
 
 
+@run_async_catching_exception
+async def pixiv_ranking_cache_prewarm() -> None:
+    """Pixiv 排行榜更新后预先获取榜单并生成预览图缓存"""
+    logger.debug('PixivRankingCachePrewarm | Started prewarming pixiv ranking cache')
+    await PixivRanking.prewarm_ranking_cache()
+    logger.debug('PixivRankingCachePrewarm | Pixiv ranking cache prewarming completed')
+
+
+if pixiv_plugin_config.pixiv_plugin_enable_ranking_prewarm:
+    add_monitored_job(
+        pixiv_ranking_cache_prewarm,
+        'cron',
+        # Pixiv 排行榜于每天 12:00 (JST) 更新
+        hour=12,
+        minute=10,
+        timezone='Asia/Tokyo',
+        id='pixiv_ranking_cache_prewarm',
+        jitter=300,
+        adaptive=False,
+        misfire_grace_time=600
+    )
+
+
+@run_async_catching_exception
+async def pixiv_cache_cleanup() -> None:
+    """定期清理超过保留时间的 Pixiv 缓存文件"""
+    count = await PixivArtwork.clear_expired_cache()
+    logger.debug(f'PixivCacheCleanup | Cleared {count} expired pixiv cache file(s)')
+
+
+add_monitored_job(
+    pixiv_cache_cleanup,
+    'cron',
+    hour=4,
+    minute=30,
+    id='pixiv_cache_cleanup',
+    jitter=600,
+    adaptive=False,
+    misfire_grace_time=3600
+)
+
+
 __all__ = [
     'scheduler'
 ]
@@ -8,27 +8,29 @@
 @Software       : PyCharm 
 """
 
+import time
 import asyncio
 from copy import deepcopy
 from typing import Literal
 from pydantic import BaseModel
+from nonebot import get_driver
 from nonebot.log import logger
-from nonebot.exception import ActionFailed
 from nonebot.matcher import Matcher
 from nonebot.rule import ArgumentParser, Namespace
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.message import MessageSegment, Message
 
-from omega_miya.database import (InternalBotUser, InternalBotGroup, InternalGuildChannel,
-                                 InternalPixiv, InternalSubscriptionSource, EventEntityHelper)
+from omega_miya.database import InternalPixiv, InternalSubscriptionSource, EventEntityHelper
 from omega_miya.database.internal.entity import BaseInternalEntity
 from omega_miya.result import BoolResult
 from omega_miya.local_resource import TmpResource
 from omega_miya.web_resource.pixiv import PixivArtwork, PixivUser
-from omega_miya.utils.process_utils import run_async_catching_exception, run_sync, semaphore_gather
-from omega_miya.utils.image_utils import ImageUtils
-from omega_miya.utils.message_tools import MessageSender
+from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
+from omega_miya.utils.image_utils import image_variant_cache
+from omega_miya.utils.message_delivery import message_delivery_queue
+from omega_miya.utils.seen_filter import SeenIdFilter
+from omega_miya.utils.adaptive_polling import AdaptivePolling
 
 from .config import pixiv_plugin_config
 
@@ -37,6 +39,24 @@ _ALLOW_R18_NODE = pixiv_plugin_config.pixiv_plugin_allow_r18_node
 """允许预览 r18 作品的权限节点"""
 _USER_SUB_TYPE = pixiv_plugin_config.pixiv_plugin_user_subscription_type
 """pixiv 画师订阅 SubscriptionSource 的 sub_type"""
+_USER_SUB_FULL_CHECK_INTERVAL = pixiv_plugin_config.pixiv_plugin_user_subscription_full_check_interval
+"""pixiv 画师订阅完整核对全部作品的间隔"""
+_SEEN_ARTWORK_FILTER_SIZE: int = 20000
+"""内存中记录的已收录作品数量"""
+_USER_SUB_POLLING = AdaptivePolling(
+    min_interval=pixiv_plugin_config.pixiv_plugin_user_subscription_min_polling_interval * 60,
+    max_interval=pixiv_plugin_config.pixiv_plugin_user_subscription_max_polling_interval * 60
+)
+"""pixiv 画师订阅检查间隔"""
+
+
+async def _load_recent_artwork_pids() -> list[int]:
+    return await InternalPixiv.query_recent_pids(limit=_SEEN_ARTWORK_FILTER_SIZE)
+
+
+_seen_artwork_filter: SeenIdFilter[int] = SeenIdFilter(
+    name='PixivArtwork', warm_up_loader=_load_recent_artwork_pids, max_size=_SEEN_ARTWORK_FILTER_SIZE)
+"""已收录作品过滤器, 检查用户新作品时只对其中没有的作品查询数据库"""
 
 
 @run_async_catching_exception
@@ -78,15 +98,11 @@ async def _get_artwork_preview(
 
     async def _handle_r18_blur(image: TmpResource) -> TmpResource:
         """模糊处理 r18 图"""
-        _image = await run_sync(ImageUtils.init_from_file)(file=image)
-        await run_sync(_image.gaussian_blur)()
-        return await _image.save(file_name=f'{image.path.name}_blur.jpg')
+        return await image_variant_cache.get_variant(source=image, operations=[('gaussian_blur', {})])
 
     async def _handle_r18_noise(image: TmpResource) -> TmpResource:
         """噪点处理 r18 图"""
-        _image = await run_sync(ImageUtils.init_from_file)(file=image)
-        await run_sync(_image.gaussian_noise)(sigma=16)
-        return await _image.save(file_name=f'{image.path.name}_noise_sigma16.jpg')
+        return await image_variant_cache.get_variant(source=image, operations=[('gaussian_noise', {'sigma': 16})])
 
     artwork = PixivArtwork(pid=pid)
     artwork_data = await artwork.get_artwork_model()
@@ -96,7 +112,8 @@ async def _get_artwork_preview(
     if generate_gif and artwork_data.illust_type == 2 and (
             allow_r18 and artwork_data.is_r18 or not artwork_data.is_r18):
         # 启用了动图作品生成 gif
-        artwork_gif = await artwork.generate_ugoira_gif(original=False)
+        artwork_gif = await artwork.generate_ugoira(
+            original=False, format_=pixiv_plugin_config.pixiv_plugin_ugoira_format)
         send_msg = MessageSegment.image(artwork_gif.file_uri)
     else:
         # 直接生成作品预览
@@ -190,6 +207,8 @@ async def add_artwork_into_database(artwork: PixivArtwork, *, upgrade_pages: boo
     classified = 2 if artwork_data.is_ai else 0
     result = await InternalPixiv(pid=artwork.pid).add_only(artwork_data=artwork_data, nsfw_tag=nsfw_tag,
                                                            classified=classified, upgrade_pages=upgrade_pages)
+    if not result.error:
+        _seen_artwork_filter.add(artwork.pid)
     return result
 
 
@@ -278,77 +297,156 @@ async def query_all_pixiv_user_subscription_source() -> list[int]:
     return result
 
 
+async def query_due_pixiv_user_subscription_source() -> list[int]:
+    """获取已到检查时间的 Pixiv 用户订阅源, 检查间隔按订阅源中记录的状态计算
+
+    :return: 用户 UID 列表
+    """
+    source_state = await InternalSubscriptionSource.query_all_state_by_sub_type(sub_type=_USER_SUB_TYPE)
+    result = [int(sub_id) for sub_id, state in source_state.items()
+              if _USER_SUB_POLLING.is_due(source_id=sub_id, state=state)]
+    return result
+
+
 async def _query_subscribed_entity_by_pixiv_user(pixiv_user: PixivUser) -> list[BaseInternalEntity]:
     """根据 Pixiv 用户查询已经订阅了这个用户的内部 Entity 对象"""
-    sub_source = InternalSubscriptionSource(sub_type=_USER_SUB_TYPE, sub_id=str(pixiv_user.uid))
-    subscribed_related_entity = await sub_source.query_all_subscribed_related_entity()
+    sub_id = str(pixiv_user.uid)
+    subscribed_entity = await BaseInternalEntity.query_all_by_subscribed_sources(
+        sub_type=_USER_SUB_TYPE, sub_ids=[sub_id])
+    return subscribed_entity[sub_id]
+
 
-    init_tasks = []
-    for related_entity in subscribed_related_entity:
-        match related_entity.relation_type:
-            case 'bot_group':
-                init_tasks.append(InternalBotGroup.init_from_index_id(id_=related_entity.id))
-            case 'bot_user':
-                init_tasks.append(InternalBotUser.init_from_index_id(id_=related_entity.id))
-            case 'guild_channel':
-                init_tasks.append(InternalGuildChannel.init_from_index_id(id_=related_entity.id))
+async def _artwork_exists(pid: int) -> bool:
+    """判断该作品是否在数据库中已存在"""
+    _, exist = await InternalPixiv(pid=pid).exist()
+    return exist
 
-    entity_result = await semaphore_gather(tasks=init_tasks, semaphore_num=50, return_exceptions=False)
-    return list(entity_result)
 
+async def _check_user_new_artworks(pixiv_user: PixivUser) -> tuple[list[int], bool]:
+    """检查 Pixiv 用户的新作品(数据库中没有的)
 
-async def _check_user_new_artworks(pixiv_user: PixivUser) -> list[int]:
-    """检查 Pixiv 用户的新作品(数据库中没有的)"""
+    订阅源中记录了已确认的最大作品 pid (hwm), 平时只检查 pid 大于该值的作品,
+    未记录或距上次完整核对超过间隔时, 从数据库中一次性查出该用户的全部作品进行完整核对
+
+    :return: 新作品 pid 列表, 是否进行了完整核对
+    """
     user_data = await pixiv_user.get_user_model()
-    check_tasks = [InternalPixiv(pid=pid).exist() for pid in user_data.manga_illusts]
-    check_result = await semaphore_gather(tasks=check_tasks, semaphore_num=50, return_exceptions=False)
+    sub_source = InternalSubscriptionSource(sub_type=_USER_SUB_TYPE, sub_id=str(pixiv_user.uid))
+    state = await sub_source.query_state()
+    high_water_mark = int(state.get('hwm', 0))
+    last_full_check = int(state.get('full', 0))
+
+    if high_water_mark <= 0 or time.time() - last_full_check >= _USER_SUB_FULL_CHECK_INTERVAL:
+        exist_pids = set(await InternalPixiv.query_all_pid_by_user_id(uid=pixiv_user.uid))
+        new_pid = [pid for pid in user_data.manga_illusts if pid not in exist_pids]
+        return new_pid, True
+
+    candidate_pids = [pid for pid in user_data.manga_illusts if pid > high_water_mark]
+    if not candidate_pids:
+        return [], False
+
+    new_pid = await _seen_artwork_filter.filter_unseen(
+        ids=candidate_pids, exist_checker=_artwork_exists, semaphore_num=50)
+    return new_pid, False
 
-    new_pid = [x[0] for x in check_result if not x[1]]
-    return new_pid
 
+async def _update_user_subscription_state(
+        pixiv_user: PixivUser,
+        *,
+        full_checked: bool,
+        found_new: bool,
+        failed_pids: list[int] | None = None
+) -> None:
+    """新作品处理完成后更新订阅源中记录的最大作品 pid 及时间, 并按作品发布频率调整检查间隔
+
+    :param failed_pids: 写入数据库失败的新作品, 最大作品 pid 不会超过其中最小的 pid, 下次检查时重试
+    """
+    user_data = await pixiv_user.get_user_model()
+    sub_source = InternalSubscriptionSource(sub_type=_USER_SUB_TYPE, sub_id=str(pixiv_user.uid))
+    state = await sub_source.query_state()
+    high_water_mark = int(state.get('hwm', 0))
+    new_high_water_mark = max(user_data.manga_illusts, default=high_water_mark)
+    if failed_pids:
+        new_high_water_mark = min(new_high_water_mark, min(failed_pids) - 1)
 
-async def _msg_sender(entity: BaseInternalEntity, message: str | Message) -> int:
-    """向 entity 发送消息"""
-    try:
-        msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
-        sent_msg_id = await msg_sender.send_internal_entity_msg(entity=entity, message=message)
-    except KeyError:
-        logger.debug(f'PixivUserSubscriptionMonitor | Bot({entity.bot_id}) not online, '
-                     f'message to {entity.relation.relation_type.upper()}({entity.entity_id}) has be canceled')
-        sent_msg_id = 0
-    except ActionFailed as e:
-        logger.warning(f'PixivUserSubscriptionMonitor | Bot({entity.bot_id}) failed to send message to '
-                       f'{entity.relation.relation_type.upper()}({entity.entity_id}) with ActionFailed, {e}')
-        sent_msg_id = 0
-    return sent_msg_id
+    now = int(time.time())
+    update_state = _USER_SUB_POLLING.next_state(state, found_new=found_new)
+    if new_high_water_mark > high_water_mark:
+        update_state.update({'hwm': new_high_water_mark, 'ts': now})
+    # 有作品写入失败时不记录完整核对时间, 下次检查时重新进行完整核对
+    if full_checked and not failed_pids:
+        update_state.update({'full': now})
+
+    # 仅在有变化时写入数据库
+    if update_state:
+        await sub_source.update_state(**update_state)
 
 
 async def send_pixiv_user_new_artworks(pixiv_user: PixivUser) -> None:
     """向已订阅的用户或群发送 Pixiv 用户更新的作品"""
     logger.debug(f'PixivUserSubscriptionMonitor | Start checking pixiv user({pixiv_user.uid}) new artworks')
+    _USER_SUB_POLLING.mark_checked(source_id=str(pixiv_user.uid))
     user_data = await pixiv_user.get_user_model()
-    new_pids = await _check_user_new_artworks(pixiv_user=pixiv_user)
+    new_pids, full_checked = await _check_user_new_artworks(pixiv_user=pixiv_user)
     if new_pids:
         logger.info(f'PixivUserSubscriptionMonitor | Confirmed pixiv user({pixiv_user.uid}) '
                     f'new artworks: {", ".join(str(x) for x in new_pids)}')
     else:
         logger.debug(f'PixivUserSubscriptionMonitor | Pixiv user({pixiv_user.uid}) has not new artworks')
+        await _update_user_subscription_state(pixiv_user=pixiv_user, full_checked=full_checked, found_new=False)
+        return
+
+    # 数据库中插入新作品信息, 只发送写入成功的作品, 写入失败的作品在下次检查时重试
+    add_artwork_tasks = [add_artwork_into_database(artwork=PixivArtwork(pid=pid)) for pid in new_pids]
+    add_artwork_results = await semaphore_gather(tasks=add_artwork_tasks, semaphore_num=10, return_exceptions=True)
+    added_pids = [pid for pid, result in zip(new_pids, add_artwork_results)
+                  if not isinstance(result, BaseException) and not result.error]
+    failed_pids = [pid for pid in new_pids if pid not in added_pids]
+    if failed_pids:
+        logger.warning(f'PixivUserSubscriptionMonitor | Adding pixiv user({pixiv_user.uid}) new artworks '
+                       f'{", ".join(str(x) for x in failed_pids)} into database failed, will retry next time')
+    await _update_user_subscription_state(pixiv_user=pixiv_user, full_checked=full_checked,
+                                          found_new=True, failed_pids=failed_pids)
+    if not added_pids:
         return
 
     subscribed_entity = await _query_subscribed_entity_by_pixiv_user(pixiv_user=pixiv_user)
     # 获取作品更新消息内容
     message_prefix = f'【Pixiv】{user_data.name}发布了新的作品!\n'
-    preview_msg_tasks = [get_artwork_preview(pid=pid, message_prefix=message_prefix) for pid in new_pids]
+    preview_msg_tasks = [get_artwork_preview(pid=pid, message_prefix=message_prefix) for pid in added_pids]
     send_messages = await semaphore_gather(tasks=preview_msg_tasks, semaphore_num=5, return_exceptions=False)
 
-    # 数据库中插入新作品信息
-    add_artwork_tasks = [add_artwork_into_database(artwork=PixivArtwork(pid=pid)) for pid in new_pids]
-    await semaphore_gather(tasks=add_artwork_tasks, semaphore_num=10, return_exceptions=False)
+    # 向订阅者投递新作品信息
+    await message_delivery_queue.broadcast(entities=subscribed_entity, messages=[x[0] for x in send_messages],
+                                           coalesce_key=f'pixiv_user_{pixiv_user.uid}')
+
+
+async def _warm_up_artwork_model_cache(pids: list[int]) -> None:
+    """预加载作品信息缓存"""
+    fetched_num = await PixivArtwork.preload_artwork_models(
+        pids=pids, fetch_missing=pixiv_plugin_config.pixiv_plugin_artwork_cache_warm_up_fetch_missing)
+    logger.opt(colors=True).success(
+        f'<lc>Pixiv</lc> | Artwork model cache warm up completed, {len(pids)} artwork(s) loaded, '
+        f'{fetched_num} artwork(s) fetched from pixiv')
+
+
+@get_driver().on_startup
+async def _warm_up_seen_artwork_filter() -> None:
+    await _seen_artwork_filter.warm_up()
+
+
+@get_driver().on_startup
+@run_async_catching_exception
+async def _init_artwork_model_cache() -> None:
+    """启动时从数据库中最近收录的作品预加载作品信息缓存"""
+    warm_up_num = pixiv_plugin_config.pixiv_plugin_artwork_cache_warm_up_num
+    if warm_up_num <= 0:
+        return
 
-    # 向订阅者发送新作品信息
-    send_tasks = [_msg_sender(entity=entity, message=send_message[0])
-                  for entity in subscribed_entity for send_message in send_messages]
-    await semaphore_gather(tasks=send_tasks, semaphore_num=2, return_exceptions=True)
+    artworks = await InternalPixiv.query_by_condition(
+        keywords=None, num=warm_up_num, nsfw_tag=-2, classified=-1, order_mode='create_time_desc')
+    # 不阻塞启动流程, 在后台完成预加载
+    asyncio.create_task(_warm_up_artwork_model_cache(pids=[x.pid for x in artworks]))
 
 
 __all__ = [
@@ -361,5 +459,6 @@ __all__ = [
     'delete_pixiv_user_sub',
     'query_subscribed_user_sub_source',
     'query_all_pixiv_user_subscription_source',
+    'query_due_pixiv_user_subscription_source',
     'send_pixiv_user_new_artworks'
 ]
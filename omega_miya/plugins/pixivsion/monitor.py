@@ -10,7 +10,7 @@
 
 from nonebot.log import logger
 from omega_miya.utils.process_utils import run_async_catching_exception
-from omega_miya.utils.apscheduler import scheduler
+from omega_miya.utils.apscheduler import scheduler, add_monitored_job
 
 from .utils import send_pixivision_new_article
 
@@ -23,7 +23,7 @@ async def pixivision_article_update_monitor() -> None:
     logger.debug('PixivisionArticleUpdateMonitor | Pixivision update checking completed')
 
 
-scheduler.add_job(
+add_monitored_job(
     pixivision_article_update_monitor,
     'cron',
     # year=None,
@@ -38,7 +38,7 @@ scheduler.add_job(
     # end_date=None,
     # timezone=None,
     id='pixivision_article_update_monitor',
-    coalesce=True,
+    jitter=60,
     misfire_grace_time=120
 )
 
@@ -8,26 +8,44 @@
 @Software       : PyCharm
 """
 
+import time
 from typing import Literal
+from nonebot import get_driver
 from nonebot.log import logger
-from nonebot.exception import ActionFailed
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.message import MessageSegment, Message
 from nonebot.adapters.onebot.v11.event import MessageEvent
 
 from omega_miya.result import BoolResult
-from omega_miya.database import (InternalBotUser, InternalBotGroup, InternalGuildChannel,
-                                 InternalSubscriptionSource, PixivisionArticle, EventEntityHelper)
+from omega_miya.database import InternalSubscriptionSource, PixivisionArticle, EventEntityHelper
 from omega_miya.database.internal.entity import BaseInternalEntity
 from omega_miya.web_resource.pixiv import Pixivision
 from omega_miya.utils.process_utils import run_async_catching_exception, semaphore_gather
-from omega_miya.utils.message_tools import MessageSender
+from omega_miya.utils.message_delivery import message_delivery_queue
+from omega_miya.utils.seen_filter import SeenIdFilter
+from omega_miya.utils.adaptive_polling import AdaptivePolling
 
 
 _PIXIVISION_SUB_TYPE: Literal['pixivision'] = 'pixivision'
 """Pixivision 订阅 SubscriptionSource 的 sub_type"""
 _PIXIVISION_SUB_ID: Literal['pixivision'] = 'pixivision'
 """Pixivision 订阅 SubscriptionSource 的 sub_id"""
+_PIXIVISION_POLLING = AdaptivePolling(min_interval=9 * 60, max_interval=6 * 3600)
+"""Pixivision 检查间隔, 按特辑发布频率在 9 分钟到 6 小时之间调整"""
+
+
+async def _load_all_article_aids() -> list[int]:
+    return (await PixivisionArticle.query_all_aid()).result
+
+
+_seen_article_filter: SeenIdFilter[int] = SeenIdFilter(
+    name='PixivisionArticle', warm_up_loader=_load_all_article_aids, max_size=8192)
+"""已收录特辑过滤器, 检查新特辑时只对其中没有的特辑查询数据库"""
+
+
+@get_driver().on_startup
+async def _warm_up_seen_article_filter() -> None:
+    await _seen_article_filter.warm_up()
 
 
 @run_async_catching_exception
@@ -89,38 +107,21 @@ async def _query_subscribed_entity_by_pixiv_user() -> list[BaseInternalEntity]:
     if not await sub_source.exist():
         await _add_pixivision_sub_source()
 
-    subscribed_related_entity = await sub_source.query_all_subscribed_related_entity()
-
-    init_tasks = []
-    for related_entity in subscribed_related_entity:
-        match related_entity.relation_type:
-            case 'bot_group':
-                init_tasks.append(InternalBotGroup.init_from_index_id(id_=related_entity.id))
-            case 'bot_user':
-                init_tasks.append(InternalBotUser.init_from_index_id(id_=related_entity.id))
-            case 'guild_channel':
-                init_tasks.append(InternalGuildChannel.init_from_index_id(id_=related_entity.id))
-
-    entity_result = await semaphore_gather(tasks=init_tasks, semaphore_num=50, return_exceptions=False)
-    return list(entity_result)
+    subscribed_entity = await BaseInternalEntity.query_all_by_subscribed_sources(
+        sub_type=_PIXIVISION_SUB_TYPE, sub_ids=[_PIXIVISION_SUB_ID])
+    return subscribed_entity[_PIXIVISION_SUB_ID]
 
 
-async def _check_pixivision_article_exist(aid: int) -> (int, bool):
-    """判断该 Pixivision 特辑是否在数据库中已存在
-
-    :return: aid, 是否存在
-    """
-    exist = await PixivisionArticle(aid=aid).exist()
-    return aid, exist
+async def _check_pixivision_article_exist(aid: int) -> bool:
+    """判断该 Pixivision 特辑是否在数据库中已存在"""
+    return await PixivisionArticle(aid=aid).exist()
 
 
 async def _check_pixivision_new_article() -> list[int]:
     """检查 Pixivision 新特辑(数据库中没有的)"""
     articles_data = await Pixivision.query_illustration_list()
-    check_tasks = [_check_pixivision_article_exist(aid=article.aid) for article in articles_data.illustrations]
-    check_result = await semaphore_gather(tasks=check_tasks, semaphore_num=20, return_exceptions=False)
-
-    new_aid = [x[0] for x in check_result if not x[1]]
+    new_aid = await _seen_article_filter.filter_unseen(
+        ids=(article.aid for article in articles_data.illustrations), exist_checker=_check_pixivision_article_exist)
     return new_aid
 
 
@@ -133,28 +134,38 @@ async def _add_article_into_database(article: Pixivision) -> BoolResult:
         artworks_id=','.join(str(x.artwork_id) for x in article_data.artwork_list),
         url=article.url
     )
+    if not result.error:
+        _seen_article_filter.add(article.aid)
     return result
 
 
-async def _msg_sender(entity: BaseInternalEntity, message: str | Message) -> int:
-    """向 entity 发送消息"""
-    try:
-        msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
-        sent_msg_id = await msg_sender.send_internal_entity_msg(entity=entity, message=message)
-    except KeyError:
-        logger.debug(f'PixivisionArticleUpdateMonitor | Bot({entity.bot_id}) not online, '
-                     f'message to {entity.relation.relation_type.upper()}({entity.entity_id}) has be canceled')
-        sent_msg_id = 0
-    except ActionFailed as e:
-        logger.warning(f'PixivisionArticleUpdateMonitor | Bot({entity.bot_id}) failed to send message to '
-                       f'{entity.relation.relation_type.upper()}({entity.entity_id}) with ActionFailed, {e}')
-        sent_msg_id = 0
-    return sent_msg_id
+async def _update_pixivision_polling_state(
+        sub_source: InternalSubscriptionSource,
+        state: dict[str, str],
+        *,
+        found_new: bool
+) -> None:
+    """按特辑发布频率更新订阅源中记录的检查间隔及最近发布时间"""
+    update_state = _PIXIVISION_POLLING.next_state(state, found_new=found_new)
+    if found_new:
+        update_state.update({'ts': int(time.time())})
+    if update_state:
+        await sub_source.update_state(**update_state)
 
 
 async def send_pixivision_new_article() -> None:
     """向已订阅的用户或群发送 Pixivision 更新的特辑"""
+    sub_source = InternalSubscriptionSource(sub_type=_PIXIVISION_SUB_TYPE, sub_id=_PIXIVISION_SUB_ID)
+    if not await sub_source.exist():
+        await _add_pixivision_sub_source()
+    state = await sub_source.query_state()
+    if not _PIXIVISION_POLLING.is_due(source_id=_PIXIVISION_SUB_ID, state=state):
+        logger.debug('PixivisionArticleUpdateMonitor | Pixivision not reached checking interval, ignore')
+        return
+    _PIXIVISION_POLLING.mark_checked(source_id=_PIXIVISION_SUB_ID)
+
     new_aids = await _check_pixivision_new_article()
+    await _update_pixivision_polling_state(sub_source=sub_source, state=state, found_new=bool(new_aids))
     if new_aids:
         logger.info(f'PixivisionArticleUpdateMonitor | Confirmed pixivision '
                     f'new articles: {", ".join(str(x) for x in new_aids)}')
@@ -172,10 +183,9 @@ async def send_pixivision_new_article() -> None:
     add_artwork_tasks = [_add_article_into_database(article=Pixivision(aid=aid)) for aid in new_aids]
     await semaphore_gather(tasks=add_artwork_tasks, semaphore_num=10, return_exceptions=False)
 
-    # 向订阅者发送新特辑信息
-    send_tasks = [_msg_sender(entity=entity, message=send_message)
-                  for entity in subscribed_entity for send_message in send_messages]
-    await semaphore_gather(tasks=send_tasks, semaphore_num=2, return_exceptions=True)
+    # 向订阅者投递新特辑信息
+    await message_delivery_queue.broadcast(entities=subscribed_entity, messages=send_messages,
+                                           coalesce_key='pixivision')
 
 
 __all__ = [
@@ -8,15 +8,17 @@
 @Software       : PyCharm 
 """
 
+import asyncio
 import ujson as json
+from typing import Literal
 from nonebot import get_driver
 from nonebot.log import logger
 from nonebot.adapters.onebot.v11.bot import Bot
 from nonebot.adapters.onebot.v11.event import MessageEvent
 from nonebot.adapters.onebot.v11.message import Message
 
-from apscheduler.triggers.cron import CronTrigger
-from omega_miya.utils.apscheduler import scheduler
+from omega_miya.utils.apscheduler import scheduler, build_crontab_trigger
+from omega_miya.utils.apscheduler.jobstore import DatabaseJobStore
 
 from omega_miya.result import BoolResult
 from omega_miya.database import InternalBotUser, InternalBotGroup, InternalGuildChannel, AuthSetting, EventEntityHelper
@@ -27,9 +29,18 @@ from omega_miya.utils.message_tools import MessageSender, MessageTools
 from .model import SCHEDULE_MESSAGE_CUSTOM_MODULE_NAME, SCHEDULE_MESSAGE_CUSTOM_PLUGIN_NAME, ScheduleMessageJob
 
 
-@run_async_catching_exception
-async def add_schedule_job(job_data: ScheduleMessageJob) -> None:
-    """添加定时消息的计划任务"""
+_JOB_STORE_NAME: Literal['schedule_message'] = 'schedule_message'
+"""定时消息任务使用的 jobstore 名称"""
+_MISFIRE_GRACE_TIME: int = 60
+"""错过运行时间(如重启期间)后仍然补发定时消息的秒数"""
+
+schedule_message_job_store = DatabaseJobStore(name=_JOB_STORE_NAME)
+"""定时消息任务持久化 jobstore"""
+
+
+async def run_schedule_message_job(job_data: dict) -> None:
+    """执行定时消息任务, 在运行时才获取消息对象, 任务参数只包含可序列化的定时消息配置"""
+    job_data = ScheduleMessageJob.parse_obj(job_data)
     match job_data.entity_type:
         case 'bot_group':
             entity = await InternalBotGroup.init_from_index_id(id_=job_data.entity_index_id)
@@ -39,38 +50,38 @@ async def add_schedule_job(job_data: ScheduleMessageJob) -> None:
             entity = await InternalGuildChannel.init_from_index_id(id_=job_data.entity_index_id)
         case _:
             raise ValueError('invalid job data')
+
+    try:
+        msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
+    except KeyError:
+        logger.debug(f'ScheduleMessageJob | Bot({entity.bot_id}) not online, '
+                     f'ignored schedule message job({job_data.job_name})')
+        return
     send_message = MessageTools.loads(message_data=job_data.message)
+    await msg_sender.send_internal_entity_msg(entity=entity, message=send_message)
 
-    async def _handle_send_message():
-        """执行发送消息的内部函数"""
-        try:
-            msg_sender = MessageSender.init_from_bot_id(bot_id=entity.bot_id)
-        except KeyError:
-            logger.debug(f'ScheduleMessageJob | Bot({entity.bot_id}) not online, '
-                         f'ignored schedule message job({job_data.job_name})')
-            return
-        await msg_sender.send_internal_entity_msg(entity=entity, message=send_message)
-
-    trigger = CronTrigger.from_crontab(job_data.crontab)
-    # 检查有没有同名计划任务
-    exist_job = scheduler.get_job(job_id=job_data.job_name)
-    if exist_job is None:
-        scheduler.add_job(
-            _handle_send_message,
-            trigger=trigger,
-            id=job_data.job_name,
-            coalesce=True,
-            misfire_grace_time=10
-        )
-        logger.success(f'ScheduleMessageJob | Add job({job_data.job_name}) successful')
-    else:
-        exist_job.reschedule(trigger=trigger)
-        logger.success(f'ScheduleMessageJob | Reschedule job({job_data.job_name}) successful')
+
+@run_async_catching_exception
+async def add_schedule_job(job_data: ScheduleMessageJob) -> None:
+    """添加或更新定时消息的计划任务"""
+    scheduler.add_job(
+        run_schedule_message_job,
+        # 加入少量随机延迟, 避免大量定时消息在整分钟同时发送
+        trigger=build_crontab_trigger(job_data.crontab, jitter=5),
+        kwargs={'job_data': job_data.dict()},
+        id=job_data.job_name,
+        jobstore=_JOB_STORE_NAME,
+        replace_existing=True,
+        coalesce=True,
+        max_instances=1,
+        misfire_grace_time=_MISFIRE_GRACE_TIME
+    )
+    logger.success(f'ScheduleMessageJob | Add job({job_data.job_name}) successful')
 
 
 def remove_schedule_job(job_data: ScheduleMessageJob) -> None:
     """移除定时消息的计划任务"""
-    scheduler.remove_job(job_id=job_data.job_name)
+    scheduler.remove_job(job_id=job_data.job_name, jobstore=_JOB_STORE_NAME)
     logger.info(f'ScheduleMessageJob | Remove job({job_data.job_name}) successful')
 
 
@@ -97,16 +108,47 @@ async def generate_schedule_job_data(
     return ScheduleMessageJob.parse_obj(job_data)
 
 
-@get_driver().on_startup
 @run_async_catching_exception
-async def _init_schedule_message_job() -> None:
-    """启动时读取并配置所有定时消息任务"""
+async def _check_schedule_message_job_drift() -> None:
+    """比对数据库中的定时消息配置与 jobstore 中的任务, 补充缺失或已变更的任务并移除已停用的任务"""
     query_jobs_result = await AuthSetting.query_plugin_auth_nodes(module=SCHEDULE_MESSAGE_CUSTOM_MODULE_NAME,
                                                                   plugin=SCHEDULE_MESSAGE_CUSTOM_PLUGIN_NAME)
-    if query_jobs_result.success:
-        add_tasks = [add_schedule_job(job_data=ScheduleMessageJob.parse_obj(json.loads(x.value)))
-                     for x in query_jobs_result.result if x.available == 1]
-        await semaphore_gather(tasks=add_tasks, semaphore_num=10)
+    if query_jobs_result.error:
+        return
+
+    expected_jobs = {
+        job_data.job_name: job_data
+        for job_data in (ScheduleMessageJob.parse_obj(json.loads(x.value))
+                         for x in query_jobs_result.result if x.available == 1)
+    }
+    exist_jobs = {job.id: job for job in scheduler.get_jobs(jobstore=_JOB_STORE_NAME)}
+
+    for job_id in exist_jobs.keys() - expected_jobs.keys():
+        scheduler.remove_job(job_id=job_id, jobstore=_JOB_STORE_NAME)
+    drift_jobs = [job_data for job_name, job_data in expected_jobs.items()
+                  if job_name not in exist_jobs or exist_jobs[job_name].kwargs.get('job_data') != job_data.dict()]
+    await semaphore_gather(tasks=[add_schedule_job(job_data=x) for x in drift_jobs], semaphore_num=10)
+
+    removed_count = len(exist_jobs.keys() - expected_jobs.keys())
+    if drift_jobs or removed_count:
+        logger.info(f'ScheduleMessageJob | Fixed job drift, {len(drift_jobs)} added or updated, '
+                    f'{removed_count} removed')
+
+
+@get_driver().on_startup
+@run_async_catching_exception
+async def _init_schedule_message_job() -> None:
+    """启动时从 jobstore 恢复所有定时消息任务, 并在后台检查与数据库中定时消息配置的差异"""
+    job_count = await schedule_message_job_store.load()
+    scheduler.add_jobstore(schedule_message_job_store, alias=_JOB_STORE_NAME)
+    logger.opt(colors=True).info(f'<lc>ScheduleMessageJob</lc> | Restored {job_count} schedule message job(s)')
+    asyncio.create_task(_check_schedule_message_job_drift())
+
+
+@get_driver().on_shutdown
+async def _wait_schedule_message_job_written() -> None:
+    """等待任务状态写入数据库"""
+    await schedule_message_job_store.wait_written()
 
 
 @run_async_catching_exception
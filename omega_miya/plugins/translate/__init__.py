@@ -84,10 +84,22 @@ async def handle_translate(matcher: Matcher, state: T_State, word: str = ArgStr(
     if not word:
         await matcher.reject(f'你没有发送任何内容呢, 请重新发送你想要翻译的内容:')
 
-    translate_result = await run_async_catching_exception(TencentTMT().translate)(source_text=word,
-                                                                                  source=source, target=target)
+    # 多行内容使用批量翻译逐行翻译, 只翻译非空行, 译文按原来的位置及缩进放回, 保持原有的分行及空行
+    lines = word.splitlines()
+    text_line_index = [i for i, x in enumerate(lines) if x.strip()]
+    if len(text_line_index) > 1:
+        translate_result = await run_async_catching_exception(TencentTMT().translate_batch)(
+            source_text_list=[lines[i].strip() for i in text_line_index], source=source, target=target)
+    else:
+        translate_result = await run_async_catching_exception(TencentTMT().translate)(
+            source_text=word, source=source, target=target)
+
     if isinstance(translate_result, Exception) or translate_result.error:
         logger.error(f'Translate | 翻译失败, {translate_result}')
         await matcher.finish('翻译失败了QAQ, 发生了意外的错误')
+    elif len(text_line_index) > 1:
+        for i, target_text in zip(text_line_index, translate_result.Response.TargetTextList):
+            lines[i] = lines[i][:len(lines[i]) - len(lines[i].lstrip())] + target_text
+        await matcher.finish('翻译结果:\n\n' + '\n'.join(lines))
     else:
         await matcher.finish(f'翻译结果:\n\n{translate_result.Response.TargetText}')
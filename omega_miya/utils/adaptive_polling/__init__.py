@@ -0,0 +1,94 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/27 21:35
+@FileName       : adaptive_polling
+@Project        : nonebot2_miya
+@Description    : 按订阅源更新频率自适应调整检查间隔
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+from typing import Mapping
+
+
+class AdaptivePolling(object):
+    """订阅源自适应检查间隔
+
+    - 检查间隔约为距订阅源上次更新时间的 1/activity_divisor, 限制在 [min_interval, max_interval] 之间
+    - 没有更新时间隔按 growth_rate 逐步增加, 发现更新后立即恢复为最小间隔
+    - 间隔以分钟为单位保存在订阅源状态的 iv 项中, 上次更新时间使用订阅源状态的 ts 项, 上次检查时间只保存在内存中,
+      重启后所有订阅源都会先检查一次
+    """
+
+    def __init__(
+            self,
+            *,
+            min_interval: int,
+            max_interval: int,
+            activity_divisor: float = 8,
+            growth_rate: float = 1.5,
+            tolerance: int = 90
+    ) -> None:
+        """
+        :param min_interval: 最小检查间隔, 单位秒
+        :param max_interval: 最大检查间隔, 单位秒
+        :param activity_divisor: 检查间隔与距上次更新时间的比例
+        :param growth_rate: 没有更新时检查间隔的增长倍数
+        :param tolerance: 判断是否需要检查时允许提前的秒数, 需大于定时任务的 jitter, 避免触发时间抖动导致多等待一个周期
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.activity_divisor = activity_divisor
+        self.growth_rate = growth_rate
+        self.tolerance = tolerance
+        self._last_checked: dict[str, float] = {}
+
+    def get_interval(self, state: Mapping[str, str]) -> int:
+        """从订阅源状态中读取当前检查间隔, 单位秒"""
+        try:
+            interval = int(state['iv']) * 60
+        except (KeyError, ValueError):
+            return self.min_interval
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def is_due(self, source_id: str, state: Mapping[str, str]) -> bool:
+        """订阅源是否需要检查"""
+        last_checked = self._last_checked.get(source_id)
+        if last_checked is None:
+            return True
+        return time.time() - last_checked >= self.get_interval(state) - self.tolerance
+
+    def mark_checked(self, source_id: str) -> None:
+        """记录订阅源的检查时间"""
+        self._last_checked[source_id] = time.time()
+
+    def discard(self, source_id: str) -> None:
+        """移除已取消的订阅源"""
+        self._last_checked.pop(source_id, None)
+
+    def next_interval(self, state: Mapping[str, str], *, found_new: bool) -> int:
+        """根据本次检查结果计算下一次检查间隔, 单位秒"""
+        if found_new:
+            return self.min_interval
+
+        try:
+            since_last_update = time.time() - int(state['ts'])
+            target_interval = since_last_update / self.activity_divisor
+        except (KeyError, ValueError):
+            target_interval = self.max_interval
+
+        interval = min(self.get_interval(state) * self.growth_rate, target_interval)
+        return int(min(max(interval, self.min_interval), self.max_interval))
+
+    def next_state(self, state: Mapping[str, str], *, found_new: bool) -> dict[str, int]:
+        """计算需要更新到订阅源状态中的检查间隔, 没有变化时返回空字典"""
+        interval_minutes = self.next_interval(state, found_new=found_new) // 60
+        if state.get('iv') == str(interval_minutes):
+            return {}
+        return {'iv': interval_minutes}
+
+
+__all__ = [
+    'AdaptivePolling'
+]
@@ -1,16 +1,20 @@
 import logging
+from typing import Any, Awaitable, Callable, Literal
 
+from apscheduler.job import Job
+from apscheduler.util import undefined
 from nonebot import get_driver
 from nonebot.log import logger, LoguruHandler
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from .config import Config
-from .utils import reschedule_job
+from .utils import build_trigger, build_crontab_trigger, reschedule_job, MonitoredJob
 
 driver = get_driver()
 plugin_config = Config.parse_obj(driver.config)
 
 scheduler: AsyncIOScheduler = AsyncIOScheduler()
+_monitored_jobs: dict[str, MonitoredJob] = {}
 
 
 async def _start_scheduler():
@@ -23,6 +27,47 @@ async def _start_scheduler():
 if plugin_config.apscheduler_autostart:
     driver.on_startup(_start_scheduler)
 
+
+def add_monitored_job(
+        func: Callable[[], Awaitable[Any]],
+        trigger_mode: Literal['cron', 'interval'],
+        *,
+        id: str,
+        jitter: int | None = None,
+        adaptive: bool = True,
+        misfire_grace_time: int | None = undefined,
+        **trigger_args: Any
+) -> Job:
+    """添加单实例运行、带随机延迟及运行统计的计划任务
+
+    :param func: 任务函数
+    :param trigger_mode: 触发器类型
+    :param id: 任务 ID
+    :param jitter: 每次触发随机延迟的最大秒数, 避免各任务在同一时刻触发
+    :param adaptive: 运行耗时持续超过触发间隔时是否自动放慢运行频率
+    :param misfire_grace_time: 错过触发时间后仍允许运行的秒数
+    :param trigger_args: 触发器参数
+    """
+    monitored_job = MonitoredJob(func=func, job_id=id, adaptive=adaptive)
+    _monitored_jobs[id] = monitored_job
+    # 单实例运行由 MonitoredJob 自身保证, 这里需要允许第二个实例被触发,
+    # 否则 apscheduler 会在上一次运行未结束时直接丢弃触发, 任务无法记录跳过次数及实际触发间隔
+    return scheduler.add_job(
+        monitored_job.run,
+        trigger=build_trigger(trigger_mode, jitter=jitter, **trigger_args),
+        id=id,
+        coalesce=True,
+        max_instances=2,
+        misfire_grace_time=misfire_grace_time,
+        replace_existing=True
+    )
+
+
+def get_monitored_job(job_id: str) -> MonitoredJob | None:
+    """获取计划任务包装, 用于查看运行统计"""
+    return _monitored_jobs.get(job_id)
+
+
 aps_logger = logging.getLogger("apscheduler")
 aps_logger.setLevel(plugin_config.apscheduler_log_level)
 aps_logger.handlers.clear()
@@ -31,5 +76,9 @@ aps_logger.addHandler(LoguruHandler())
 
 __all__ = [
     'scheduler',
-    'reschedule_job'
+    'add_monitored_job',
+    'get_monitored_job',
+    'build_crontab_trigger',
+    'reschedule_job',
+    'MonitoredJob'
 ]
@@ -0,0 +1,133 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/26 20:40
+@FileName       : jobstore.py
+@Project        : nonebot2_miya
+@Description    : 基于数据库的 apscheduler jobstore
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import pickle
+import asyncio
+from typing import Any
+
+from nonebot.log import logger
+from apscheduler.job import Job
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.util import datetime_to_utc_timestamp
+
+from omega_miya.database import ScheduleJob
+
+
+class DatabaseJobStore(MemoryJobStore):
+    """基于数据库的 jobstore
+
+    - 任务及按下次运行时间排序的索引保存在内存中, 调度器的查询不访问数据库
+    - 新增、更新、删除任务时只将该任务的变化异步写入数据库, 写入按调用顺序依次执行
+    - 启动时一次性读取 jobstore 中全部任务的序列化状态并恢复, 不需要重新构造任务,
+      停机期间错过的运行由任务自身的 misfire_grace_time 及 coalesce 处理
+    - 任务函数必须是可以通过模块路径引用的函数, 参数必须可以被 pickle 序列化
+    """
+
+    def __init__(self, name: str, pickle_protocol: int = pickle.HIGHEST_PROTOCOL) -> None:
+        """
+        :param name: jobstore 名称, 数据库中按此名称区分不同 jobstore 的任务
+        :param pickle_protocol: 任务状态序列化使用的 pickle 协议
+        """
+        super().__init__()
+        self.name = name
+        self.pickle_protocol = pickle_protocol
+        self._loaded_states: list[dict[str, Any]] = []
+        self._write_lock = asyncio.Lock()
+        self._write_tasks: set[asyncio.Task] = set()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}(name={self.name!r})>'
+
+    async def load(self) -> int:
+        """从数据库读取全部任务状态, 在 jobstore 被添加到调度器时恢复
+
+        :return: 读取的任务数量
+        """
+        query_result = await ScheduleJob.query_all_by_job_store(job_store=self.name)
+        for job_data in query_result.result:
+            try:
+                self._loaded_states.append(pickle.loads(job_data.job_state))
+            except Exception as e:
+                logger.error(f'DatabaseJobStore | {self.name} unable to restore job({job_data.job_id}), {e}')
+        return len(self._loaded_states)
+
+    def start(self, scheduler, alias) -> None:
+        super().start(scheduler, alias)
+        for state in self._loaded_states:
+            job = self._reconstitute_job(state)
+            # 直接写入内存索引, 不需要再次写入数据库
+            if job.id not in self._jobs_index:
+                super().add_job(job)
+        self._loaded_states.clear()
+
+    def _reconstitute_job(self, state: dict[str, Any]) -> Job:
+        job = Job.__new__(Job)
+        job.__setstate__(state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _schedule_write(self, job_id: str, job_state: bytes | None, next_run_time: float | None = None) -> None:
+        """异步写入单个任务的变化, job_state 为 None 时删除该任务"""
+        async def _write() -> None:
+            async with self._write_lock:
+                try:
+                    if job_state is None:
+                        result = await ScheduleJob(job_id=job_id).delete_unique_self()
+                    else:
+                        result = await ScheduleJob(job_id=job_id).add_upgrade_unique_self(
+                            job_store=self.name, next_run_time=next_run_time, job_state=job_state)
+                except Exception as e:
+                    logger.error(f'DatabaseJobStore | {self.name} writing job({job_id}) failed, {e}')
+                    return
+            if result.error:
+                logger.error(f'DatabaseJobStore | {self.name} writing job({job_id}) failed, {result.info}')
+
+        task = asyncio.get_running_loop().create_task(_write())
+        self._write_tasks.add(task)
+        task.add_done_callback(self._write_tasks.discard)
+
+    def _write_job(self, job: Job) -> None:
+        # 在调用处序列化, 任务无法序列化时直接向添加任务的一方抛出异常
+        job_state = pickle.dumps(job.__getstate__(), self.pickle_protocol)
+        self._schedule_write(job_id=job.id, job_state=job_state,
+                             next_run_time=datetime_to_utc_timestamp(job.next_run_time))
+
+    def add_job(self, job: Job) -> None:
+        super().add_job(job)
+        self._write_job(job)
+
+    def update_job(self, job: Job) -> None:
+        super().update_job(job)
+        self._write_job(job)
+
+    def remove_job(self, job_id: str) -> None:
+        super().remove_job(job_id)
+        self._schedule_write(job_id=job_id, job_state=None)
+
+    def remove_all_jobs(self) -> None:
+        job_ids = list(self._jobs_index.keys())
+        super().remove_all_jobs()
+        for job_id in job_ids:
+            self._schedule_write(job_id=job_id, job_state=None)
+
+    def shutdown(self) -> None:
+        # 关闭时只清理内存中的任务, 数据库中的任务需要在下次启动时恢复
+        super().remove_all_jobs()
+
+    async def wait_written(self) -> None:
+        """等待所有未完成的写入"""
+        if self._write_tasks:
+            await asyncio.gather(*self._write_tasks, return_exceptions=True)
+
+
+__all__ = [
+    'DatabaseJobStore'
+]
@@ -8,15 +8,30 @@
 @Software       : PyCharm 
 """
 
-from typing import Literal, Any
+import math
+import time
+from dataclasses import dataclass
+from typing import Literal, Any, Awaitable, Callable
+from nonebot.log import logger
 from apscheduler.job import Job
+from apscheduler.triggers.base import BaseTrigger
 from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
 
-def reschedule_job(job: Job, trigger_mode: Literal['date', 'cron', 'interval'], **trigger_args: Any) -> Job:
-    """为计划任务构造新的触发器并更新其下一次运行时间"""
+_STATS_SMOOTHING: float = 0.3
+"""运行耗时及触发间隔的指数平滑系数"""
+
+_SLOW_RUN_THRESHOLD: int = 3
+"""连续多少次运行耗时超过触发间隔后放慢运行频率"""
+
+_MAX_INTERVAL_FACTOR: int = 8
+"""运行频率最多放慢的倍数"""
+
+
+def build_trigger(trigger_mode: Literal['date', 'cron', 'interval'], **trigger_args: Any) -> BaseTrigger:
+    """构造触发器"""
     match trigger_mode:
         case 'date':
             trigger = DateTrigger(**trigger_args)
@@ -26,11 +41,110 @@ def reschedule_job(job: Job, trigger_mode: Literal['date', 'cron', 'interval'],
             trigger = IntervalTrigger(**trigger_args)
         case _:
             raise ValueError('Invalid trigger_mode')
+    return trigger
+
 
-    rescheduled_job = job.reschedule(trigger=trigger)
+def build_crontab_trigger(expr: str, *, jitter: int | None = None, timezone: Any = None) -> CronTrigger:
+    """由 crontab 表达式构造触发器, 与 CronTrigger.from_crontab 相同但支持 jitter"""
+    values = expr.split()
+    if len(values) != 5:
+        raise ValueError(f'Wrong number of fields; got {len(values)}, expected 5')
+    minute, hour, day, month, day_of_week = values
+    return CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week,
+                       jitter=jitter, timezone=timezone)
+
+
+def reschedule_job(job: Job, trigger_mode: Literal['date', 'cron', 'interval'], **trigger_args: Any) -> Job:
+    """为计划任务构造新的触发器并更新其下一次运行时间"""
+    rescheduled_job = job.reschedule(trigger=build_trigger(trigger_mode, **trigger_args))
     return rescheduled_job
 
 
+@dataclass
+class JobRunningStats:
+    """计划任务运行统计"""
+    run_count: int = 0
+    skip_count: int = 0
+    last_duration: float = 0
+    average_duration: float = 0
+    average_period: float = 0
+    slow_run_count: int = 0
+    interval_factor: int = 1
+
+
+class MonitoredJob(object):
+    """计划任务包装
+
+    - 同一时间只允许一个实例运行, 上一次运行未结束时直接跳过本次触发
+    - 记录运行耗时及实际触发间隔
+    - 运行耗时连续超过触发间隔时按倍数跳过触发以放慢运行频率, 耗时恢复后逐步恢复
+    """
+
+    def __init__(self, func: Callable[[], Awaitable[Any]], job_id: str, *, adaptive: bool = True) -> None:
+        self.func = func
+        self.job_id = job_id
+        self.adaptive = adaptive
+        self.stats = JobRunningStats()
+        self._running: bool = False
+        self._last_fired_at: float | None = None
+        self._next_allowed_at: float = 0
+
+    def _smooth(self, average: float, value: float) -> float:
+        return value if average == 0 else average + _STATS_SMOOTHING * (value - average)
+
+    def _record_fired(self, now: float) -> None:
+        if self._last_fired_at is not None:
+            self.stats.average_period = self._smooth(self.stats.average_period, now - self._last_fired_at)
+        self._last_fired_at = now
+
+    def _update_interval_factor(self) -> None:
+        period = self.stats.average_period
+        if not self.adaptive or period <= 0:
+            return
+
+        if self.stats.last_duration > period:
+            self.stats.slow_run_count += 1
+        else:
+            self.stats.slow_run_count = 0
+
+        if self.stats.slow_run_count >= _SLOW_RUN_THRESHOLD:
+            factor = min(math.ceil(self.stats.average_duration / period) + 1, _MAX_INTERVAL_FACTOR)
+            if factor > self.stats.interval_factor:
+                logger.warning(f'MonitoredJob | Job({self.job_id}) running {self.stats.average_duration:.1f}s '
+                               f'exceeds its period {period:.1f}s, slow down to 1/{factor} frequency')
+            self.stats.interval_factor = max(factor, self.stats.interval_factor)
+        elif self.stats.average_duration < period * (self.stats.interval_factor - 1) / 2:
+            self.stats.interval_factor = max(self.stats.interval_factor - 1, 1)
+
+        # 留出半个周期的余量避免触发时间抖动导致多跳过一次
+        self._next_allowed_at = time.monotonic() + period * (self.stats.interval_factor - 1.5)
+
+    async def run(self) -> None:
+        """执行一次任务, 注册计划任务时应传入此方法, apscheduler 不会将定义了异步 __call__ 的对象识别为协程函数"""
+        now = time.monotonic()
+        self._record_fired(now=now)
+        if self._running or now < self._next_allowed_at:
+            self.stats.skip_count += 1
+            logger.debug(f'MonitoredJob | Job({self.job_id}) skipped, '
+                         f'{"previous run not finished" if self._running else "slowed down"}')
+            return
+
+        self._running = True
+        try:
+            await self.func()
+        finally:
+            self._running = False
+            self.stats.run_count += 1
+            self.stats.last_duration = time.monotonic() - now
+            self.stats.average_duration = self._smooth(self.stats.average_duration, self.stats.last_duration)
+            self._update_interval_factor()
+            logger.debug(f'MonitoredJob | Job({self.job_id}) finished in {self.stats.last_duration:.2f}s')
+
+
 __all__ = [
-    'reschedule_job'
+    'build_trigger',
+    'build_crontab_trigger',
+    'reschedule_job',
+    'JobRunningStats',
+    'MonitoredJob'
 ]
@@ -11,11 +11,21 @@
 from .model import PreviewImageThumbs, PreviewImageModel
 from .image_util import ImageUtils
 from .helper import generate_thumbs_preview_image
+from .variant_cache import ImageOperation, image_variant_cache
+from .image_hash import BKTree, image_hash, image_hash_files, hamming_distance
+from .ugoira import encode_ugoira_frames
 
 
 __all__ = [
     'PreviewImageThumbs',
     'PreviewImageModel',
     'ImageUtils',
-    'generate_thumbs_preview_image'
+    'generate_thumbs_preview_image',
+    'ImageOperation',
+    'image_variant_cache',
+    'BKTree',
+    'image_hash',
+    'image_hash_files',
+    'hamming_distance',
+    'encode_ugoira_frames'
 ]
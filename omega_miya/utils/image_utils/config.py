@@ -18,6 +18,10 @@ class ImageUtilsConfig:
     # 默认的生成缓存文件路径
     default_save_folder: TmpResource = TmpResource('image_utils')
     default_preview_img_folder: TmpResource = default_save_folder('preview')
+    # 图片处理结果缓存
+    default_variant_cache_folder: TmpResource = default_save_folder('variant')
+    default_variant_cache_max_size: int = 1024 * 1024 * 1024  # 处理结果缓存占用磁盘空间上限
+    default_variant_cache_max_entries: int = 8192  # 处理结果缓存文件数量上限
 
     # 默认内置的静态资源文件路径
     default_font_name: str = 'SourceHanSansSC-Regular.otf'
@@ -8,6 +8,7 @@
 @Software       : PyCharm 
 """
 
+import asyncio
 from math import ceil
 from io import BytesIO
 from datetime import datetime
@@ -47,7 +48,18 @@ async def generate_thumbs_preview_image(
     preview_name = preview.preview_name
     previews = preview.previews[:limit]
 
-    def _handle_preview_image() -> bytes:
+    def _load_thumb_image(content: bytes) -> Image.Image:
+        """解码并调整单个缩略图大小, JPEG 图片直接以接近缩略图的尺寸解码"""
+        _thumb_img = ImageUtils.init_from_bytes(image=content, draft_size=preview_size).image
+
+        # 调整图片大小
+        if hold_ratio:
+            _thumb_img = ImageUtils(image=_thumb_img).resize_with_filling(preview_size).image
+        if _thumb_img.size != preview_size:
+            _thumb_img = _thumb_img.resize(preview_size, Image.ANTIALIAS)
+        return _thumb_img
+
+    def _handle_preview_image(thumb_images: list[Image.Image]) -> bytes:
         """用于图像生成处理的内部函数"""
         _thumb_w, _thumb_h = preview_size
         _font_path = font_path.resolve_path
@@ -97,17 +109,7 @@ async def generate_thumbs_preview_image(
 
         # 处理拼图
         _line = 0
-        for _index, _preview in enumerate(previews):
-            with BytesIO(_preview.preview_thumb) as bf:
-                _thumb_img: Image.Image = Image.open(bf)
-                _thumb_img.load()
-
-            # 调整图片大小
-            if hold_ratio:
-                _thumb_img = ImageUtils(image=_thumb_img).resize_with_filling(preview_size).image
-            if _thumb_img.size != preview_size:
-                _thumb_img = _thumb_img.resize(preview_size, Image.ANTIALIAS)
-
+        for _index, (_preview, _thumb_img) in enumerate(zip(previews, thumb_images)):
             # 确认缩略图单行位置
             seq = _index % num_of_line
             # 能被整除说明在行首要换行
@@ -134,7 +136,9 @@ async def generate_thumbs_preview_image(
             _content = _bf.getvalue()
         return _content
 
-    image_content = await run_sync(_handle_preview_image)()
+    # 各缩略图的解码及缩放在线程池中并行处理, 最后统一拼接
+    thumbs = await asyncio.gather(*(run_sync(_load_thumb_image)(content=x.preview_thumb) for x in previews))
+    image_content = await run_sync(_handle_preview_image)(thumb_images=list(thumbs))
     image_file_name = f"preview_{preview_name}_{datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.jpg"
     save_file = output_folder(image_file_name)
     async with save_file.async_open('wb') as af:
@@ -0,0 +1,152 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/22 20:47
+@FileName       : image_hash.py
+@Project        : nonebot2_miya
+@Description    : 图片感知哈希 (pHash/dHash) 及基于汉明距离的 BK 树检索
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import numpy
+from io import BytesIO
+from pathlib import Path
+from PIL import Image
+from typing import Iterator, Literal
+
+
+_PHASH_IMAGE_SIZE: int = 32
+"""计算 pHash 时缩放的图片尺寸"""
+
+_HASH_SIZE: int = 8
+"""哈希矩阵边长, 生成 64 位哈希"""
+
+
+def _dct_matrix(size: int) -> numpy.ndarray:
+    """生成 DCT-II 变换矩阵"""
+    index = numpy.arange(size)
+    matrix = numpy.cos(numpy.pi * (2 * index[None, :] + 1) * index[:, None] / (2 * size))
+    matrix[0, :] *= numpy.sqrt(1 / size)
+    matrix[1:, :] *= numpy.sqrt(2 / size)
+    return matrix
+
+
+_DCT_MATRIX: numpy.ndarray = _dct_matrix(_PHASH_IMAGE_SIZE)
+
+
+def _bits_to_int(bits: numpy.ndarray) -> int:
+    return int.from_bytes(numpy.packbits(bits.flatten()).tobytes(), byteorder='big')
+
+
+def _load_gray_image(image: Image.Image | bytes | Path, size: tuple[int, int]) -> Image.Image:
+    """读取图片并转换为指定尺寸的灰度图, 对 JPEG 使用 draft 模式加速解码"""
+    if not isinstance(image, Image.Image):
+        image = Image.open(BytesIO(image) if isinstance(image, bytes) else image)
+        image.draft('L', (size[0] * 4, size[1] * 4))
+    return image.convert('L').resize(size, Image.ANTIALIAS)
+
+
+def phash(image: Image.Image | bytes | Path) -> int:
+    """计算图片的 64 位 pHash, 对缩放及轻微压缩、调色不敏感"""
+    pixels = numpy.asarray(_load_gray_image(image, (_PHASH_IMAGE_SIZE, _PHASH_IMAGE_SIZE)), dtype=numpy.float64)
+    dct = _DCT_MATRIX @ pixels @ _DCT_MATRIX.T
+    low_freq = dct[:_HASH_SIZE, :_HASH_SIZE]
+    return _bits_to_int(low_freq > numpy.median(low_freq))
+
+
+def dhash(image: Image.Image | bytes | Path) -> int:
+    """计算图片的 64 位 dHash, 计算速度快, 适合检测重复图片"""
+    pixels = numpy.asarray(_load_gray_image(image, (_HASH_SIZE + 1, _HASH_SIZE)), dtype=numpy.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def image_hash(image: Image.Image | bytes | Path, *, method: Literal['phash', 'dhash'] = 'phash') -> int:
+    """计算图片感知哈希"""
+    return phash(image) if method == 'phash' else dhash(image)
+
+
+def image_hash_files(
+        file_paths: list[str],
+        *,
+        method: Literal['phash', 'dhash'] = 'phash',
+        invalid_hash: int = -1
+) -> list[int]:
+    """批量计算图片文件的感知哈希, CPU 密集, 可使用 run_sync_in_process 在进程池中运行
+
+    :param file_paths: 图片文件路径列表
+    :param method: 哈希算法
+    :param invalid_hash: 无法读取的文件返回的哈希值
+    """
+    hashes = []
+    for file_path in file_paths:
+        try:
+            hashes.append(image_hash(Path(file_path), method=method))
+        except Exception:
+            hashes.append(invalid_hash)
+    return hashes
+
+
+def hamming_distance(hash_a: int, hash_b: int) -> int:
+    return (hash_a ^ hash_b).bit_count()
+
+
+class BKTree(object):
+    """以汉明距离为度量的 BK 树, 用于检索距离在阈值内的哈希值
+
+    每个节点为 [哈希值, {距离: 子节点}], 同一哈希值只保存一次, 哈希值对应的条目由调用方自行维护
+    """
+
+    def __init__(self) -> None:
+        self._root: list | None = None
+        self._size: int = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_: int) -> None:
+        if self._root is None:
+            self._root = [hash_, {}]
+            self._size = 1
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [hash_, {}]
+                self._size += 1
+                return
+            node = child
+
+    def search(self, hash_: int, max_distance: int) -> Iterator[tuple[int, int]]:
+        """检索与目标哈希距离不超过 max_distance 的哈希值
+
+        :return: (哈希值, 距离) 迭代器, 不保证顺序
+        """
+        if self._root is None:
+            return
+
+        candidates = [self._root]
+        while candidates:
+            node_hash, children = candidates.pop()
+            distance = hamming_distance(hash_, node_hash)
+            if distance <= max_distance:
+                yield node_hash, distance
+            # 三角不等式, 只有距离在 [d - max, d + max] 内的子树可能存在结果
+            candidates.extend(
+                child for child_distance, child in children.items()
+                if distance - max_distance <= child_distance <= distance + max_distance
+            )
+
+
+__all__ = [
+    'phash',
+    'dhash',
+    'image_hash',
+    'image_hash_files',
+    'hamming_distance',
+    'BKTree'
+]
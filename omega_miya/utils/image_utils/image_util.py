@@ -16,7 +16,6 @@ from io import BytesIO
 from PIL import Image, ImageFilter, ImageEnhance, ImageDraw, ImageFont
 
 from omega_miya.local_resource import LocalResource, TmpResource
-from omega_miya.web_resource import HttpFetcher
 
 from .config import image_utils_config
 
@@ -26,9 +25,16 @@ class ImageUtils(object):
         self._image = image
 
     @classmethod
-    def init_from_bytes(cls, image: bytes) -> "ImageUtils":
+    def init_from_bytes(cls, image: bytes, *, draft_size: tuple[int, int] | None = None) -> "ImageUtils":
+        """从 bytes 初始化
+
+        :param image: 图片内容
+        :param draft_size: 仅需要缩略图时指定, 对 JPEG 图片在解码时直接按比例缩小到不小于该尺寸, 大幅降低解码耗时及内存占用
+        """
         with BytesIO(image) as bf:
             image: Image.Image = Image.open(bf)
+            if draft_size is not None:
+                image.draft('RGB', draft_size)
             image.load()
             new_obj = cls(image=image)
         return new_obj
@@ -43,6 +49,9 @@ class ImageUtils(object):
 
     @classmethod
     async def init_from_url(cls, image_url: str) -> "ImageUtils":
+        # 在使用时才导入, 本模块需要可以在进程池子进程中 (未初始化 nonebot) 导入
+        from omega_miya.web_resource import HttpFetcher
+
         fetcher = HttpFetcher(timeout=30)
         image_result = await fetcher.get_bytes(url=image_url)
         with BytesIO(image_result.result) as bf:
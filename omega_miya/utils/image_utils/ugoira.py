@@ -0,0 +1,62 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/30 21:16
+@FileName       : ugoira.py
+@Project        : nonebot2_miya
+@Description    : 动图帧编码, 在进程池子进程中运行, 本模块不能依赖 nonebot driver
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import zipfile
+from io import BytesIO
+from typing import Literal, Generator
+from PIL import Image
+
+
+def encode_ugoira_frames(
+        ugoira_path: str,
+        frames: list[tuple[str, int]],
+        *,
+        format_: Literal['gif', 'webp'] = 'gif',
+        quality: int = 80
+) -> bytes:
+    """将动图 zip 资源编码为 gif/webp 动图, 保留每一帧各自的延迟
+
+    帧按需从 zip 中读取解码, 但 Pillow 的 save_all 在编码时 (gif 需要比较前后帧, webp 会先转为列表) 仍会持有全部帧,
+    内存占用与帧数成正比; CPU 密集, 应使用 run_sync_in_process 在进程池中运行
+
+    :param ugoira_path: 动图 zip 资源文件路径
+    :param frames: 帧信息列表, (帧文件名, 帧延迟毫秒数)
+    :param format_: 输出格式, webp 体积更小且编码更快
+    :param quality: webp 编码质量
+    """
+
+    with zipfile.ZipFile(ugoira_path, 'r') as zf:
+        def _load_frame(frame_file: str) -> Image.Image:
+            with zf.open(frame_file, 'r') as f:
+                frame_image = Image.open(f)
+                frame_image.load()
+            return frame_image.convert('RGB')
+
+        def _iter_frames() -> Generator[Image.Image, None, None]:
+            for frame_file, _ in frames[1:]:
+                yield _load_frame(frame_file)
+
+        first_frame = _load_frame(frames[0][0])
+        durations = [delay for _, delay in frames]
+
+        with BytesIO() as bf:
+            if format_ == 'webp':
+                first_frame.save(bf, format='WEBP', save_all=True, append_images=_iter_frames(),
+                                 duration=durations, loop=0, quality=quality, method=4)
+            else:
+                first_frame.save(bf, format='GIF', save_all=True, append_images=_iter_frames(),
+                                 duration=durations, loop=0)
+            content = bf.getvalue()
+    return content
+
+
+__all__ = [
+    'encode_ugoira_frames'
+]
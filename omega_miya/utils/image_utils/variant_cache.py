@@ -0,0 +1,193 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/19 20:36
+@FileName       : variant_cache.py
+@Project        : nonebot2_miya
+@Description    : 图片处理结果缓存, 以原图内容 hash 及处理操作序列为 key
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import asyncio
+import hashlib
+import tempfile
+import ujson as json
+from collections import OrderedDict
+from typing import Any, Literal, Sequence
+
+from nonebot import logger
+
+from omega_miya.local_resource import LocalResource, TmpResource
+from omega_miya.utils.process_utils import run_sync
+
+from .config import image_utils_config
+from .image_util import ImageUtils
+
+
+ImageOperation = tuple[Literal['gaussian_blur', 'gaussian_noise', 'mark', 'resize_with_filling'], dict[str, Any]]
+"""图片处理操作, (ImageUtils 方法名, 参数), 如: ('gaussian_noise', {'sigma': 16})"""
+
+_ALLOWED_OPERATIONS: set[str] = {'gaussian_blur', 'gaussian_noise', 'mark', 'resize_with_filling'}
+
+_SOURCE_HASH_CACHE_SIZE: int = 1024
+"""原图文件内容 hash 的缓存数量上限"""
+
+_TMP_FILE_SUFFIX: str = '.tmp'
+"""写入中的缓存文件后缀"""
+
+
+class ImageVariantCache(object):
+    """图片处理结果缓存
+
+    以原图内容 hash 和规范化后的处理操作序列作为 key, 相同的处理请求直接复用磁盘上的处理结果,
+    按 LRU 淘汰, 受文件数量及磁盘空间上限限制
+    """
+    _cache_folder: TmpResource = image_utils_config.default_variant_cache_folder
+    _max_size: int = image_utils_config.default_variant_cache_max_size
+    _max_entries: int = image_utils_config.default_variant_cache_max_entries
+
+    def __init__(self) -> None:
+        self._index: OrderedDict[str, int] | None = None
+        self._total_size: int = 0
+        self._source_hash: OrderedDict[tuple[str, float, int], str] = OrderedDict()  # (路径, 修改时间, 大小) -> 内容 hash
+        self._generating_tasks: dict[str, asyncio.Task[TmpResource]] = {}  # 正在生成的处理结果, 避免重复处理
+
+    @staticmethod
+    def normalize_operations(operations: Sequence[ImageOperation]) -> str:
+        """将处理操作序列规范化为字符串, 参数顺序不影响结果"""
+        for name, _ in operations:
+            if name not in _ALLOWED_OPERATIONS:
+                raise ValueError(f'Unsupported image operation: {name}')
+        return json.dumps([[name, dict(sorted(kwargs.items()))] for name, kwargs in operations], ensure_ascii=False)
+
+    def _get_source_hash(self, source: LocalResource | bytes) -> str:
+        """计算原图内容 hash, 对文件按路径、修改时间及大小缓存计算结果"""
+        if isinstance(source, bytes):
+            return hashlib.sha256(source).hexdigest()
+
+        stat = source.path.stat()
+        source_key = (source.resolve_path, stat.st_mtime, stat.st_size)
+        if source_key in self._source_hash:
+            self._source_hash.move_to_end(source_key)
+            return self._source_hash[source_key]
+
+        with source.open('rb') as f:
+            source_hash = hashlib.sha256(f.read()).hexdigest()
+        self._source_hash[source_key] = source_hash
+        while len(self._source_hash) > _SOURCE_HASH_CACHE_SIZE:
+            self._source_hash.popitem(last=False)
+        return source_hash
+
+    def _load_index(self) -> OrderedDict[str, int]:
+        """扫描缓存文件夹, 按修改时间恢复 LRU 顺序"""
+        index = OrderedDict()
+        if not self._cache_folder.is_dir:
+            return index
+        with os.scandir(self._cache_folder.path) as it:
+            files = sorted(((x.name, x.stat()) for x in it if x.is_file() and not x.name.endswith(_TMP_FILE_SUFFIX)),
+                           key=lambda x: x[1].st_mtime)
+        for name, stat in files:
+            index[name] = stat.st_size
+        return index
+
+    def _evict(self) -> None:
+        while self._index and (len(self._index) > self._max_entries or self._total_size > self._max_size):
+            name, size = self._index.popitem(last=False)
+            self._total_size -= size
+            self._cache_folder(name).path.unlink(missing_ok=True)
+
+    def _generate(
+            self,
+            source: LocalResource | bytes,
+            operations: Sequence[ImageOperation],
+            format_: str,
+            file: TmpResource
+    ) -> int:
+        """执行图片处理并写入缓存文件, 返回文件大小"""
+        if isinstance(source, bytes):
+            image = ImageUtils.init_from_bytes(image=source)
+        else:
+            image = ImageUtils.init_from_file(file=source)
+        for name, kwargs in operations:
+            getattr(image, name)(**kwargs)
+        # ImageUtils.image 会复制一份图片, 这里只需要读取模式
+        if format_.upper() == 'JPEG' and image._image.mode != 'RGB':
+            image = ImageUtils(image=image._image.convert('RGB'))
+        content = image.get_bytes(format_=format_)
+
+        # 使用唯一的临时文件名写入后再替换, 避免多个进程同时写入同一个临时文件
+        file.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=file.path.parent, suffix=_TMP_FILE_SUFFIX, delete=False) as f:
+            tmp_path = f.name
+            f.write(content)
+        try:
+            os.replace(tmp_path, file.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return len(content)
+
+    async def _add_variant(
+            self,
+            source: LocalResource | bytes,
+            operations: Sequence[ImageOperation],
+            format_: str,
+            file: TmpResource
+    ) -> TmpResource:
+        """生成处理结果并加入缓存索引"""
+        size = await run_sync(self._generate)(source=source, operations=operations, format_=format_, file=file)
+        self._index[file.path.name] = size
+        self._total_size += size
+        try:
+            self._evict()
+        except Exception as e:
+            logger.warning(f'ImageVariantCache | Evicting variant cache failed, {e}')
+        return file
+
+    async def get_variant(
+            self,
+            source: LocalResource | bytes,
+            operations: Sequence[ImageOperation],
+            *,
+            format_: Literal['JPEG', 'PNG', 'WEBP'] = 'JPEG'
+    ) -> TmpResource:
+        """获取图片处理结果, 已有相同处理结果时直接返回缓存文件
+
+        :param source: 原图文件或内容
+        :param operations: 处理操作序列, 按顺序执行, 如: [('gaussian_noise', {'sigma': 16}), ('mark', {'text': 'xxx'})]
+        :param format_: 输出格式
+        :return: 处理结果文件
+        """
+        if self._index is None:
+            self._index = await run_sync(self._load_index)()
+            self._total_size = sum(self._index.values())
+
+        source_hash = await run_sync(self._get_source_hash)(source=source)
+        operations_key = self.normalize_operations(operations=operations)
+        variant_key = hashlib.sha1(f'{source_hash}|{operations_key}|{format_}'.encode(encoding='utf8')).hexdigest()
+        variant_name = f'{variant_key}.{format_.lower()}'
+        variant_file = self._cache_folder(variant_name)
+
+        if variant_name in self._index:
+            if variant_file.is_file:
+                self._index.move_to_end(variant_name)
+                return variant_file
+            self._total_size -= self._index.pop(variant_name)
+
+        task = self._generating_tasks.get(variant_name)
+        if task is None:
+            task = asyncio.create_task(self._add_variant(
+                source=source, operations=operations, format_=format_, file=variant_file))
+            self._generating_tasks[variant_name] = task
+            task.add_done_callback(lambda _: self._generating_tasks.pop(variant_name, None))
+        return await asyncio.shield(task)
+
+
+image_variant_cache = ImageVariantCache()
+
+
+__all__ = [
+    'ImageOperation',
+    'image_variant_cache'
+]
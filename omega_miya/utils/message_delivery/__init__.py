@@ -0,0 +1,332 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/24 19:32
+@FileName       : message_delivery
+@Project        : nonebot2_miya
+@Description    : 订阅消息投递队列, 按 bot 限速、按会话保序, 失败重试并持久化
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+import asyncio
+import ujson as json
+from collections import deque
+from dataclasses import dataclass, field, asdict
+from typing import Iterable
+
+from nonebot import get_driver
+from nonebot.log import logger
+from nonebot.adapters.onebot.v11.bot import Bot
+from nonebot.adapters.onebot.v11.message import Message, MessageSegment
+
+from omega_miya.database.internal.entity import BaseInternalEntity
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.message_tools import MessageSender, MessageTools
+
+from .media_staging import media_staging
+
+
+_PENDING_FILE: TmpResource = TmpResource('message_delivery', 'pending.json')
+"""未完成投递的消息持久化文件"""
+
+_SEND_RATE: float = 0.5
+"""每个 bot 平均每秒发送的消息数"""
+
+_SEND_BURST: int = 3
+"""每个 bot 允许连续发送的消息数"""
+
+_MAX_ATTEMPTS: int = 5
+"""单条消息最大发送次数, 超过后丢弃"""
+
+_RETRY_BACKOFF: float = 15.0
+"""发送失败后重试的基础等待时间, 单位秒, 按失败次数指数增加"""
+
+_MAX_COALESCE_NUM: int = 3
+"""同一会话中可以合并为一条发送的消息数量上限"""
+
+_SAVE_DELAY: float = 2.0
+"""队列变化后延迟写入文件的时间, 单位秒"""
+
+
+@dataclass
+class DeliveryItem:
+    """待投递的消息"""
+    relation: dict  # 投递目标 InternalEntity 的 relation
+    message: str  # MessageTools.dumps 导出的消息
+    coalesce_key: str | None = None  # 同一会话中相邻且 coalesce_key 相同的消息会被合并发送
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def bot_id(self) -> str:
+        return self.relation['bot_self_id']
+
+    @property
+    def target_key(self) -> str:
+        return f"{self.relation['relation_type']}_{self.relation['parent_entity']['entity_id']}_" \
+               f"{self.relation['child_entity']['entity_id']}"
+
+    def get_entity(self) -> BaseInternalEntity:
+        for entity_class in BaseInternalEntity.__subclasses__():
+            if entity_class._base_relation_model.get_relation_type() == self.relation['relation_type']:
+                return entity_class.parse_from_relation_model(model=self.relation)
+        raise ValueError(f'entity relation class of {self.relation["relation_type"]} not found')
+
+
+@dataclass
+class _TargetQueue:
+    """单个会话的待投递队列, 失败时整个队列等待重试以保证顺序"""
+    items: deque[DeliveryItem] = field(default_factory=deque)
+    blocked_until: float = 0
+
+
+class _TokenBucket(object):
+    """令牌桶, 每个 bot 只有一个发送 worker, 不需要加锁"""
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens: float = capacity
+        self._updated_at: float = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class MessageDeliveryQueue(object):
+    """订阅消息投递队列
+
+    - 每个 bot 一个发送 worker, 使用令牌桶限制发送速率, 各会话按最早待发送消息的时间轮流发送
+    - 同一会话内严格按入队顺序发送, 发送失败时该会话按指数退避等待重试, 不影响其他会话
+    - 同一会话中相邻的同类消息合并为一条发送, 减少发送次数
+    - 队列内容延迟写入文件, 重启后在 bot 重新连接时继续投递
+    """
+
+    def __init__(self) -> None:
+        self._targets: dict[str, dict[str, _TargetQueue]] = {}
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self._wakeup_events: dict[str, asyncio.Event] = {}
+        self._save_task: asyncio.Task | None = None
+
+    @property
+    def pending_count(self) -> int:
+        return sum(len(q.items) for targets in self._targets.values() for q in targets.values())
+
+    def _add_item(self, item: DeliveryItem) -> None:
+        targets = self._targets.setdefault(item.bot_id, {})
+        targets.setdefault(item.target_key, _TargetQueue()).items.append(item)
+
+    def enqueue(
+            self,
+            entity: BaseInternalEntity,
+            message: str | Message | MessageSegment,
+            *,
+            coalesce_key: str | None = None
+    ) -> None:
+        """向 entity 投递消息
+
+        :param entity: 投递目标
+        :param message: 消息内容
+        :param coalesce_key: 合并发送的标识, 为 None 时不合并
+        """
+        message = Message(MessageSegment.text(message)) if isinstance(message, str) else Message(message)
+        self._add_item(DeliveryItem(relation=entity.relation.dict(), message=MessageTools.dumps(message),
+                                    coalesce_key=coalesce_key))
+        self._ensure_worker(bot_id=entity.bot_id)
+        self._schedule_save()
+
+    async def broadcast(
+            self,
+            entities: Iterable[BaseInternalEntity],
+            messages: Iterable[str | Message | MessageSegment],
+            *,
+            coalesce_key: str | None = None
+    ) -> None:
+        """向多个 entity 投递相同的一组消息, 消息中的图片只暂存一次, 所有 entity 的消息引用同一个文件"""
+        messages = [await media_staging.stage_message(message) for message in messages]
+        for entity in entities:
+            for message in messages:
+                self.enqueue(entity=entity, message=message, coalesce_key=coalesce_key)
+
+    def _ensure_worker(self, bot_id: str) -> None:
+        if bot_id not in self._targets:
+            return
+        event = self._wakeup_events.setdefault(bot_id, asyncio.Event())
+        event.set()
+        worker = self._workers.get(bot_id)
+        if worker is None or worker.done():
+            self._workers[bot_id] = asyncio.create_task(self._worker(bot_id=bot_id))
+
+    @staticmethod
+    def _take_coalesced(queue: _TargetQueue) -> list[DeliveryItem]:
+        head = queue.items[0]
+        if head.coalesce_key is None:
+            return [head]
+
+        batch = []
+        for item in queue.items:
+            if item.coalesce_key != head.coalesce_key or len(batch) >= _MAX_COALESCE_NUM:
+                break
+            batch.append(item)
+        return batch
+
+    @staticmethod
+    async def _send(bot_id: str, batch: list[DeliveryItem]) -> bool:
+        entity = batch[0].get_entity()
+        message = Message()
+        for index, item in enumerate(batch):
+            if index > 0:
+                message += MessageSegment.text('\n\n')
+            message += MessageTools.loads(item.message)
+
+        msg_sender = MessageSender.init_from_bot_id(bot_id=bot_id)
+        sent_result = await msg_sender.send_internal_entity_msg(entity=entity, message=message)
+        if isinstance(sent_result, Exception):
+            logger.warning(f'MessageDeliveryQueue | Bot({bot_id}) failed to send message to '
+                           f'{entity.relation_type.upper()}({entity.entity_id}), {sent_result}')
+            return False
+        return True
+
+    async def _worker(self, bot_id: str) -> None:
+        bucket = self._buckets.setdefault(bot_id, _TokenBucket(rate=_SEND_RATE, capacity=_SEND_BURST))
+        event = self._wakeup_events[bot_id]
+
+        while True:
+            targets = self._targets.get(bot_id, {})
+            for key in [k for k, v in targets.items() if not v.items]:
+                targets.pop(key)
+            if not targets:
+                self._targets.pop(bot_id, None)
+                self._workers.pop(bot_id, None)
+                return
+
+            now = time.time()
+            ready = [q for q in targets.values() if q.blocked_until <= now]
+            if not ready:
+                event.clear()
+                timeout = min(q.blocked_until for q in targets.values()) - now
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queue = min(ready, key=lambda x: x.items[0].created_at)
+            batch = self._take_coalesced(queue=queue)
+            await bucket.acquire()
+            try:
+                sent = await self._send(bot_id=bot_id, batch=batch)
+            except KeyError:
+                # bot 不在线, 保留队列等待 bot 重新连接
+                logger.debug(f'MessageDeliveryQueue | Bot({bot_id}) not online, '
+                             f'{self.pending_count} message(s) will be delivered after bot reconnected')
+                self._workers.pop(bot_id, None)
+                return
+            except Exception as e:
+                logger.error(f'MessageDeliveryQueue | Bot({bot_id}) delivering message failed, {e}')
+                sent = False
+
+            if sent:
+                for _ in batch:
+                    queue.items.popleft()
+                queue.blocked_until = 0
+            else:
+                for item in batch:
+                    item.attempts += 1
+                if batch[0].attempts >= _MAX_ATTEMPTS:
+                    for _ in batch:
+                        queue.items.popleft()
+                    queue.blocked_until = 0
+                    logger.error(f'MessageDeliveryQueue | Bot({bot_id}) dropped {len(batch)} message(s) to '
+                                 f'{batch[0].target_key} after {_MAX_ATTEMPTS} attempts')
+                else:
+                    queue.blocked_until = time.time() + _RETRY_BACKOFF * 2 ** (batch[0].attempts - 1)
+            self._schedule_save()
+
+    def _dump_items(self) -> str:
+        items = [asdict(item) for targets in self._targets.values() for q in targets.values() for item in q.items]
+        return json.dumps(items, ensure_ascii=False)
+
+    async def save(self) -> None:
+        """将队列中未完成投递的消息写入文件"""
+        data = self._dump_items()
+        tmp_file = TmpResource(_PENDING_FILE.resolve_path + '.tmp')
+        try:
+            async with tmp_file.async_open('w', encoding='utf8') as af:
+                await af.write(data)
+            tmp_file.path.replace(_PENDING_FILE.path)
+        except Exception as e:
+            logger.warning(f'MessageDeliveryQueue | Saving pending messages failed, {e}')
+
+    async def _delay_save(self) -> None:
+        await asyncio.sleep(_SAVE_DELAY)
+        self._save_task = None
+        await self.save()
+
+    def _schedule_save(self) -> None:
+        if self._save_task is None:
+            self._save_task = asyncio.create_task(self._delay_save())
+
+    async def load(self) -> int:
+        """从文件中恢复未完成投递的消息, 在对应 bot 连接后开始投递
+
+        :return: 恢复的消息数量
+        """
+        if not _PENDING_FILE.is_file:
+            return 0
+        async with _PENDING_FILE.async_open('r', encoding='utf8') as af:
+            items = [DeliveryItem(**x) for x in json.loads(await af.read())]
+        for item in items:
+            self._add_item(item)
+        return len(items)
+
+    def on_bot_connect(self, bot_id: str) -> None:
+        """bot 连接后继续投递"""
+        self._ensure_worker(bot_id=bot_id)
+
+
+message_delivery_queue = MessageDeliveryQueue()
+
+
+@get_driver().on_startup
+async def _load_pending_messages() -> None:
+    try:
+        count = await message_delivery_queue.load()
+    except Exception as e:
+        logger.warning(f'MessageDeliveryQueue | Loading pending messages failed, {e}')
+        return
+    if count:
+        logger.opt(colors=True).info(f'<lc>MessageDeliveryQueue</lc> | Restored {count} pending message(s)')
+
+
+@get_driver().on_startup
+async def _remove_expired_staged_media() -> None:
+    try:
+        await media_staging.remove_expired()
+    except Exception as e:
+        logger.warning(f'MessageDeliveryQueue | Removing expired staged media failed, {e}')
+
+
+@get_driver().on_bot_connect
+async def _resume_delivering(bot: Bot) -> None:
+    message_delivery_queue.on_bot_connect(bot_id=bot.self_id)
+
+
+@get_driver().on_shutdown
+async def _save_pending_messages() -> None:
+    await message_delivery_queue.save()
+
+
+__all__ = [
+    'media_staging',
+    'message_delivery_queue'
+]
@@ -0,0 +1,165 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/25 16:10
+@FileName       : media_staging.py
+@Project        : nonebot2_miya
+@Description    : 按内容寻址的消息媒体文件暂存区, 同一文件在一次广播中只下载和写入一次
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import time
+import asyncio
+import hashlib
+import pathlib
+import tempfile
+from collections import OrderedDict
+from typing import Awaitable, Callable
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+from nonebot.adapters.onebot.v11.message import Message, MessageSegment
+
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.process_utils import run_sync
+
+
+_STAGING_FOLDER: TmpResource = TmpResource('message_delivery', 'media')
+"""暂存文件夹, 文件按内容的 sha256 命名"""
+
+_STAGED_FILE_EXPIRE: int = 7 * 24 * 3600
+"""暂存文件保留时间, 单位秒, 需大于投递队列中消息可能等待的时间"""
+
+_MAX_RECENT_NUM: int = 1024
+"""记录最近已暂存的来源数量"""
+
+
+def _write_content(content: bytes, suffix: str) -> pathlib.Path:
+    """按内容哈希写入文件, 文件已存在时不重复写入"""
+    digest = hashlib.sha256(content).hexdigest()
+    file = _STAGING_FOLDER(digest[:2], f'{digest}{suffix}').path
+    if not file.exists():
+        file.parent.mkdir(parents=True, exist_ok=True)
+        # 不同进程可能同时暂存相同内容, 临时文件名需要唯一
+        with tempfile.NamedTemporaryFile(dir=file.parent, suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            f.write(content)
+        try:
+            os.replace(tmp_path, file)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+    return file
+
+
+def _stage_local_file(path: pathlib.Path) -> pathlib.Path:
+    return _write_content(content=path.read_bytes(), suffix=path.suffix)
+
+
+def _remove_expired_files() -> int:
+    if not _STAGING_FOLDER.is_dir:
+        return 0
+    expired_before = time.time() - _STAGED_FILE_EXPIRE
+    removed_count = 0
+    for file in _STAGING_FOLDER.path.glob('*/*'):
+        if file.is_file() and file.stat().st_mtime < expired_before:
+            file.unlink(missing_ok=True)
+            removed_count += 1
+    return removed_count
+
+
+class MediaStaging(object):
+    """消息媒体文件暂存区
+
+    - 文件按内容哈希命名, 内容相同的文件只保存一份, 写入后不再被修改, 可以安全地被投递队列中的消息引用
+    - 同一来源(url 或本地文件)的并发暂存请求共享同一个任务, 最近暂存过的来源直接复用结果
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, asyncio.Future[TmpResource]] = {}
+        self._recent: OrderedDict[str, TmpResource] = OrderedDict()
+
+    def _get_recent(self, key: str) -> TmpResource | None:
+        staged = self._recent.get(key)
+        if staged is None or not staged.is_file:
+            return None
+        self._recent.move_to_end(key)
+        return staged
+
+    def _set_recent(self, key: str, staged: TmpResource) -> None:
+        self._recent[key] = staged
+        self._recent.move_to_end(key)
+        while len(self._recent) > _MAX_RECENT_NUM:
+            self._recent.popitem(last=False)
+
+    async def _stage(self, key: str, stager: Callable[[], Awaitable[pathlib.Path]]) -> TmpResource:
+        if (staged := self._get_recent(key)) is not None:
+            return staged
+        if key in self._pending:
+            return await asyncio.shield(self._pending[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            file = await stager()
+            staged = _STAGING_FOLDER(file.parent.name, file.name)
+            self._set_recent(key, staged)
+            future.set_result(staged)
+            return staged
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "Future exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._pending.pop(key, None)
+
+    async def stage_url(self, url: str, loader: Callable[[str], Awaitable[bytes]]) -> TmpResource:
+        """暂存网络文件, 同一 url 只下载一次
+
+        :param url: 文件链接
+        :param loader: 获取文件内容的函数
+        """
+        async def _stager() -> pathlib.Path:
+            content = await loader(url)
+            suffix = pathlib.PurePosixPath(urlparse(url).path).suffix
+            return await run_sync(_write_content)(content=content, suffix=suffix)
+
+        return await self._stage(key=f'url:{url}', stager=_stager)
+
+    async def stage_file(self, path: pathlib.Path) -> TmpResource:
+        """暂存本地文件, 文件未修改时只复制一次"""
+        stat = path.stat()
+        return await self._stage(key=f'file:{path}:{stat.st_mtime_ns}:{stat.st_size}',
+                                 stager=lambda: run_sync(_stage_local_file)(path))
+
+    async def stage_message(self, message: str | Message | MessageSegment) -> str | Message:
+        """将消息中引用的本地图片替换为暂存文件, 其余消息段保持不变"""
+        if isinstance(message, str):
+            return message
+
+        staged_message = Message()
+        for segment in Message(message):
+            file = segment.data.get('file')
+            if segment.type == 'image' and isinstance(file, str) and file.startswith('file:'):
+                staged = await self.stage_file(path=pathlib.Path(url2pathname(urlparse(file).path)))
+                segment = MessageSegment('image', {**segment.data, 'file': staged.file_uri})
+            staged_message.append(segment)
+        return staged_message
+
+    @staticmethod
+    async def remove_expired() -> int:
+        """清理过期的暂存文件
+
+        :return: 清理的文件数量
+        """
+        return await run_sync(_remove_expired_files)()
+
+
+media_staging = MediaStaging()
+
+
+__all__ = [
+    'media_staging'
+]
@@ -8,9 +8,12 @@
 @Software       : PyCharm 
 """
 
+import os
 import inspect
 import asyncio
+import multiprocessing
 from asyncio import Future
+from concurrent.futures import ProcessPoolExecutor
 from asyncio.exceptions import TimeoutError as _TimeoutError
 from rich.progress_bar import Console, ProgressBar
 from typing import TypeVar, ParamSpec, Callable, Generator, Coroutine, Awaitable, Any
@@ -87,6 +90,86 @@ def run_sync(func: Callable[P, R]) -> Callable[P, Coroutine[None, None, R]]:
     return _wrapper
 
 
+def run_sync_if_large(
+        func: Callable[P, R] | None = None,
+        *,
+        size_threshold: int = 16384
+) -> Callable[P, Coroutine[None, None, R]] | Callable[[Callable[P, R]], Callable[P, Coroutine[None, None, R]]]:
+    """一个用于包装 sync function 为 async function 的装饰器, 主要用于 html/json 等文本解析函数
+
+    参数中 str/bytes 内容的总长度超过阈值时在线程池中运行, 避免大体积内容解析阻塞事件循环, 否则直接运行以节省线程调度开销
+
+    :param func: 被装饰的同步函数
+    :param size_threshold: 在线程池中运行的内容长度阈值
+    """
+
+    def decorator(func_: Callable[P, R]) -> Callable[P, Coroutine[None, None, R]]:
+        @wraps(func_)
+        async def _wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            content_size = sum(len(x) for x in (*args, *kwargs.values()) if isinstance(x, (str, bytes)))
+            if content_size < size_threshold:
+                return func_(*args, **kwargs)
+            loop = asyncio.get_running_loop()
+            p_func = partial(func_, *args, **kwargs)
+            return await loop.run_in_executor(None, p_func)
+
+        return _wrapper
+
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+_process_pool_executor: ProcessPoolExecutor | None = None
+"""进程池, 由 start_process_pool 在启动时创建"""
+
+
+def start_process_pool(max_workers: int | None = None) -> None:
+    """创建进程池, 应在主进程启动时调用, 并在关闭时调用 shutdown_process_pool
+
+    子进程使用 spawn 方式创建: 主进程中已运行了事件循环、数据库连接池等多个线程, fork 会复制其他线程持有的锁导致子进程死锁;
+    spawn 子进程会以 __mp_main__ 重新导入入口文件 (bot.py 中的初始化需放在 __name__ == '__main__' 中),
+    并按名称导入被调用函数所在的模块, 因此在进程池中运行的函数必须放在无需初始化 nonebot 即可导入的模块中
+
+    :param max_workers: 进程数, 默认为 CPU 核数, 最多 4 个
+    """
+    global _process_pool_executor
+    if _process_pool_executor is None:
+        _process_pool_executor = ProcessPoolExecutor(
+            max_workers=max_workers or min(4, os.cpu_count() or 1),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        logger.opt(colors=True).info('<lc>ProcessPool</lc> | Process pool started')
+
+
+def shutdown_process_pool() -> None:
+    """关闭进程池, 取消尚未开始的任务并等待子进程退出"""
+    global _process_pool_executor
+    if _process_pool_executor is not None:
+        _process_pool_executor.shutdown(wait=True, cancel_futures=True)
+        _process_pool_executor = None
+        logger.opt(colors=True).info('<lc>ProcessPool</lc> | Process pool shutdown')
+
+
+def run_sync_in_process(func: Callable[P, R]) -> Callable[P, Coroutine[None, None, R]]:
+    """一个用于包装 sync function 为 async function 并在进程池中运行的装饰器, 用于图片编码等 CPU 密集型任务
+
+    被装饰的函数必须为模块级函数, 且所在模块需要可以在未初始化 nonebot 的子进程中导入, 参数及返回值需要可以被 pickle 序列化,
+    由于 pickle 按名称查找函数, 不能在定义函数时使用装饰器语法, 应在调用处使用: run_sync_in_process(func)(*args)
+    进程池未启动时 (如未通过 bot.py 运行) 退化为与 run_sync 相同在线程池中运行
+
+    :param func: 被装饰的同步函数
+    """
+
+    @wraps(func)
+    async def _wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        loop = asyncio.get_running_loop()
+        p_func = partial(func, *args, **kwargs)
+        return await loop.run_in_executor(_process_pool_executor, p_func)
+
+    return _wrapper
+
+
 def run_async_delay(delay_time: float = 5):
     """一个用于包装 async function 使其延迟运行的装饰器
 
@@ -230,6 +313,10 @@ async def semaphore_gather(
 __all__ = [
     'retry',
     'run_sync',
+    'run_sync_if_large',
+    'start_process_pool',
+    'shutdown_process_pool',
+    'run_sync_in_process',
     'run_async_delay',
     'run_async_catching_exception',
     'semaphore_gather'
@@ -0,0 +1,144 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/23 20:05
+@FileName       : seen_filter
+@Project        : nonebot2_miya
+@Description    : 已处理 ID 过滤器, 用于订阅监控判断新内容时减少数据库查询
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import math
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Iterator, TypeVar
+
+from nonebot.log import logger
+
+from omega_miya.utils.process_utils import semaphore_gather
+
+
+T = TypeVar('T', bound=Hashable)
+
+
+class BloomFilter(object):
+    """Bloom 过滤器, 不存在时一定返回 False, 存在时有 error_rate 的概率误判"""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self._bit_size: int = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hash_num: int = max(1, round(self._bit_size / capacity * math.log(2)))
+        self._bits = bytearray((self._bit_size + 7) // 8)
+
+    def _positions(self, item: Hashable) -> Iterator[int]:
+        digest = hashlib.blake2b(str(item).encode(encoding='utf8'), digest_size=16).digest()
+        hash_a = int.from_bytes(digest[:8], byteorder='big')
+        hash_b = int.from_bytes(digest[8:], byteorder='big') | 1
+        for i in range(self._hash_num):
+            yield (hash_a + i * hash_b) % self._bit_size
+
+    def add(self, item: Hashable) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return all(self._bits[x >> 3] & (1 << (x & 7)) for x in self._positions(item))
+
+
+class SeenIdFilter(Generic[T]):
+    """已处理 ID 过滤器
+
+    - 在内存中保存最近确认已存在的 ID (有界 LRU), 首次使用前从数据库预热
+    - 可选启用 Bloom 过滤器记录超出 LRU 容量的 ID, 会有 bloom_error_rate 的概率将新 ID 误判为已存在
+    - 仅对过滤器中没有的 ID 查询数据库
+    """
+
+    def __init__(
+            self,
+            name: str,
+            *,
+            warm_up_loader: Callable[[], Awaitable[Iterable[T]]] | None = None,
+            max_size: int = 4096,
+            bloom_capacity: int = 0,
+            bloom_error_rate: float = 0.001
+    ) -> None:
+        """
+        :param name: 过滤器名称, 用于日志
+        :param warm_up_loader: 预热时从数据库中读取已存在 ID 的函数
+        :param max_size: LRU 容量
+        :param bloom_capacity: Bloom 过滤器容量, 为 0 时不启用
+        :param bloom_error_rate: Bloom 过滤器误判率
+        """
+        self.name = name
+        self._warm_up_loader = warm_up_loader
+        self._max_size = max_size
+        self._lru: OrderedDict[T, None] = OrderedDict()
+        self._bloom: BloomFilter | None = BloomFilter(bloom_capacity, bloom_error_rate) if bloom_capacity > 0 else None
+        self._warmed_up: bool = warm_up_loader is None
+        self._warm_up_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def add(self, *ids: T) -> None:
+        """记录已存在的 ID"""
+        for id_ in ids:
+            self._lru[id_] = None
+            self._lru.move_to_end(id_)
+            if self._bloom is not None:
+                self._bloom.add(id_)
+        while len(self._lru) > self._max_size:
+            self._lru.popitem(last=False)
+
+    def is_seen(self, id_: T) -> bool:
+        """ID 是否已确认存在, 为 False 时需要进一步查询数据库"""
+        if id_ in self._lru:
+            self._lru.move_to_end(id_)
+            return True
+        return self._bloom is not None and id_ in self._bloom
+
+    async def warm_up(self) -> None:
+        """从数据库预热过滤器, 只执行一次"""
+        if self._warmed_up:
+            return
+        async with self._warm_up_lock:
+            if self._warmed_up:
+                return
+            try:
+                self.add(*(await self._warm_up_loader()))
+            except Exception as e:
+                # 预热失败不影响正确性, 只是会产生更多数据库查询, 下次使用时重试
+                logger.warning(f'SeenIdFilter | {self.name} warming up failed, {e}')
+                return
+            self._warmed_up = True
+            logger.debug(f'SeenIdFilter | {self.name} warmed up with {len(self)} id(s)')
+
+    async def filter_unseen(
+            self,
+            ids: Iterable[T],
+            exist_checker: Callable[[T], Awaitable[bool]],
+            *,
+            semaphore_num: int = 20
+    ) -> list[T]:
+        """过滤出未处理过的 ID, 仅对过滤器中没有的 ID 调用 exist_checker 查询, 已存在的 ID 会被记录
+
+        :param ids: 待检查的 ID
+        :param exist_checker: 查询 ID 是否已存在于数据库中的函数
+        :param semaphore_num: 查询并发数
+        :return: 未处理过的 ID, 保持原有顺序
+        """
+        await self.warm_up()
+        candidates = [x for x in dict.fromkeys(ids) if not self.is_seen(x)]
+        if not candidates:
+            return []
+
+        tasks = [exist_checker(x) for x in candidates]
+        exists = await semaphore_gather(tasks=tasks, semaphore_num=semaphore_num, return_exceptions=False)
+        self.add(*(x for x, exist in zip(candidates, exists) if exist))
+        return [x for x, exist in zip(candidates, exists) if not exist]
+
+
+__all__ = [
+    'BloomFilter',
+    'SeenIdFilter'
+]
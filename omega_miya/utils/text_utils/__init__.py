@@ -14,7 +14,6 @@ from io import BytesIO
 from datetime import datetime
 from PIL import Image, ImageDraw, ImageFont
 from omega_miya.local_resource import TmpResource
-from omega_miya.web_resource import HttpFetcher
 from omega_miya.utils.process_utils import run_sync
 
 from .config import text_utils_config
@@ -167,6 +166,9 @@ class AdvanceTextUtils(object):
 
     async def _prepare_image_segment(self) -> None:
         """预处理, 将所有的图片 Segment 全部下载下来"""
+        # 在使用时才导入, 本模块需要可以在进程池子进程中 (未初始化 nonebot) 导入
+        from omega_miya.web_resource import HttpFetcher
+
         for segment in self._content.content:
             if segment.type == 'image':
                 image_url = segment.get_content()
@@ -14,9 +14,10 @@ from typing import Literal, Optional
 
 from omega_miya.local_resource import TmpResource
 from omega_miya.web_resource import HttpFetcher
+from omega_miya.utils.process_utils import run_sync
 
 from .config import bilibili_config, bilibili_resource_config
-from .wbi import transform_params
+from .wbi import transform_params, wbi_key_manager
 from .exception import BilibiliApiError, BilibiliNetworkError
 from .model.search import BaseBilibiliSearchingModel, UserSearchingModel
 from .model import (BilibiliUserModel, BilibiliUserDynamicModel, BilibiliDynamicModel,
@@ -37,18 +38,24 @@ class Bilibili(object):
     def __repr__(self):
         return f'<{self.__class__.__name__}>'
 
+    @classmethod
+    async def get_file_content(cls, url: str) -> bytes:
+        """获取任意 Bilibili 资源内容"""
+        file_content = await cls._fetcher.get_bytes(url=url)
+        if file_content.status != 200:
+            raise BilibiliNetworkError(f'BilibiliNetworkError, status code {file_content.status}')
+        return file_content.result
+
     @classmethod
     async def download_file(cls, url: str) -> TmpResource:
         """下载任意 Bilibili 资源到本地, 保持原始文件名, 直接覆盖同名文件"""
         parsed_url = urlparse(url=url, allow_fragments=True)
         original_file_name = pathlib.Path(parsed_url.path).name
-        file_content = await cls._fetcher.get_bytes(url=url)
-        if file_content.status != 200:
-            raise BilibiliNetworkError(f'BilibiliNetworkError, status code {file_content.status}')
+        file_content = await cls.get_file_content(url=url)
 
         local_file = bilibili_resource_config.default_download_folder(original_file_name)
         async with local_file.async_open('wb') as af:
-            await af.write(file_content.result)
+            await af.write(file_content)
         return local_file
 
     @classmethod
@@ -166,10 +173,17 @@ class BilibiliUser(Bilibili):
         if not isinstance(self.user_model, BilibiliUserModel):
             params = {'mid': self.mid}
             signed_params = await transform_params(params)
-            user_result = await self._fetcher.get_json_dict(url=self._data_api_url, params=signed_params)
+            # 签名参数每次请求都不同, 使用 mid 作为缓存 key
+            cache_key = f'bilibili_user_info_{self.mid}'
+            user_result = await self._fetcher.get_json_dict(
+                url=self._data_api_url, params=signed_params, cache_ttl=600, cache_key=cache_key)
             if user_result.status != 200:
                 raise BilibiliApiError(f'BilibiliApiError, {user_result.result}')
             self.user_model = BilibiliUserModel.parse_obj(user_result.result)
+            if self.user_model.error:
+                # 不缓存接口返回的错误信息, 签名失效时下一次请求重新获取 wbi key
+                wbi_key_manager.check_response_code(code=self.user_model.code)
+                await self._fetcher.invalidate_cache(cache_key=cache_key)
 
         assert isinstance(self.user_model, BilibiliUserModel), 'Query user model failed'
         return self.user_model
@@ -195,7 +209,8 @@ class BilibiliUser(Bilibili):
         self._fetcher.headers.update(_default_headers)
         if dynamics_result.status != 200:
             raise BilibiliApiError(f'BilibiliApiError, {dynamics_result.result}')
-        return BilibiliUserDynamicModel.parse_obj(dynamics_result.result)
+        # 动态列表中每个 card 都需要进行 Json 解析及模型校验, 放在线程池中运行避免阻塞事件循环
+        return await run_sync(BilibiliUserDynamicModel.parse_obj)(dynamics_result.result)
 
 
 class BilibiliDynamic(Bilibili):
@@ -233,7 +248,7 @@ class BilibiliDynamic(Bilibili):
             self._fetcher.headers.update(_default_headers)
             if dynamic_result.status != 200:
                 raise BilibiliApiError(f'BilibiliApiError, {dynamic_result.result}')
-            self.dynamic_model = BilibiliDynamicModel.parse_obj(dynamic_result.result)
+            self.dynamic_model = await run_sync(BilibiliDynamicModel.parse_obj)(dynamic_result.result)
 
         assert isinstance(self.dynamic_model, BilibiliDynamicModel), 'Query dynamic model failed'
         return self.dynamic_model
@@ -245,6 +260,9 @@ class BilibiliLiveRoom(Bilibili):
     _live_api_url = 'https://api.live.bilibili.com/room/v1/Room/get_info'
     _live_by_uids_api_url = 'https://api.live.bilibili.com/room/v1/Room/get_status_info_by_uids'
 
+    # 批量查询直播间状态的 api 不需要 cookie, 分批轮询时复用共享连接池
+    _live_by_uids_fetcher = HttpFetcher(timeout=15, keep_alive=True)
+
     def __init__(self, room_id: int):
         self.room_id = room_id
         self.live_room_url = f'{self._live_root_url}{room_id}'
@@ -260,7 +278,7 @@ class BilibiliLiveRoom(Bilibili):
     async def query_live_room_by_uid_list(cls, uid_list: list[int | str]) -> BilibiliUsersLiveRoomModel:
         """根据用户 uid 列表获取这些用户的直播间信息(这个 api 没有认证方法，请不要在标头中添加 cookie)"""
         payload = {'uids': uid_list}
-        live_room_result = await HttpFetcher().post_json_dict(url=cls._live_by_uids_api_url, json=payload)
+        live_room_result = await cls._live_by_uids_fetcher.post_json_dict(url=cls._live_by_uids_api_url, json=payload)
         if live_room_result.status != 200:
             raise BilibiliApiError(f'BilibiliApiError, {live_room_result.result}')
         return BilibiliUsersLiveRoomModel.parse_obj(live_room_result.result)
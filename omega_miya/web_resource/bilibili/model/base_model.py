@@ -8,6 +8,7 @@
 @Software       : PyCharm 
 """
 
+import ujson as json
 from pydantic import BaseModel
 
 
@@ -15,6 +16,7 @@ class BaseBilibiliModel(BaseModel):
     class Config:
         extra = 'ignore'
         allow_mutation = False
+        json_loads = json.loads  # 动态 card 等 Json 字段使用 ujson 解析
 
 
 __all = [
@@ -1,7 +1,10 @@
+import time
+import asyncio
+import urllib.parse
 from functools import reduce
 from hashlib import md5
-import urllib.parse
-import time
+
+from nonebot.log import logger
 
 from omega_miya.web_resource import HttpFetcher
 
@@ -15,15 +18,23 @@ mixinKeyEncTab = [
     36, 20, 34, 44, 52
 ]
 
+_WBI_KEY_EXPIRE_TIME: int = 2 * 3600
+"""mixin key 有效时间, 单位秒, 过期后需要等待重新获取"""
+
+_WBI_KEY_REFRESH_TIME: int = 3600
+"""mixin key 获取后超过该时间时在后台提前刷新, 单位秒"""
+
+_WBI_KEY_ERROR_CODES: set[int] = {-352, -403}
+"""签名失效时接口可能返回的错误码"""
+
 
 def get_mixin_key(orig: str):
     """对 imgKey 和 subKey 进行字符顺序打乱编码"""
     return reduce(lambda s, i: s + orig[i], mixinKeyEncTab, '')[:32]
 
 
-def enc_wbi(params: dict, img_key: str, sub_key: str):
+def enc_wbi(params: dict, mixin_key: str):
     """为请求参数进行 wbi 签名"""
-    mixin_key = get_mixin_key(img_key + sub_key)
     curr_time = round(time.time())
     params['wts'] = curr_time                                   # 添加 wts 字段
     params = dict(sorted(params.items()))                       # 按照 key 重排参数
@@ -53,16 +64,74 @@ async def get_wbi_keys() -> tuple[str, str]:
     return img_key, sub_key
 
 
+class WbiKeyManager(object):
+    """wbi mixin key 管理
+
+    - 全局共享同一个 mixin key, 在有效期内的签名不需要额外请求
+    - 超过刷新时间后继续使用当前 key 并在后台刷新, 只有 key 不存在或已过期时才等待获取
+    - 同一时间只有一个获取 key 的请求
+    """
+
+    def __init__(self) -> None:
+        self._mixin_key: str | None = None
+        self._fetched_at: float = 0
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: asyncio.Task | None = None
+
+    @property
+    def _age(self) -> float:
+        return time.time() - self._fetched_at
+
+    async def _refresh(self) -> str:
+        fetched_at = self._fetched_at
+        async with self._refresh_lock:
+            # 等待锁期间已被其他请求刷新
+            if self._mixin_key is not None and self._fetched_at > fetched_at:
+                return self._mixin_key
+
+            img_key, sub_key = await get_wbi_keys()
+            self._mixin_key = get_mixin_key(img_key + sub_key)
+            self._fetched_at = time.time()
+            logger.debug('WbiKeyManager | Bilibili wbi mixin key refreshed')
+            return self._mixin_key
+
+    async def _background_refresh(self) -> None:
+        try:
+            await self._refresh()
+        except Exception as e:
+            logger.warning(f'WbiKeyManager | Refreshing bilibili wbi mixin key failed, {e}')
+
+    async def get_mixin_key(self) -> str:
+        """获取当前的 mixin key"""
+        if self._mixin_key is None or self._age >= _WBI_KEY_EXPIRE_TIME:
+            return await self._refresh()
+
+        if self._age >= _WBI_KEY_REFRESH_TIME and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        return self._mixin_key
+
+    def invalidate(self) -> None:
+        """接口返回签名错误时使当前 key 失效, 下一次签名时重新获取"""
+        self._fetched_at = 0
+
+    def check_response_code(self, code: int) -> None:
+        """检查签名请求的返回码, 签名失效时使当前 key 失效"""
+        if code in _WBI_KEY_ERROR_CODES:
+            self.invalidate()
+
+    async def sign_params(self, params: dict) -> dict:
+        """为请求参数进行 wbi 签名"""
+        return enc_wbi(params=params, mixin_key=await self.get_mixin_key())
+
+
+wbi_key_manager = WbiKeyManager()
+
+
 async def transform_params(params: dict):
-    img_key, sub_key = await get_wbi_keys()
-    signed_params = enc_wbi(
-        params=params,
-        img_key=img_key,
-        sub_key=sub_key
-    )
-    return signed_params
+    return await wbi_key_manager.sign_params(params=params)
 
 
 __all__ = [
-    'transform_params'
+    'transform_params',
+    'wbi_key_manager'
 ]
@@ -1,14 +1,21 @@
+import time
 import aiohttp
 import pathlib
 import hashlib
+import ujson
 from copy import deepcopy
 from typing import Iterable, Any
 from urllib.parse import urlparse
 
-from omega_miya.utils.process_utils import retry, run_async_catching_exception
+from nonebot import get_driver
+
+from omega_miya.utils.process_utils import retry, run_sync_if_large, run_async_catching_exception
 from omega_miya.local_resource import TmpResource
 
-from .config import http_proxy_config
+from .cache import HttpCacheEntry, http_response_cache
+from .config import http_proxy_config, http_fetcher_replay_config
+from .metrics import http_fetcher_metrics
+from .replay import RecordingClientResponse, rewrite_replay_url
 from .model import HttpFetcherJsonResult, HttpFetcherDictResult, HttpFetcherTextResult, HttpFetcherBytesResult
 
 
@@ -31,6 +38,9 @@ class HttpFetcher(object):
                       'Chrome/104.0.0.0 Safari/537.36'
     }
     _http_proxy_config = http_proxy_config
+    _replay_config = http_fetcher_replay_config
+    _shared_connector: aiohttp.TCPConnector | None = None
+    _trace_configs: list[aiohttp.TraceConfig] = [http_fetcher_metrics.trace_config]
 
     class FormData(aiohttp.FormData):
         """Patched aiohttp FormData"""
@@ -62,14 +72,21 @@ class HttpFetcher(object):
             *,
             timeout: int | float | None = None,
             headers: dict[str, str] | None = None,
-            cookies: dict[str, str] | None = None) -> None:
-
+            cookies: dict[str, str] | None = None,
+            keep_alive: bool = False) -> None:
+        """
+        :param timeout: 超时时间
+        :param headers: 请求头
+        :param cookies: cookies
+        :param keep_alive: 是否使用全局共享的连接池, 频繁请求同一 host 时可以复用连接
+        """
         _time_out = self._default_timeout_time if timeout is None else timeout
         _headers = self._default_headers if headers is None else headers
 
         self.timeout = aiohttp.ClientTimeout(total=_time_out)
         self.headers = _headers
         self.cookies = cookies
+        self.keep_alive = keep_alive
 
     @classmethod
     def parse_url_file_name(cls, url: str) -> str:
@@ -92,6 +109,55 @@ class HttpFetcher(object):
     def get_default_headers(cls) -> dict[str, str]:
         return deepcopy(cls._default_headers)
 
+    @classmethod
+    def _get_shared_connector(cls) -> aiohttp.TCPConnector:
+        """获取全局共享的连接池, 需要在事件循环中调用"""
+        if HttpFetcher._shared_connector is None or HttpFetcher._shared_connector.closed:
+            HttpFetcher._shared_connector = aiohttp.TCPConnector(limit=64, keepalive_timeout=60)
+        return HttpFetcher._shared_connector
+
+    @classmethod
+    async def close_shared_connector(cls) -> None:
+        """关闭全局共享的连接池"""
+        if HttpFetcher._shared_connector is not None and not HttpFetcher._shared_connector.closed:
+            await HttpFetcher._shared_connector.close()
+        HttpFetcher._shared_connector = None
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """创建请求 session, 录制模式下读取响应时同时录制 fixture"""
+        session_kwargs: dict[str, Any] = {'timeout': self.timeout, 'trace_configs': self._trace_configs}
+        if self.keep_alive:
+            session_kwargs.update({'connector': self._get_shared_connector(), 'connector_owner': False})
+        if self._replay_config.http_fetcher_mode == 'record':
+            session_kwargs.update({'response_class': RecordingClientResponse})
+        return aiohttp.ClientSession(**session_kwargs)
+
+    @classmethod
+    def _prepare_url(cls, url: str) -> str:
+        """回放模式下将请求发送到本地回放服务器"""
+        if cls._replay_config.http_fetcher_mode == 'replay':
+            return rewrite_replay_url(url)
+        return url
+
+    @classmethod
+    def _get_proxy_url(cls) -> str | None:
+        if cls._replay_config.http_fetcher_mode == 'replay':
+            return None
+        return cls._http_proxy_config.proxy_url
+
+    @classmethod
+    async def invalidate_cache(
+            cls,
+            url: str | None = None,
+            *,
+            params: dict[str, str] | None = None,
+            cache_key: str | None = None) -> None:
+        """删除 get 请求的响应缓存, 用于响应内容状态码正常但实际为错误信息的情况"""
+        if cache_key is None and url is None:
+            raise ValueError('url or cache_key must be provided')
+        key = http_response_cache.generate_key(url, params) if cache_key is None else cache_key
+        await http_response_cache.delete(key=key)
+
     @classmethod
     @run_async_catching_exception
     async def check_proxy(cls) -> HttpFetcherBytesResult:
@@ -100,6 +166,65 @@ class HttpFetcher(object):
         check_result = await cls(timeout=check_timeout).get_bytes(url=check_url)
         return check_result
 
+    async def _get_with_cache(
+            self,
+            url: str,
+            *,
+            params: dict[str, str] | None = None,
+            cache_ttl: int,
+            cache_key: str | None = None,
+            **kwargs: Any) -> HttpCacheEntry:
+        """使用 get 方法请求目标并使用响应缓存
+
+        缓存未过期时直接返回缓存内容, 已过期时携带 If-None-Match/If-Modified-Since 重新验证, 收到 304 时续期缓存
+
+        :param url: 链接
+        :param params: 请求参数
+        :param cache_ttl: 缓存有效时间, 秒
+        :param cache_key: 自定义缓存 key, 用于请求参数中带有时间戳或签名等每次都会变化的内容的情况
+        :param kwargs: ...
+        """
+        key = http_response_cache.generate_key(url, params) if cache_key is None else cache_key
+        cached_entry = await http_response_cache.get(key=key)
+        if cached_entry is not None and cached_entry.is_fresh:
+            return cached_entry
+
+        headers = deepcopy(self.headers) if self.headers is not None else {}
+        if cached_entry is not None:
+            headers.update(cached_entry.conditional_headers)
+
+        async with self._create_session() as session:
+            async with session.get(
+                    url=self._prepare_url(url),
+                    params=params,
+                    headers=headers,
+                    cookies=self.cookies,
+                    proxy=self._get_proxy_url(),
+                    timeout=self.timeout,
+                    **kwargs) as rp:
+                if rp.status == 304 and cached_entry is not None:
+                    cached_entry.expires_at = time.time() + cache_ttl
+                    cached_entry.etag = rp.headers.get('ETag', cached_entry.etag)
+                    cached_entry.last_modified = rp.headers.get('Last-Modified', cached_entry.last_modified)
+                    await http_response_cache.set(key=key, entry=cached_entry)
+                    return cached_entry
+
+                _bytes = await rp.read()
+                entry = HttpCacheEntry(
+                    status=rp.status,
+                    headers={k: v for k, v in rp.headers.items()},
+                    body=_bytes,
+                    charset=rp.charset,
+                    etag=rp.headers.get('ETag'),
+                    last_modified=rp.headers.get('Last-Modified'),
+                    expires_at=time.time() + cache_ttl
+                )
+
+        if rp.status == 200 and 'no-store' not in rp.headers.get('Cache-Control', ''):
+            await http_response_cache.set(key=key, entry=entry)
+        return entry
+
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def download_file(
             self,
@@ -116,13 +241,13 @@ class HttpFetcher(object):
         :param kwargs: ...
         :return: 下载文件路径 file url
         """
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        async with self._create_session() as session:
             async with session.get(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _file_bytes = await rp.read()
@@ -133,6 +258,7 @@ class HttpFetcher(object):
             _result.update({'result': file.path.as_uri()})
         return HttpFetcherTextResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def get_json_dict(
             self,
@@ -140,21 +266,38 @@ class HttpFetcher(object):
             *,
             params: dict[str, str] | None = None,
             encoding: str | None = None,
+            cache_ttl: int | None = None,
+            cache_key: str | None = None,
             **kwargs: Any) -> HttpFetcherDictResult:
-        """使用 get 方法获取字典类型的 Json 目标"""
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        """使用 get 方法获取字典类型的 Json 目标
+
+        :param cache_ttl: 启用响应缓存并指定缓存有效时间(秒), 为 None 时不使用缓存
+        :param cache_key: 自定义缓存 key, 默认由 url 和 params 生成
+        """
+        if cache_ttl is not None:
+            _cached = await self._get_with_cache(
+                url=url, params=params, cache_ttl=cache_ttl, cache_key=cache_key, **kwargs)
+            _text = _cached.body.decode(encoding=encoding or _cached.charset or 'utf-8')
+            _json = await run_sync_if_large(ujson.loads)(_text)
+            return HttpFetcherDictResult(
+                status=_cached.status, headers=_cached.headers, cookies=None, result=_json)
+
+        async with self._create_session() as session:
             async with session.get(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
-                _json = await rp.json(encoding=encoding)
-                _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _json}
+                _text = await rp.text(encoding=encoding)
+                _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies}
+        # 大体积 Json 在线程池中解析, 避免阻塞事件循环
+        _result.update({'result': await run_sync_if_large(ujson.loads)(_text)})
         return HttpFetcherDictResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def get_json(
             self,
@@ -162,21 +305,35 @@ class HttpFetcher(object):
             *,
             params: dict[str, str] | None = None,
             encoding: str | None = None,
+            cache_ttl: int | None = None,
+            cache_key: str | None = None,
             **kwargs: Any) -> HttpFetcherJsonResult:
-        """使用 get 方法获取 Json 目标"""
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        """使用 get 方法获取 Json 目标
+
+        :param cache_ttl: 启用响应缓存并指定缓存有效时间(秒), 为 None 时不使用缓存
+        :param cache_key: 自定义缓存 key, 默认由 url 和 params 生成
+        """
+        if cache_ttl is not None:
+            _cached = await self._get_with_cache(
+                url=url, params=params, cache_ttl=cache_ttl, cache_key=cache_key, **kwargs)
+            _json = _cached.body.decode(encoding=encoding or _cached.charset or 'utf-8')
+            return HttpFetcherJsonResult(
+                status=_cached.status, headers=_cached.headers, cookies=None, result=_json)
+
+        async with self._create_session() as session:
             async with session.get(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _json = await rp.text(encoding=encoding)
                 _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _json}
         return HttpFetcherJsonResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def get_text(
             self,
@@ -184,42 +341,70 @@ class HttpFetcher(object):
             *,
             params: dict[str, str] | None = None,
             encoding: str | None = None,
+            cache_ttl: int | None = None,
+            cache_key: str | None = None,
             **kwargs: Any) -> HttpFetcherTextResult:
-        """使用 get 方法获取 Text 目标"""
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        """使用 get 方法获取 Text 目标
+
+        :param cache_ttl: 启用响应缓存并指定缓存有效时间(秒), 为 None 时不使用缓存
+        :param cache_key: 自定义缓存 key, 默认由 url 和 params 生成
+        """
+        if cache_ttl is not None:
+            _cached = await self._get_with_cache(
+                url=url, params=params, cache_ttl=cache_ttl, cache_key=cache_key, **kwargs)
+            _text = _cached.body.decode(encoding=encoding or _cached.charset or 'utf-8')
+            return HttpFetcherTextResult(
+                status=_cached.status, headers=_cached.headers, cookies=None, result=_text)
+
+        async with self._create_session() as session:
             async with session.get(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _text = await rp.text(encoding=encoding)
                 _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _text}
         return HttpFetcherTextResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def get_bytes(
             self,
             url: str,
             *,
             params: dict[str, str] | None = None,
+            cache_ttl: int | None = None,
+            cache_key: str | None = None,
             **kwargs: Any) -> HttpFetcherBytesResult:
-        """使用 get 方法获取 Bytes 目标"""
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        """使用 get 方法获取 Bytes 目标
+
+        :param cache_ttl: 启用响应缓存并指定缓存有效时间(秒), 为 None 时不使用缓存
+        :param cache_key: 自定义缓存 key, 默认由 url 和 params 生成
+        """
+        if cache_ttl is not None:
+            _cached = await self._get_with_cache(
+                url=url, params=params, cache_ttl=cache_ttl, cache_key=cache_key, **kwargs)
+            _bytes = _cached.body
+            return HttpFetcherBytesResult(
+                status=_cached.status, headers=_cached.headers, cookies=None, result=_bytes)
+
+        async with self._create_session() as session:
             async with session.get(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _bytes = await rp.read()
                 _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _bytes}
         return HttpFetcherBytesResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def post_json_dict(
             self,
@@ -232,21 +417,24 @@ class HttpFetcher(object):
             **kwargs: Any) -> HttpFetcherDictResult:
         """使用 post 方法获取字典类型的 Json 目标"""
         data = data if data is None else deepcopy(data)
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        async with self._create_session() as session:
             async with session.post(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     json=json,
                     data=data,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
-                _json = await rp.json(encoding=encoding)
-                _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _json}
+                _text = await rp.text(encoding=encoding)
+                _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies}
+        # 大体积 Json 在线程池中解析, 避免阻塞事件循环
+        _result.update({'result': await run_sync_if_large(ujson.loads)(_text)})
         return HttpFetcherDictResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def post_json(
             self,
@@ -259,21 +447,22 @@ class HttpFetcher(object):
             **kwargs: Any) -> HttpFetcherJsonResult:
         """使用 post 方法获取 Json 目标"""
         data = data if data is None else deepcopy(data)
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        async with self._create_session() as session:
             async with session.post(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     json=json,
                     data=data,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _json = await rp.text(encoding=encoding)
                 _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _json}
         return HttpFetcherJsonResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def post_text(
             self,
@@ -286,21 +475,22 @@ class HttpFetcher(object):
             **kwargs: Any) -> HttpFetcherTextResult:
         """使用 post 方法获取 Text 目标"""
         data = data if data is None else deepcopy(data)
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        async with self._create_session() as session:
             async with session.post(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     json=json,
                     data=data,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _text = await rp.text(encoding=encoding)
                 _result = {'status': rp.status, 'headers': rp.headers, 'cookies': rp.cookies, 'result': _text}
         return HttpFetcherTextResult(**_result)
 
+    @http_fetcher_metrics.count_attempts
     @retry(attempt_limit=_default_attempt_numbers)
     async def post_bytes(
             self,
@@ -312,15 +502,15 @@ class HttpFetcher(object):
             **kwargs: Any) -> HttpFetcherBytesResult:
         """使用 post 方法获取 Bytes 目标"""
         data = data if data is None else deepcopy(data)
-        async with aiohttp.ClientSession(timeout=self.timeout) as session:
+        async with self._create_session() as session:
             async with session.post(
-                    url=url,
+                    url=self._prepare_url(url),
                     params=params,
                     json=json,
                     data=data,
                     headers=self.headers,
                     cookies=self.cookies,
-                    proxy=self._http_proxy_config.proxy_url,
+                    proxy=self._get_proxy_url(),
                     timeout=self.timeout,
                     **kwargs) as rp:
                 _bytes = await rp.read()
@@ -328,8 +518,14 @@ class HttpFetcher(object):
         return HttpFetcherBytesResult(**_result)
 
 
+@get_driver().on_shutdown
+async def _close_http_fetcher_shared_connector() -> None:
+    await HttpFetcher.close_shared_connector()
+
+
 __all__ = [
     'HttpFetcher',
+    'http_fetcher_metrics',
     'HttpFetcherJsonResult',
     'HttpFetcherDictResult',
     'HttpFetcherTextResult',
@@ -0,0 +1,207 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/10 15:21
+@FileName       : cache.py
+@Project        : nonebot2_miya
+@Description    : HttpFetcher GET 响应缓存, 内存 + 磁盘两级, 支持 ETag/Last-Modified 条件请求
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import time
+import hashlib
+import msgpack
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from nonebot import get_driver, logger
+
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.process_utils import run_sync
+
+
+@dataclass
+class HttpCacheEntry:
+    """缓存的 GET 响应"""
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    charset: str | None = None
+    etag: str | None = None
+    last_modified: str | None = None
+    expires_at: float = field(default_factory=time.time)
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    @property
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+    @property
+    def conditional_headers(self) -> dict[str, str]:
+        """用于重新验证的条件请求头"""
+        headers = {}
+        if self.etag is not None:
+            headers.update({'If-None-Match': self.etag})
+        if self.last_modified is not None:
+            headers.update({'If-Modified-Since': self.last_modified})
+        return headers
+
+    def dumps(self) -> bytes:
+        return msgpack.packb({
+            'status': self.status,
+            'headers': self.headers,
+            'body': self.body,
+            'charset': self.charset,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'expires_at': self.expires_at
+        }, use_bin_type=True)
+
+    @classmethod
+    def loads(cls, data: bytes) -> "HttpCacheEntry":
+        return cls(**msgpack.unpackb(data, raw=False))
+
+
+class HttpResponseCache(object):
+    """HttpFetcher GET 响应缓存
+
+    - 内存层: 按 LRU 淘汰的有界 OrderedDict, 只保存体积较小的响应
+    - 磁盘层: 以 key 的 hash 为文件名保存于 TmpResource 中
+    - 过期的条目若带有 ETag/Last-Modified 则继续保留一段时间用于条件请求, 超过保留期后才会被清理
+    """
+    _memory_max_entries: int = 256  # 内存层最大条目数
+    _memory_max_body_size: int = 2 * 1024 * 1024  # 进入内存层的最大响应体积
+    _disk_max_body_size: int = 16 * 1024 * 1024  # 进入磁盘层的最大响应体积
+    _stale_keep_time: int = 86400  # 过期条目保留用于重新验证的时间
+    _cache_folder: TmpResource = TmpResource('http_fetcher', 'cache')
+
+    def __init__(self) -> None:
+        self._memory: OrderedDict[str, HttpCacheEntry] = OrderedDict()
+
+    @staticmethod
+    def generate_key(url: str, params: dict[str, Any] | None = None) -> str:
+        """根据 url 和请求参数生成缓存 key"""
+        if params:
+            _params = '&'.join(f'{k}={v}' for k, v in sorted(params.items(), key=lambda x: str(x[0])))
+            return f'GET {url}?{_params}'
+        return f'GET {url}'
+
+    def _get_disk_file(self, key: str) -> TmpResource:
+        return self._cache_folder(f'{hashlib.sha1(key.encode(encoding="utf8")).hexdigest()}.cache')
+
+    def _memory_set(self, key: str, entry: HttpCacheEntry) -> None:
+        if len(entry.body) > self._memory_max_body_size:
+            self._memory.pop(key, None)
+            return
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._memory_max_entries:
+            self._memory.popitem(last=False)
+
+    def _is_expired_for_keep(self, entry: HttpCacheEntry) -> bool:
+        """条目是否已经超过了可保留的时间"""
+        if entry.is_fresh:
+            return False
+        if not entry.can_revalidate:
+            return True
+        return time.time() > entry.expires_at + self._stale_keep_time
+
+    async def get(self, key: str) -> HttpCacheEntry | None:
+        """获取缓存条目, 可能为已过期但可用于重新验证的条目"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+
+        file = self._get_disk_file(key=key)
+        if not file.is_file:
+            return None
+        try:
+            async with file.async_open(mode='rb') as af:
+                entry = HttpCacheEntry.loads(await af.read())
+        except Exception as e:
+            logger.debug(f'HttpResponseCache | Loading cache file {file} failed, {e}')
+            file.path.unlink(missing_ok=True)
+            return None
+
+        if self._is_expired_for_keep(entry=entry):
+            file.path.unlink(missing_ok=True)
+            return None
+
+        self._memory_set(key=key, entry=entry)
+        return entry
+
+    @staticmethod
+    def _write_disk_file(file: TmpResource, data: bytes) -> None:
+        """使用唯一的临时文件名写入后再替换, 避免同一 key 的并发写入共用同一个临时文件"""
+        file.path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=file.path.parent, suffix='.tmp', delete=False) as f:
+            tmp_path = f.name
+            f.write(data)
+        try:
+            os.replace(tmp_path, file.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    async def set(self, key: str, entry: HttpCacheEntry) -> None:
+        """写入缓存条目"""
+        self._memory_set(key=key, entry=entry)
+        if len(entry.body) > self._disk_max_body_size:
+            return
+
+        file = self._get_disk_file(key=key)
+        try:
+            await run_sync(self._write_disk_file)(file=file, data=entry.dumps())
+        except Exception as e:
+            logger.debug(f'HttpResponseCache | Writing cache file {file} failed, {e}')
+
+    async def delete(self, key: str) -> None:
+        """删除缓存条目"""
+        self._memory.pop(key, None)
+        self._get_disk_file(key=key).path.unlink(missing_ok=True)
+
+    def _clear_expired_disk_cache(self) -> int:
+        if not self._cache_folder.is_dir:
+            return 0
+
+        count = 0
+        for file in self._cache_folder.path.iterdir():
+            try:
+                with file.open(mode='rb') as f:
+                    entry = HttpCacheEntry.loads(f.read())
+                if not self._is_expired_for_keep(entry=entry):
+                    continue
+            except Exception as e:
+                logger.debug(f'HttpResponseCache | Cache file {file} broken, {e}')
+            file.unlink(missing_ok=True)
+            count += 1
+        return count
+
+    async def clear_expired(self) -> int:
+        """清理内存层及磁盘层中已无法使用的过期条目, 返回清理的磁盘文件数"""
+        for key in [k for k, v in self._memory.items() if self._is_expired_for_keep(entry=v)]:
+            self._memory.pop(key, None)
+        return await run_sync(self._clear_expired_disk_cache)()
+
+
+http_response_cache = HttpResponseCache()
+
+
+@get_driver().on_startup
+async def _clear_expired_http_response_cache() -> None:
+    """启动时清理磁盘上过期的响应缓存"""
+    count = await http_response_cache.clear_expired()
+    logger.opt(colors=True).debug(f'<lc>HttpFetcher</lc> | Cleared {count} expired response cache file(s)')
+
+
+__all__ = [
+    'HttpCacheEntry',
+    'http_response_cache'
+]
@@ -8,9 +8,12 @@
 @Software       : PyCharm 
 """
 
+from dataclasses import dataclass
 from nonebot import get_driver, logger
 from typing import Literal
-from pydantic import BaseModel, IPvAnyAddress, AnyHttpUrl, ValidationError
+from pydantic import BaseModel, IPvAnyAddress, AnyHttpUrl, ValidationError, confloat
+
+from omega_miya.local_resource import TmpResource
 
 
 class HttpProxyConfig(BaseModel):
@@ -34,8 +37,48 @@ class HttpProxyConfig(BaseModel):
         return proxy
 
 
+class HttpFetcherReplayConfig(BaseModel):
+    """HttpFetcher 录制/回放配置, 用于离线压测及回归测试
+
+    - live: 正常请求
+    - record: 正常请求并将响应录制到本地 fixture 文件
+    - replay: 所有请求都发送到本地回放服务器, 由 fixture 文件响应, 不访问网络
+    """
+    http_fetcher_mode: Literal['live', 'record', 'replay'] = 'live'
+    http_fetcher_replay_host: IPvAnyAddress = '127.0.0.1'
+    http_fetcher_replay_port: int = 18089
+    # 回放时注入的响应延迟及随机抖动, 单位秒
+    http_fetcher_replay_latency: confloat(ge=0) = 0
+    http_fetcher_replay_latency_jitter: confloat(ge=0) = 0
+    # 回放时按概率注入错误响应
+    http_fetcher_replay_error_rate: confloat(ge=0, le=1) = 0
+    http_fetcher_replay_error_status: int = 503
+    # 录制时每个请求保留的最近响应数量, 回放时按顺序循环返回
+    http_fetcher_record_max_responses: int = 8
+    # 生成 fixture key 时忽略的请求参数, 如时间戳及签名等每次请求都会变化的参数
+    http_fetcher_fixture_ignored_params: list[str] = ['wts', 'w_rid']
+
+    class Config:
+        extra = "ignore"
+
+    @property
+    def replay_server_url(self) -> str:
+        return f'http://{self.http_fetcher_replay_host}:{self.http_fetcher_replay_port}'
+
+
+@dataclass
+class HttpFetcherLocalResourceConfig:
+    # 录制的 fixture 文件保存路径
+    default_fixture_folder: TmpResource = TmpResource('http_fetcher', 'fixtures')
+
+
 try:
     http_proxy_config = HttpProxyConfig.parse_obj(get_driver().config)  # 导入并验证代理配置
+    http_fetcher_replay_config = HttpFetcherReplayConfig.parse_obj(get_driver().config)
+    http_fetcher_resource_config = HttpFetcherLocalResourceConfig()
+    if http_fetcher_replay_config.http_fetcher_mode != 'live':
+        logger.opt(colors=True).warning(
+            f'<lc>HttpFetcher</lc> | <ly>Running in {http_fetcher_replay_config.http_fetcher_mode} mode</ly>')
 except ValidationError as e:
     import sys
     logger.opt(colors=True).critical(f'<r>Http 代理配置格式验证失败</r>, 错误信息:\n{e}')
@@ -43,5 +86,7 @@ except ValidationError as e:
 
 
 __all__ = [
-    'http_proxy_config'
+    'http_proxy_config',
+    'http_fetcher_replay_config',
+    'http_fetcher_resource_config'
 ]
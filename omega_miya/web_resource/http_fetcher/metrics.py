@@ -0,0 +1,210 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/11 20:47
+@FileName       : metrics.py
+@Project        : nonebot2_miya
+@Description    : HttpFetcher 请求统计, 按 host 记录请求数, 状态码, 延迟分布, 流量及重试次数
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+import asyncio
+import aiohttp
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import wraps
+from types import SimpleNamespace
+from typing import TypeVar, ParamSpec, Callable, Coroutine, Any
+
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+_LATENCY_BUCKETS: tuple[float, ...] = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+"""延迟分布统计的桶上界, 单位秒, 超过最后一个桶的计入 +Inf"""
+
+_attempt_counter: ContextVar[list[int] | None] = ContextVar('_http_fetcher_attempt_counter', default=None)
+"""当前请求方法调用内已发起的请求次数, 用于统计 retry 装饰器触发的重试"""
+
+
+@dataclass
+class HostMetrics:
+    """单个 host 的请求统计"""
+    request_count: int = 0
+    error_count: int = 0
+    retry_count: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    latency_sum: float = 0
+    latency_max: float = 0
+    status_count: dict[int, int] = field(default_factory=dict)
+    error_types: dict[str, int] = field(default_factory=dict)
+    latency_histogram: list[int] = field(default_factory=lambda: [0] * (len(_LATENCY_BUCKETS) + 1))
+
+    @property
+    def finished_count(self) -> int:
+        return sum(self.latency_histogram)
+
+    @property
+    def latency_avg(self) -> float:
+        return self.latency_sum / self.finished_count if self.finished_count else 0
+
+    def observe_latency(self, latency: float) -> None:
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        for index, upper_bound in enumerate(_LATENCY_BUCKETS):
+            if latency <= upper_bound:
+                self.latency_histogram[index] += 1
+                break
+        else:
+            self.latency_histogram[-1] += 1
+
+    def latency_quantile(self, quantile: float) -> float:
+        """根据延迟分布估算分位数, 返回所在桶的上界"""
+        if not self.finished_count:
+            return 0
+        threshold = self.finished_count * quantile
+        accumulated = 0
+        for index, count in enumerate(self.latency_histogram):
+            accumulated += count
+            if accumulated >= threshold:
+                return _LATENCY_BUCKETS[index] if index < len(_LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'request_count': self.request_count,
+            'error_count': self.error_count,
+            'retry_count': self.retry_count,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'latency_avg': round(self.latency_avg, 4),
+            'latency_max': round(self.latency_max, 4),
+            'latency_p50': self.latency_quantile(0.5),
+            'latency_p95': self.latency_quantile(0.95),
+            'latency_histogram': {
+                **{f'le_{x}': y for x, y in zip(_LATENCY_BUCKETS, self.latency_histogram)},
+                'le_inf': self.latency_histogram[-1]
+            },
+            'status_count': {str(x): y for x, y in self.status_count.items()},
+            'error_types': self.error_types
+        }
+
+
+class HttpFetcherMetrics(object):
+    """HttpFetcher 请求统计, 通过 aiohttp TraceConfig 收集, 仅保存在内存中"""
+
+    def __init__(self) -> None:
+        self._hosts: dict[str, HostMetrics] = {}
+        self._start_time: datetime = datetime.now()
+
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(self._on_request_start)
+        self.trace_config.on_request_chunk_sent.append(self._on_request_chunk_sent)
+        self.trace_config.on_response_chunk_received.append(self._on_response_chunk_received)
+        self.trace_config.on_request_end.append(self._on_request_end)
+        self.trace_config.on_request_exception.append(self._on_request_exception)
+
+    @property
+    def start_time(self) -> datetime:
+        return self._start_time
+
+    def _get_host(self, url: Any) -> HostMetrics:
+        host = getattr(url, 'host', None) or 'unknown'
+        if host not in self._hosts:
+            self._hosts[host] = HostMetrics()
+        return self._hosts[host]
+
+    async def _on_request_start(
+            self,
+            _: aiohttp.ClientSession,
+            ctx: SimpleNamespace,
+            params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        ctx.start_time = time.perf_counter()
+        ctx.host_metrics = self._get_host(params.url)
+        ctx.host_metrics.request_count += 1
+
+        attempt_counter = _attempt_counter.get()
+        if attempt_counter is not None:
+            attempt_counter[0] += 1
+            if attempt_counter[0] > 1:
+                ctx.host_metrics.retry_count += 1
+
+    async def _on_request_chunk_sent(
+            self,
+            _: aiohttp.ClientSession,
+            ctx: SimpleNamespace,
+            params: aiohttp.TraceRequestChunkSentParams
+    ) -> None:
+        ctx.host_metrics.bytes_sent += len(params.chunk)
+
+    async def _on_response_chunk_received(
+            self,
+            _: aiohttp.ClientSession,
+            ctx: SimpleNamespace,
+            params: aiohttp.TraceResponseChunkReceivedParams
+    ) -> None:
+        ctx.host_metrics.bytes_received += len(params.chunk)
+
+    async def _on_request_end(
+            self,
+            _: aiohttp.ClientSession,
+            ctx: SimpleNamespace,
+            params: aiohttp.TraceRequestEndParams
+    ) -> None:
+        ctx.host_metrics.observe_latency(time.perf_counter() - ctx.start_time)
+        status = params.response.status
+        ctx.host_metrics.status_count[status] = ctx.host_metrics.status_count.get(status, 0) + 1
+
+    async def _on_request_exception(
+            self,
+            _: aiohttp.ClientSession,
+            ctx: SimpleNamespace,
+            params: aiohttp.TraceRequestExceptionParams
+    ) -> None:
+        ctx.host_metrics.observe_latency(time.perf_counter() - ctx.start_time)
+        ctx.host_metrics.error_count += 1
+        error_type = params.exception.__class__.__name__
+        if isinstance(params.exception, asyncio.TimeoutError):
+            error_type = 'TimeoutError'
+        ctx.host_metrics.error_types[error_type] = ctx.host_metrics.error_types.get(error_type, 0) + 1
+
+    @staticmethod
+    def count_attempts(func: Callable[P, Coroutine[None, None, R]]) -> Callable[P, Coroutine[None, None, R]]:
+        """装饰 HttpFetcher 的请求方法, 需位于 retry 装饰器外层, 用于识别同一次调用中由重试发起的请求"""
+
+        @wraps(func)
+        async def _wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            token = _attempt_counter.set([0])
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _attempt_counter.reset(token)
+
+        return _wrapper
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """获取当前各 host 的统计数据"""
+        return {host: metrics.to_dict() for host, metrics in self._hosts.items()}
+
+    def get_sorted_hosts(self) -> list[tuple[str, HostMetrics]]:
+        """按总等待时间由高到低排序的各 host 统计"""
+        return sorted(self._hosts.items(), key=lambda x: x[1].latency_sum, reverse=True)
+
+    def reset(self) -> None:
+        """清空统计数据"""
+        self._hosts.clear()
+        self._start_time = datetime.now()
+
+
+http_fetcher_metrics = HttpFetcherMetrics()
+
+
+__all__ = [
+    'HostMetrics',
+    'http_fetcher_metrics'
+]
@@ -0,0 +1,165 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/12 22:05
+@FileName       : replay.py
+@Project        : nonebot2_miya
+@Description    : HttpFetcher 请求录制及本地回放服务器, 用于离线压测及回归测试
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import base64
+import random
+import asyncio
+import hashlib
+import aiohttp
+import ujson as json
+from aiohttp import web
+from yarl import URL
+
+from nonebot import get_driver, logger
+
+from omega_miya.local_resource import TmpResource
+
+from .config import http_fetcher_replay_config, http_fetcher_resource_config
+
+
+# 回放时不返回的响应头, 录制的 body 已经过解压
+_REPLAY_SKIPPED_HEADERS: set[str] = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+def _generate_fixture_key(method: str, url: URL) -> str:
+    """根据请求方法和 url 生成 fixture key, 忽略配置中指定的请求参数"""
+    ignored_params = http_fetcher_replay_config.http_fetcher_fixture_ignored_params
+    query = sorted((k, v) for k, v in url.query.items() if k not in ignored_params)
+    return f'{method.upper()} {url.with_query(query)}'
+
+
+def _get_fixture_file(method: str, url: URL) -> TmpResource:
+    key = _generate_fixture_key(method=method, url=url)
+    file_name = f'{hashlib.sha1(key.encode(encoding="utf8")).hexdigest()}.json'
+    return http_fetcher_resource_config.default_fixture_folder(url.host or 'unknown', file_name)
+
+
+async def _load_fixture(file: TmpResource) -> dict | None:
+    if not file.is_file:
+        return None
+    async with file.async_open(mode='r', encoding='utf8') as af:
+        return json.loads(await af.read())
+
+
+class RecordingClientResponse(aiohttp.ClientResponse):
+    """在读取响应内容时将请求及响应录制为 fixture 文件的 ClientResponse"""
+
+    async def read(self) -> bytes:
+        body = await super().read()
+        try:
+            await self._record(body=body)
+        except Exception as e:
+            logger.opt(colors=True).warning(f'<lc>HttpFetcher</lc> | Recording fixture of {self.url} failed, {e}')
+        return body
+
+    async def _record(self, body: bytes) -> None:
+        # 发生重定向时以最初的请求 url 作为 key, 回放时直接返回最终的响应
+        request_info = self.history[0].request_info if self.history else self.request_info
+        method, url = request_info.method, request_info.url
+
+        file = _get_fixture_file(method=method, url=url)
+        fixture = await _load_fixture(file=file)
+        if fixture is None:
+            fixture = {'key': _generate_fixture_key(method=method, url=url), 'responses': []}
+
+        fixture['responses'].append({
+            'status': self.status,
+            'headers': [[k, v] for k, v in self.headers.items() if k.lower() not in _REPLAY_SKIPPED_HEADERS],
+            'body': base64.b64encode(body).decode(encoding='ascii')
+        })
+        fixture['responses'] = fixture['responses'][-http_fetcher_replay_config.http_fetcher_record_max_responses:]
+
+        async with file.async_open(mode='w', encoding='utf8') as af:
+            await af.write(json.dumps(fixture, ensure_ascii=False, indent=2))
+
+
+def rewrite_replay_url(url: str) -> str:
+    """将请求 url 改写为本地回放服务器的地址, 原始 url 的协议和 authority (host 及非默认端口) 编码在路径中"""
+    parsed_url = URL(url)
+    return f'{http_fetcher_replay_config.replay_server_url}/{parsed_url.scheme}/{parsed_url.raw_authority}' \
+           f'{parsed_url.raw_path_qs}'
+
+
+class ReplayServer(object):
+    """本地回放服务器, 从 fixture 文件中按顺序循环返回录制的响应, 可注入延迟及错误"""
+
+    def __init__(self) -> None:
+        self._runner: web.AppRunner | None = None
+        self._response_index: dict[str, int] = {}
+
+    @staticmethod
+    def _restore_url(request: web.Request) -> URL:
+        scheme, _, target = request.match_info['target'].partition('/')
+        authority, _, path = target.partition('/')
+        return URL.build(scheme=scheme, authority=authority, path=f'/{path}', query=request.query)
+
+    async def _inject(self) -> web.Response | None:
+        """注入延迟及错误响应"""
+        latency = http_fetcher_replay_config.http_fetcher_replay_latency
+        jitter = http_fetcher_replay_config.http_fetcher_replay_latency_jitter
+        if latency or jitter:
+            await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        if random.random() < http_fetcher_replay_config.http_fetcher_replay_error_rate:
+            return web.Response(status=http_fetcher_replay_config.http_fetcher_replay_error_status,
+                                text='Injected error by HttpFetcher replay server')
+        return None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        injected_response = await self._inject()
+        if injected_response is not None:
+            return injected_response
+
+        url = self._restore_url(request=request)
+        fixture = await _load_fixture(file=_get_fixture_file(method=request.method, url=url))
+        if fixture is None or not fixture.get('responses'):
+            logger.opt(colors=True).warning(f'<lc>HttpFetcher</lc> | Replay fixture not found, {request.method} {url}')
+            return web.Response(status=404, text=f'Replay fixture not found, {request.method} {url}')
+
+        key = fixture['key']
+        index = self._response_index.get(key, 0)
+        self._response_index[key] = index + 1
+        response = fixture['responses'][index % len(fixture['responses'])]
+
+        headers = [(k, v) for k, v in response['headers'] if k.lower() not in _REPLAY_SKIPPED_HEADERS]
+        return web.Response(status=response['status'], headers=headers, body=base64.b64decode(response['body']))
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route('*', '/{target:.+}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner,
+                           host=str(http_fetcher_replay_config.http_fetcher_replay_host),
+                           port=http_fetcher_replay_config.http_fetcher_replay_port)
+        await site.start()
+        logger.opt(colors=True).info(
+            f'<lc>HttpFetcher</lc> | Replay server running at '
+            f'<b><u>{http_fetcher_replay_config.replay_server_url}</u></b>')
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+replay_server = ReplayServer()
+
+
+if http_fetcher_replay_config.http_fetcher_mode == 'replay':
+    get_driver().on_startup(replay_server.start)
+    get_driver().on_shutdown(replay_server.stop)
+
+
+__all__ = [
+    'RecordingClientResponse',
+    'rewrite_replay_url',
+    'replay_server'
+]
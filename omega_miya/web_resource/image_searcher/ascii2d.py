@@ -16,6 +16,7 @@ from nonebot.log import logger
 
 from omega_miya.web_resource import HttpFetcher
 from omega_miya.exception import WebSourceException
+from omega_miya.utils.process_utils import run_sync_if_large
 
 from .model import ImageSearcher, ImageSearchingResult
 
@@ -112,8 +113,8 @@ class Ascii2d(ImageSearcher):
 
         parsed_result = []
         if color_search_result.status == 200:
-            parsed_result.extend(self._parser(content=color_search_result.result))
+            parsed_result.extend(await run_sync_if_large(self._parser)(content=color_search_result.result))
         if bovw_search_result.status == 200:
-            parsed_result.extend(self._parser(content=bovw_search_result.result))
+            parsed_result.extend(await run_sync_if_large(self._parser)(content=bovw_search_result.result))
 
         return parse_obj_as(list[ImageSearchingResult], parsed_result)
@@ -15,6 +15,7 @@ from nonebot.log import logger
 
 from omega_miya.web_resource import HttpFetcher
 from omega_miya.exception import WebSourceException
+from omega_miya.utils.process_utils import run_sync_if_large
 
 from .model import ImageSearcher, ImageSearchingResult
 
@@ -109,7 +110,8 @@ class Iqdb(ImageSearcher):
             logger.error(f'Iqdb | IqdbNetworkError, {iqdb_result}')
             raise IqdbNetworkError(f'IqdbNetworkError, {iqdb_result}')
 
-        return parse_obj_as(list[ImageSearchingResult], self._parser(content=iqdb_result.result))
+        parsed_result = await run_sync_if_large(self._parser)(content=iqdb_result.result)
+        return parse_obj_as(list[ImageSearchingResult], parsed_result)
 
 
 __all__ = [
@@ -15,6 +15,7 @@ from nonebot.log import logger
 
 from omega_miya.web_resource import HttpFetcher
 from omega_miya.exception import WebSourceException
+from omega_miya.utils.process_utils import run_sync_if_large
 
 from .model import ImageSearcher, ImageSearchingResult
 
@@ -83,7 +84,8 @@ class Yandex(ImageSearcher):
             logger.error(f'Yandex | YandexNetworkError, {yandex_result}')
             raise YandexNetworkError(f'YandexNetworkError, {yandex_result}')
 
-        return parse_obj_as(list[ImageSearchingResult], self._parser(content=yandex_result.result)[:8])
+        parsed_result = await run_sync_if_large(self._parser)(content=yandex_result.result)
+        return parse_obj_as(list[ImageSearchingResult], parsed_result[:8])
 
 
 __all__ = [
@@ -0,0 +1,121 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/14 20:18
+@FileName       : cache.py
+@Project        : nonebot2_miya
+@Description    : Pixiv 作品信息进程级缓存, 内存 LRU + 磁盘 msgpack 两级
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+import msgpack
+from collections import OrderedDict
+from typing import Iterable
+
+from nonebot import logger
+
+from omega_miya.local_resource import TmpResource
+
+from .config import pixiv_resource_config
+from .model import PixivArtworkCompleteDataModel
+
+
+class PixivArtworkModelCache(object):
+    """Pixiv 作品信息缓存
+
+    - 内存层: 按 LRU 淘汰的有界 OrderedDict
+    - 磁盘层: 每个作品一个 msgpack 文件, 与内存层使用相同的过期时间
+    """
+    _cache_folder: TmpResource = pixiv_resource_config.default_artwork_model_cache_folder
+    _ttl: int = pixiv_resource_config.default_artwork_model_cache_ttl
+    _memory_max_entries: int = pixiv_resource_config.default_artwork_model_cache_memory_size
+
+    def __init__(self) -> None:
+        self._memory: OrderedDict[int, tuple[float, PixivArtworkCompleteDataModel]] = OrderedDict()
+
+    def _get_disk_file(self, pid: int) -> TmpResource:
+        return self._cache_folder(f'{pid}.msgpack')
+
+    def _memory_set(self, pid: int, expires_at: float, model: PixivArtworkCompleteDataModel) -> None:
+        self._memory[pid] = (expires_at, model)
+        self._memory.move_to_end(pid)
+        while len(self._memory) > self._memory_max_entries:
+            self._memory.popitem(last=False)
+
+    async def _load_from_disk(self, pid: int) -> tuple[float, PixivArtworkCompleteDataModel] | None:
+        file = self._get_disk_file(pid=pid)
+        if not file.is_file:
+            return None
+        try:
+            async with file.async_open(mode='rb') as af:
+                data = msgpack.unpackb(await af.read(), raw=False, strict_map_key=False)
+            expires_at = data['expires_at']
+            if time.time() >= expires_at:
+                file.path.unlink(missing_ok=True)
+                return None
+            return expires_at, PixivArtworkCompleteDataModel.parse_obj(data['model'])
+        except Exception as e:
+            logger.debug(f'PixivArtworkModelCache | Loading artwork({pid}) cache failed, {e}')
+            file.path.unlink(missing_ok=True)
+            return None
+
+    async def get(self, pid: int) -> PixivArtworkCompleteDataModel | None:
+        """获取缓存的作品信息, 不存在或已过期返回 None"""
+        memory_cached = self._memory.get(pid)
+        if memory_cached is not None:
+            expires_at, model = memory_cached
+            if time.time() < expires_at:
+                self._memory.move_to_end(pid)
+                return model
+            self._memory.pop(pid, None)
+
+        disk_cached = await self._load_from_disk(pid=pid)
+        if disk_cached is None:
+            return None
+
+        expires_at, model = disk_cached
+        self._memory_set(pid=pid, expires_at=expires_at, model=model)
+        return model
+
+    async def set(self, model: PixivArtworkCompleteDataModel, *, ttl: int | None = None) -> None:
+        """写入作品信息缓存
+
+        :param model: 作品信息
+        :param ttl: 缓存有效时间, 为 None 时使用默认值
+        """
+        expires_at = time.time() + (self._ttl if ttl is None else ttl)
+        self._memory_set(pid=model.pid, expires_at=expires_at, model=model)
+
+        file = self._get_disk_file(pid=model.pid)
+        try:
+            data = msgpack.packb({'expires_at': expires_at, 'model': model.dict()}, use_bin_type=True)
+            async with file.async_open(mode='wb') as af:
+                await af.write(data)
+        except Exception as e:
+            logger.debug(f'PixivArtworkModelCache | Writing artwork({model.pid}) cache failed, {e}')
+
+    async def delete(self, pid: int) -> None:
+        """删除作品信息缓存"""
+        self._memory.pop(pid, None)
+        self._get_disk_file(pid=pid).path.unlink(missing_ok=True)
+
+    async def warm_up(self, pids: Iterable[int]) -> list[int]:
+        """从磁盘层预加载作品信息到内存层
+
+        :param pids: 需要预加载的作品 pid
+        :return: 磁盘层中不存在或已过期的作品 pid
+        """
+        missing_pids = []
+        for pid in pids:
+            if await self.get(pid=pid) is None:
+                missing_pids.append(pid)
+        return missing_pids
+
+
+pixiv_artwork_model_cache = PixivArtworkModelCache()
+
+
+__all__ = [
+    'pixiv_artwork_model_cache'
+]
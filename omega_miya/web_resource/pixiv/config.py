@@ -9,6 +9,7 @@
 """
 
 from dataclasses import dataclass
+from typing import Literal
 from nonebot import get_driver, logger
 from pydantic import BaseModel, ValidationError
 from omega_miya.local_resource import LocalResource, TmpResource
@@ -17,6 +18,12 @@ from omega_miya.local_resource import LocalResource, TmpResource
 class PixivConfig(BaseModel):
     """Pixiv 配置"""
     pixiv_phpsessid: str | None = None
+    # 作品图片缓存容量上限, 单位 MB
+    pixiv_artwork_cache_quota: int = 10240
+    # 各类型作品图片缓存容量上限, 单位 MB, 未配置的类型仅受总容量上限限制, 如: {"original": 4096}
+    pixiv_artwork_cache_type_quota: dict[Literal['original', 'regular', 'small', 'thumb_mini'], int] = {}
+    # 作品图片缓存淘汰策略, lru: 最近最少使用, lfu: 最不经常使用
+    pixiv_artwork_cache_policy: Literal['lru', 'lfu'] = 'lru'
 
     class Config:
         extra = "ignore"
@@ -36,10 +43,21 @@ class PixivLocalResourceConfig:
     default_preview_font: LocalResource = default_font_folder('fzzxhk.ttf')
     # 默认的缓存资源保存路径
     default_artwork_folder: TmpResource = TmpResource('pixiv', 'artwork')
+    default_artwork_index_file: TmpResource = TmpResource('pixiv', 'artwork_index.msgpack')
     default_download_folder: TmpResource = TmpResource('pixiv', 'download')
     default_ugoira_gif_folder: TmpResource = TmpResource('pixiv', 'ugoira_gif')
+    # 作品信息缓存
+    default_artwork_model_cache_folder: TmpResource = TmpResource('pixiv', 'artwork_model')
+    default_artwork_model_cache_ttl: int = 86400  # 作品信息缓存有效时间, 单位秒
+    default_artwork_model_cache_memory_size: int = 1024  # 作品信息内存缓存数量上限
+    # 排行榜及搜索结果缓存
+    default_result_cache_folder: TmpResource = TmpResource('pixiv', 'result_cache')
+    default_searching_result_cache_ttl: int = 3600  # 搜索结果缓存有效时间, 单位秒, 排行榜缓存至下次榜单更新
+    default_result_preview_cache_keep_time: int = 172800  # 预览图缓存保留时间, 单位秒
     # 图片绘制相关参数
     default_preview_img_folder: TmpResource = TmpResource('pixiv', 'preview')
+    default_preview_tile_folder: TmpResource = TmpResource('pixiv', 'preview_tile')  # 预览图中单个作品缩略图缓存
+    default_preview_tile_keep_time: int = 604800  # 缩略图缓存保留时间, 单位秒, 超过该时间未使用的缩略图会被定期清理
     default_preview_size: tuple[int, int] = (250, 250)  # 默认预览图缩略图大小
     user_searching_card_ratio: float = 6.75  # 注意这里的图片长宽比会直接影响到排版 不要随便改
     user_searching_card_num: int = 8  # 图中绘制的画师搜索结果数量限制
@@ -0,0 +1,261 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/15 21:40
+@FileName       : page_cache.py
+@Project        : nonebot2_miya
+@Description    : Pixiv 作品图片磁盘缓存管理, 容量限制及 LRU/LFU 淘汰
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import os
+import time
+import asyncio
+import msgpack
+from dataclasses import dataclass
+from typing import Literal
+
+from nonebot import get_driver, logger
+
+from omega_miya.utils.process_utils import run_sync
+
+from .config import pixiv_config, pixiv_resource_config
+
+
+_URL_TYPE_EVICTION_ORDER: tuple[str, ...] = ('original', 'regular', 'small', 'thumb_mini')
+"""淘汰时各类型图片的优先顺序, 原图最先被淘汰, 缩略图最后"""
+
+_EVICTION_LOW_WATER_RATIO: float = 0.9
+"""超出容量上限时一次性淘汰到上限的该比例以下, 避免频繁淘汰"""
+
+_INDEX_FLUSH_INTERVAL: int = 300
+"""索引写入磁盘的最小间隔, 单位秒"""
+
+
+@dataclass
+class PageCacheEntry:
+    """缓存文件索引条目"""
+    url_type: str
+    size: int
+    last_access: float
+    access_count: int = 1
+
+
+class PixivArtworkPageCache(object):
+    """Pixiv 作品图片磁盘缓存
+
+    在内存中维护缓存文件的索引(类型, 大小, 访问时间, 访问次数)并定期持久化,
+    查询时不再访问文件系统, 写入新文件时按容量上限及淘汰策略删除旧文件
+    """
+    _cache_folder = pixiv_resource_config.default_artwork_folder
+    _index_file = pixiv_resource_config.default_artwork_index_file
+    _quota: int = pixiv_config.pixiv_artwork_cache_quota * 1024 * 1024
+    _type_quota: dict[str, int] = {k: v * 1024 * 1024 for k, v in pixiv_config.pixiv_artwork_cache_type_quota.items()}
+    _policy: Literal['lru', 'lfu'] = pixiv_config.pixiv_artwork_cache_policy
+
+    def __init__(self) -> None:
+        self._index: dict[str, PageCacheEntry] | None = None
+        self._type_size: dict[str, int] = {x: 0 for x in _URL_TYPE_EVICTION_ORDER}
+        self._load_lock = asyncio.Lock()
+        self._evict_lock = asyncio.Lock()
+        self._dirty: bool = False
+        self._last_flush: float = time.time()
+
+    @staticmethod
+    def get_file_name(pid: int, url_type: str, page: int) -> str:
+        return f'{pid}_{url_type}_p{page}'
+
+    @staticmethod
+    def _parse_url_type(file_name: str) -> str:
+        """从文件名 {pid}_{url_type}_p{page} 中解析图片类型"""
+        url_type = file_name.split('_', maxsplit=1)[-1].rsplit('_p', maxsplit=1)[0]
+        return url_type if url_type in _URL_TYPE_EVICTION_ORDER else 'original'
+
+    @property
+    def total_size(self) -> int:
+        return sum(self._type_size.values())
+
+    def _load_index(self) -> dict[str, PageCacheEntry]:
+        """读取索引文件并与缓存文件夹中的实际文件进行核对"""
+        index: dict[str, PageCacheEntry] = {}
+        if self._index_file.is_file:
+            try:
+                with self._index_file.open(mode='rb') as f:
+                    raw_index = msgpack.unpackb(f.read(), raw=False)
+                index.update({k: PageCacheEntry(*v) for k, v in raw_index.items()})
+            except Exception as e:
+                logger.warning(f'PixivArtworkPageCache | Loading index file failed, index will be rebuilt, {e}')
+
+        on_disk: dict[str, os.stat_result] = {}
+        if self._cache_folder.is_dir:
+            with os.scandir(self._cache_folder.path) as it:
+                on_disk.update({x.name: x.stat() for x in it if x.is_file()})
+
+        checked_index: dict[str, PageCacheEntry] = {}
+        for file_name, stat in on_disk.items():
+            entry = index.get(file_name)
+            if entry is None:
+                entry = PageCacheEntry(url_type=self._parse_url_type(file_name), size=stat.st_size,
+                                       last_access=stat.st_atime)
+            entry.size = stat.st_size
+            checked_index[file_name] = entry
+        return checked_index
+
+    def _dump_index(self, raw_index: dict[str, list]) -> None:
+        tmp_file = self._index_file.path.with_suffix('.tmp')
+        tmp_file.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_file.open(mode='wb') as f:
+            f.write(msgpack.packb(raw_index, use_bin_type=True))
+        tmp_file.replace(self._index_file.path)
+
+    async def _ensure_loaded(self) -> dict[str, PageCacheEntry]:
+        if self._index is None:
+            async with self._load_lock:
+                if self._index is None:
+                    index = await run_sync(self._load_index)()
+                    for entry in index.values():
+                        self._type_size[entry.url_type] += entry.size
+                    self._index = index
+                    self._dirty = True
+                    logger.debug(f'PixivArtworkPageCache | Index loaded, {len(index)} file(s), '
+                                 f'{self.total_size / 1024 / 1024:.2f}MB')
+                    await self._evict_if_needed()
+        return self._index
+
+    def _remove_entry(self, file_name: str) -> None:
+        entry = self._index.pop(file_name, None)
+        if entry is not None:
+            self._type_size[entry.url_type] -= entry.size
+            self._dirty = True
+
+    def _sort_key(self, entry: PageCacheEntry) -> tuple[float, ...]:
+        if self._policy == 'lfu':
+            return entry.access_count, entry.last_access
+        return entry.last_access,
+
+    def _select_victims(
+            self,
+            candidates: list[tuple[str, PageCacheEntry]],
+            type_size: dict[str, int],
+            protected: str | None
+    ) -> list[str]:
+        """根据容量上限及淘汰策略选出需要删除的文件"""
+        victims: set[str] = set()
+
+        # 首先处理各类型的容量上限
+        for url_type, quota in self._type_quota.items():
+            if type_size.get(url_type, 0) <= quota:
+                continue
+            target = quota * _EVICTION_LOW_WATER_RATIO
+            typed_candidates = sorted((x for x in candidates if x[1].url_type == url_type and x[0] != protected),
+                                      key=lambda x: self._sort_key(x[1]))
+            for file_name, entry in typed_candidates:
+                if type_size[url_type] <= target:
+                    break
+                victims.add(file_name)
+                type_size[url_type] -= entry.size
+
+        # 然后处理总容量上限, 按类型优先级淘汰, 同类型内按淘汰策略排序
+        if sum(type_size.values()) > self._quota:
+            target = self._quota * _EVICTION_LOW_WATER_RATIO
+            total_size = sum(type_size.values())
+            sorted_candidates = sorted(
+                (x for x in candidates if x[0] not in victims and x[0] != protected),
+                key=lambda x: (_URL_TYPE_EVICTION_ORDER.index(x[1].url_type), *self._sort_key(x[1]))
+            )
+            for file_name, entry in sorted_candidates:
+                if total_size <= target:
+                    break
+                victims.add(file_name)
+                total_size -= entry.size
+
+        return list(victims)
+
+    def _delete_files(self, file_names: list[str]) -> None:
+        for file_name in file_names:
+            self._cache_folder(file_name).path.unlink(missing_ok=True)
+
+    def _is_over_quota(self) -> bool:
+        if self.total_size > self._quota:
+            return True
+        return any(self._type_size.get(k, 0) > v for k, v in self._type_quota.items())
+
+    async def _evict_if_needed(self, *, protected: str | None = None) -> None:
+        """超出容量上限时淘汰缓存文件
+
+        :param protected: 不会被淘汰的文件, 一般为刚写入的文件
+        """
+        if not self._is_over_quota() or self._evict_lock.locked():
+            return
+
+        async with self._evict_lock:
+            candidates = list(self._index.items())
+            victims = await run_sync(self._select_victims)(
+                candidates=candidates, type_size=self._type_size.copy(), protected=protected)
+            for file_name in victims:
+                self._remove_entry(file_name=file_name)
+            await run_sync(self._delete_files)(file_names=victims)
+            logger.debug(f'PixivArtworkPageCache | Evicted {len(victims)} file(s), '
+                         f'{self.total_size / 1024 / 1024:.2f}MB remaining')
+
+    async def flush(self, *, force: bool = False) -> None:
+        """将索引写入磁盘
+
+        :param force: 忽略写入间隔强制写入
+        """
+        if self._index is None or not self._dirty:
+            return
+        if not force and time.time() - self._last_flush < _INDEX_FLUSH_INTERVAL:
+            return
+
+        self._dirty = False
+        self._last_flush = time.time()
+        raw_index = {k: [v.url_type, v.size, v.last_access, v.access_count] for k, v in self._index.items()}
+        try:
+            await run_sync(self._dump_index)(raw_index=raw_index)
+        except Exception as e:
+            self._dirty = True
+            logger.warning(f'PixivArtworkPageCache | Writing index file failed, {e}')
+
+    async def lookup(self, file_name: str) -> bool:
+        """查询缓存文件是否存在, 存在时记录访问"""
+        index = await self._ensure_loaded()
+        entry = index.get(file_name)
+        if entry is None:
+            return False
+
+        entry.last_access = time.time()
+        entry.access_count += 1
+        self._dirty = True
+        await self.flush()
+        return True
+
+    async def add(self, file_name: str, url_type: str, size: int) -> None:
+        """记录新写入的缓存文件, 并在超出容量上限时淘汰旧文件"""
+        index = await self._ensure_loaded()
+        self._remove_entry(file_name=file_name)
+        index[file_name] = PageCacheEntry(url_type=url_type, size=size, last_access=time.time())
+        self._type_size[url_type] += size
+        self._dirty = True
+
+        await self._evict_if_needed(protected=file_name)
+        await self.flush()
+
+    async def discard(self, file_name: str) -> None:
+        """移除索引中已失效的缓存文件"""
+        await self._ensure_loaded()
+        self._remove_entry(file_name=file_name)
+        self._cache_folder(file_name).path.unlink(missing_ok=True)
+
+
+pixiv_artwork_page_cache = PixivArtworkPageCache()
+
+
+@get_driver().on_shutdown
+async def _flush_pixiv_artwork_page_cache_index() -> None:
+    await pixiv_artwork_page_cache.flush(force=True)
+
+
+__all__ = [
+    'pixiv_artwork_page_cache'
+]
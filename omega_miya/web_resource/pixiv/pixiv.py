@@ -1,19 +1,20 @@
 import re
+import time
 import pathlib
-import zipfile
-import imageio
 import asyncio
 from datetime import datetime
 from typing import Literal, Optional
 from urllib.parse import urlparse, quote
-from io import BytesIO
 
 from omega_miya.local_resource import TmpResource
 from omega_miya.web_resource import HttpFetcher
-from omega_miya.utils.process_utils import semaphore_gather, run_sync
-from omega_miya.utils.image_utils import ImageUtils
+from omega_miya.utils.process_utils import semaphore_gather, run_sync, run_sync_in_process
+from omega_miya.utils.image_utils import ImageUtils, encode_ugoira_frames
 
+from .cache import pixiv_artwork_model_cache
 from .config import pixiv_config, pixiv_resource_config
+from .page_cache import pixiv_artwork_page_cache
+from .result_cache import pixiv_result_cache
 from .exception import PixivApiError, PixivNetworkError
 from .model import (PixivArtworkDataModel, PixivArtworkPageModel, PixivArtworkUgoiraMeta,
                     PixivArtworkCompleteDataModel, PixivArtworkRecommendModel,
@@ -53,6 +54,25 @@ class Pixiv(object):
             await af.write(file_content.result)
         return local_file
 
+    @staticmethod
+    def _clear_expired_preview_tile_files() -> int:
+        count = 0
+        now = time.time()
+        tile_folder = pixiv_resource_config.default_preview_tile_folder
+        if tile_folder.is_dir:
+            for file in tile_folder.path.iterdir():
+                if now - file.stat().st_mtime > pixiv_resource_config.default_preview_tile_keep_time:
+                    file.unlink(missing_ok=True)
+                    count += 1
+        return count
+
+    @classmethod
+    async def clear_expired_cache(cls) -> int:
+        """清理过期的排行榜及搜索结果缓存和超过保留时间未使用的作品缩略图缓存, 返回清理的文件数"""
+        result_count = await pixiv_result_cache.clear_expired()
+        tile_count = await run_sync(cls._clear_expired_preview_tile_files)()
+        return result_count + tile_count
+
 
 class PixivRanking(Pixiv):
     """Pixiv 排行榜"""
@@ -72,58 +92,92 @@ class PixivRanking(Pixiv):
         :param page: 页数
         :param content: 作品类型, None 为全部
         """
+        cache_key = f'ranking_{mode}_{content}_p{page}'
+        cached_result = await pixiv_result_cache.get(key=cache_key)
+        if cached_result is not None:
+            return PixivRankingModel.parse_raw(cached_result)
+
         params = {'format': 'json', 'mode': mode, 'p': page}
         if content is not None:
             params.update({'content': content})
+        # 排行榜结果已按更新时间缓存, 不再使用响应缓存, 避免预热及榜单未更新时的重试取到过期的响应
         _ranking_data = await cls._api_fetcher.get_json_dict(url=cls._ranking_url, params=params)
         if _ranking_data.status != 200:
             raise PixivApiError(f'PixivApiError, {_ranking_data.result}')
-        return PixivRankingModel.parse_obj(_ranking_data.result)
+        ranking_model = PixivRankingModel.parse_obj(_ranking_data.result)
+
+        # 排行榜每天更新一次, 缓存至下次更新
+        await pixiv_result_cache.set(key=cache_key, result=ranking_model.json(),
+                                     expires_at=pixiv_result_cache.get_ranking_expires_at(ranking_model.date))
+        return ranking_model
 
     @classmethod
-    async def query_daily_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
-        ranking_result = await cls.query_ranking(mode='daily', page=page, content='illust')
-        name = f'Pixiv Daily Ranking {datetime.now().strftime("%Y-%m-%d")}'
+    async def _query_illust_ranking_with_preview(
+            cls,
+            mode: Literal['daily', 'weekly', 'monthly', 'daily_r18', 'weekly_r18'],
+            ranking_name: str,
+            *,
+            page: int = 1) -> TmpResource:
+        """获取插画排行榜并生成预览图, 榜单未更新时直接使用已生成的预览图"""
+        ranking_result = await cls.query_ranking(mode=mode, page=page, content='illust')
+        name = f'{ranking_name} {datetime.strptime(ranking_result.date, "%Y%m%d").strftime("%Y-%m-%d")}'
+
+        preview_key = pixiv_result_cache.generate_preview_key(preview_name=name, result=ranking_result.json())
+        cached_preview = await pixiv_result_cache.get_preview(preview_key=preview_key)
+        if cached_preview is not None:
+            return cached_preview
+
         preview_request = await emit_preview_model_from_ranking_model(ranking_name=name, model=ranking_result)
         preview_img_file = await generate_artworks_preview_image(
             preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=6)
-        return preview_img_file
+        return await pixiv_result_cache.set_preview(preview_key=preview_key, preview=preview_img_file)
+
+    @classmethod
+    async def query_daily_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
+        return await cls._query_illust_ranking_with_preview(mode='daily', ranking_name='Pixiv Daily Ranking', page=page)
 
     @classmethod
     async def query_weekly_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
-        ranking_result = await cls.query_ranking(mode='weekly', page=page, content='illust')
-        name = f'Pixiv Weekly Ranking {datetime.now().strftime("%Y-%m-%d")}'
-        preview_request = await emit_preview_model_from_ranking_model(ranking_name=name, model=ranking_result)
-        preview_img_file = await generate_artworks_preview_image(
-            preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=6)
-        return preview_img_file
+        return await cls._query_illust_ranking_with_preview(
+            mode='weekly', ranking_name='Pixiv Weekly Ranking', page=page)
 
     @classmethod
     async def query_monthly_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
-        ranking_result = await cls.query_ranking(mode='monthly', page=page, content='illust')
-        name = f'Pixiv Monthly Ranking {datetime.now().strftime("%Y-%m-%d")}'
-        preview_request = await emit_preview_model_from_ranking_model(ranking_name=name, model=ranking_result)
-        preview_img_file = await generate_artworks_preview_image(
-            preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=6)
-        return preview_img_file
+        return await cls._query_illust_ranking_with_preview(
+            mode='monthly', ranking_name='Pixiv Monthly Ranking', page=page)
 
     @classmethod
     async def query_daily_r18_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
-        ranking_result = await cls.query_ranking(mode='daily_r18', page=page, content='illust')
-        name = f'Pixiv R18 Daily Ranking {datetime.now().strftime("%Y-%m-%d")}'
-        preview_request = await emit_preview_model_from_ranking_model(ranking_name=name, model=ranking_result)
-        preview_img_file = await generate_artworks_preview_image(
-            preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=6)
-        return preview_img_file
+        return await cls._query_illust_ranking_with_preview(
+            mode='daily_r18', ranking_name='Pixiv R18 Daily Ranking', page=page)
 
     @classmethod
     async def query_weekly_r18_illust_ranking_with_preview(cls, page: int = 1) -> TmpResource:
-        ranking_result = await cls.query_ranking(mode='weekly_r18', page=page, content='illust')
-        name = f'Pixiv R18 Weekly Ranking {datetime.now().strftime("%Y-%m-%d")}'
-        preview_request = await emit_preview_model_from_ranking_model(ranking_name=name, model=ranking_result)
-        preview_img_file = await generate_artworks_preview_image(
-            preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=6)
-        return preview_img_file
+        return await cls._query_illust_ranking_with_preview(
+            mode='weekly_r18', ranking_name='Pixiv R18 Weekly Ranking', page=page)
+
+    @classmethod
+    async def prewarm_ranking_cache(
+            cls,
+            modes: tuple[Literal['daily', 'weekly', 'monthly', 'daily_r18', 'weekly_r18'], ...] = (
+                    'daily', 'weekly', 'monthly'),
+            *,
+            pages: int = 1) -> None:
+        """预先获取排行榜并生成预览图缓存
+
+        :param modes: 需要预热的排行榜类型
+        :param pages: 每个排行榜预热的页数
+        """
+        ranking_names = {
+            'daily': 'Pixiv Daily Ranking',
+            'weekly': 'Pixiv Weekly Ranking',
+            'monthly': 'Pixiv Monthly Ranking',
+            'daily_r18': 'Pixiv R18 Daily Ranking',
+            'weekly_r18': 'Pixiv R18 Weekly Ranking'
+        }
+        for mode in modes:
+            for page in range(1, pages + 1):
+                await cls._query_illust_ranking_with_preview(mode=mode, ranking_name=ranking_names[mode], page=page)
 
 
 class PixivSearching(Pixiv):
@@ -178,10 +232,32 @@ class PixivSearching(Pixiv):
         if bgt_:
             params.update({'bgt': bgt_})
         searching_url = f'{cls._search_url}{mode}/{word}'
+
+        cache_key = f'searching_{searching_url}?{"&".join(f"{k}={v}" for k, v in sorted(params.items()))}'
+        cached_result = await pixiv_result_cache.get(key=cache_key)
+        if cached_result is not None:
+            return PixivSearchingResultModel.parse_raw(cached_result)
+
         _searching_data = await cls._api_fetcher.get_json_dict(url=searching_url, params=params)
         if _searching_data.status != 200:
             raise PixivApiError(f'PixivApiError, {_searching_data.result}')
-        return PixivSearchingResultModel.parse_obj(_searching_data.result)
+        searching_model = PixivSearchingResultModel.parse_obj(_searching_data.result)
+
+        await pixiv_result_cache.set(key=cache_key, result=searching_model.json(),
+                                     expires_at=time.time() + pixiv_resource_config.default_searching_result_cache_ttl)
+        return searching_model
+
+    @classmethod
+    async def _generate_searching_preview(cls, name: str, searching_result: PixivSearchingResultModel) -> TmpResource:
+        """生成搜索结果预览图, 标题及搜索结果相同时直接使用已生成的预览图"""
+        preview_key = pixiv_result_cache.generate_preview_key(preview_name=name, result=searching_result.json())
+        cached_preview = await pixiv_result_cache.get_preview(preview_key=preview_key)
+        if cached_preview is not None:
+            return cached_preview
+
+        preview_request = await emit_preview_model_from_searching_model(searching_name=name, model=searching_result)
+        preview_img_file = await generate_artworks_preview_image(preview=preview_request)
+        return await pixiv_result_cache.set_preview(preview_key=preview_key, preview=preview_img_file)
 
     @classmethod
     async def search_by_default_popular_condition(cls, word: str) -> PixivSearchingResultModel:
@@ -210,18 +286,14 @@ class PixivSearching(Pixiv):
             word=word, mode=mode, page=page, order=order, mode_=mode_, s_mode_=s_mode_,
             type_=type_, ratio_=ratio_, scd_=scd_, ecd_=ecd_, blt_=blt_, bgt_=bgt_, lang_=lang_)
         name = f'Searching - {word}'
-        preview_request = await emit_preview_model_from_searching_model(searching_name=name, model=searching_result)
-        preview_img_file = await generate_artworks_preview_image(preview=preview_request)
-        return preview_img_file
+        return await cls._generate_searching_preview(name=name, searching_result=searching_result)
 
     @classmethod
     async def search_by_default_popular_condition_with_preview(cls, word: str) -> TmpResource:
         """搜索作品并生成预览图 (使用通用的好图筛选条件) (近三年的图) (会用到仅限pixiv高级会员可用的部分参数)"""
         searching_result = await cls.search_by_default_popular_condition(word=word)
         name = f'Searching - {word}'
-        preview_request = await emit_preview_model_from_searching_model(searching_name=name, model=searching_result)
-        preview_img_file = await generate_artworks_preview_image(preview=preview_request)
-        return preview_img_file
+        return await cls._generate_searching_preview(name=name, searching_result=searching_result)
 
 
 class PixivDiscovery(Pixiv):
@@ -249,8 +321,8 @@ class PixivDiscovery(Pixiv):
         discovery_result = await cls.query_discovery_artworks(limit=60)
         # 获取缩略图内容
         name = 'Pixiv Discovery'
-        preview_request = await _emit_preview_model_from_artwork_pids(preview_name=name,
-                                                                      pids=discovery_result.recommend_pids)
+        preview_request = await _emit_preview_model_from_artwork_pids(
+            preview_name=name, pids=discovery_result.recommend_pids, preview_size=(360, 360))
         preview_img_file = await generate_artworks_preview_image(
             preview=preview_request, preview_size=(360, 360), hold_ratio=True, num_of_line=6)
         return preview_img_file
@@ -274,8 +346,8 @@ class PixivDiscovery(Pixiv):
         recommend_result = await cls.query_recommend_illust()
         # 获取缩略图内容
         name = 'Pixiv Top Recommend'
-        preview_request = await _emit_preview_model_from_artwork_pids(preview_name=name,
-                                                                      pids=recommend_result.recommend_pids)
+        preview_request = await _emit_preview_model_from_artwork_pids(
+            preview_name=name, pids=recommend_result.recommend_pids, preview_size=(512, 512))
         preview_img_file = await generate_artworks_preview_image(
             preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=3)
         return preview_img_file
@@ -285,6 +357,7 @@ class PixivArtwork(Pixiv):
     """Pixiv 作品"""
     _artwork_root: str = 'https://www.pixiv.net/artworks/'
     _artwork_data_url: str = 'https://www.pixiv.net/ajax/illust/'
+    _ugoira_generating_tasks: dict[str, asyncio.Task[TmpResource]] = {}  # 正在生成的动图任务, 避免重复编码
 
     def __init__(self, pid: int):
         self.pid = pid
@@ -321,8 +394,33 @@ class PixivArtwork(Pixiv):
             raise PixivApiError(f'PixivApiError, {_ugoira_meta.result}')
         return PixivArtworkUgoiraMeta.parse_obj(_ugoira_meta.result)
 
+    @classmethod
+    async def preload_artwork_models(
+            cls,
+            pids: list[int],
+            *,
+            fetch_missing: bool = False,
+            semaphore_num: int = 5) -> int:
+        """预加载作品信息缓存
+
+        :param pids: 需要预加载的作品 pid
+        :param fetch_missing: 是否从 Pixiv 获取缓存中不存在的作品信息
+        :param semaphore_num: 获取作品信息的并发数
+        :return: 从 Pixiv 获取成功的作品数量
+        """
+        missing_pids = await pixiv_artwork_model_cache.warm_up(pids=pids)
+        if not fetch_missing or not missing_pids:
+            return 0
+
+        tasks = [cls(pid=pid).get_artwork_model() for pid in missing_pids]
+        results = await semaphore_gather(tasks=tasks, semaphore_num=semaphore_num, filter_exception=True)
+        return len(results)
+
     async def get_artwork_model(self) -> PixivArtworkCompleteDataModel:
-        """获取并初始化作品对应 PixivArtworkCompleteDataModel"""
+        """获取并初始化作品对应 PixivArtworkCompleteDataModel, 优先使用作品信息缓存"""
+        if not isinstance(self.artwork_model, PixivArtworkCompleteDataModel):
+            self.artwork_model = await pixiv_artwork_model_cache.get(pid=self.pid)
+
         if not isinstance(self.artwork_model, PixivArtworkCompleteDataModel):
             query_data_task = asyncio.create_task(self._query_data())
             query_page_data_task = asyncio.create_task(self._query_page_date())
@@ -399,6 +497,7 @@ class PixivArtwork(Pixiv):
                 'ugoira_meta': _ugoira_meta
             }
             self.artwork_model = PixivArtworkCompleteDataModel.parse_obj(_data)
+            await pixiv_artwork_model_cache.set(model=self.artwork_model)
 
         assert isinstance(self.artwork_model, PixivArtworkCompleteDataModel), 'Query artwork model failed'
         return self.artwork_model
@@ -434,17 +533,20 @@ class PixivArtwork(Pixiv):
         :param url_type: 类型, original: 原始图片, regular: 默认压缩大图, small: 小图, thumb_mini: 缩略图
         :return: 保存路径对象
         """
-        _page_file_name = f'{self.pid}_{url_type}_p{page}'
+        _page_file_name = pixiv_artwork_page_cache.get_file_name(pid=self.pid, url_type=url_type, page=page)
         _page_file = pixiv_resource_config.default_artwork_folder(_page_file_name)
 
-        # 如果已经存在则直接返回本地资源
-        if _page_file.path.exists() and _page_file.path.is_file():
-            return _page_file
+        # 如果已经存在则直接返回本地资源, 索引中存在但文件已被外部删除的需要重新下载
+        if await pixiv_artwork_page_cache.lookup(file_name=_page_file_name):
+            if _page_file.is_file:
+                return _page_file
+            await pixiv_artwork_page_cache.discard(file_name=_page_file_name)
 
         # 没有的话再下载并保存文件
         _content = await self._load_page_resource(page=page, url_type=url_type)
         async with _page_file.async_open('wb') as af:
             await af.write(_content)
+        await pixiv_artwork_page_cache.add(file_name=_page_file_name, url_type=url_type, size=len(_content))
         return _page_file
 
     async def _get_page_resource(
@@ -540,41 +642,64 @@ class PixivArtwork(Pixiv):
             ugoira_url = artwork_model.ugoira_meta.src
         return await self.download_file(url=ugoira_url)
 
+    async def _generate_ugoira(
+            self,
+            *,
+            ugoira_file: TmpResource,
+            original: bool,
+            format_: Literal['gif', 'webp'],
+            quality: int
+    ) -> TmpResource:
+        """内部方法, 下载动图资源并在进程池中编码, 写入缓存文件"""
+        artwork_model = await self.get_artwork_model()
+        zip_file = await self.download_ugoira(original=original)
+        frames = [(frame.file, frame.delay) for frame in artwork_model.ugoira_meta.frames]
+        ugoira_content = await run_sync_in_process(encode_ugoira_frames)(
+            ugoira_path=zip_file.resolve_path, frames=frames, format_=format_, quality=quality)
+
+        tmp_file = pixiv_resource_config.default_ugoira_gif_folder(f'{ugoira_file.path.name}.tmp')
+        async with tmp_file.async_open('wb') as af:
+            await af.write(ugoira_content)
+        tmp_file.path.replace(ugoira_file.path)
+        return ugoira_file
+
+    async def generate_ugoira(
+            self,
+            *,
+            original: bool = False,
+            format_: Literal['gif', 'webp'] = 'gif',
+            quality: int = 80
+    ) -> TmpResource:
+        """下载动图资源并生成 gif/webp 动图, 结果按作品及参数缓存, 同一动图同时只会生成一次
+
+        :param original: 是否下载原图
+        :param format_: 输出格式, webp 体积更小且编码更快
+        :param quality: webp 编码质量, 仅对 webp 有效
+        """
+        artwork_model = await self.get_artwork_model()
+        if artwork_model.illust_type != 2:
+            raise ValueError(f'Artwork {self.pid} is not ugoira')
+
+        file_name = f'{self.pid}_ugoira_{"original" if original else "small"}'
+        file_name = f'{file_name}_q{quality}.webp' if format_ == 'webp' else f'{file_name}.gif'
+        ugoira_file = pixiv_resource_config.default_ugoira_gif_folder(file_name)
+        if ugoira_file.is_file:
+            return ugoira_file
+
+        task = self._ugoira_generating_tasks.get(file_name)
+        if task is None:
+            task = asyncio.create_task(self._generate_ugoira(
+                ugoira_file=ugoira_file, original=original, format_=format_, quality=quality))
+            self._ugoira_generating_tasks[file_name] = task
+            task.add_done_callback(lambda _: self._ugoira_generating_tasks.pop(file_name, None))
+        return await asyncio.shield(task)
+
     async def generate_ugoira_gif(self, *, original: bool = False) -> TmpResource:
         """下载动图资源并生成 gif (非常吃 CPU 性能)
 
         :param original: 是否下载原图
         """
-
-        def _generate_frames_sequence(ugoira_path: TmpResource, data_model: PixivArtworkCompleteDataModel) -> bytes:
-            """构造动图生成的帧序列"""
-            _frames_list = []
-            _sum_delay = []
-            # 读取动图资源文件内容
-            with zipfile.ZipFile(ugoira_path.resolve_path, 'r') as _zf:
-                for frame in data_model.ugoira_meta.frames:
-                    _content = _zf.open(frame.file, 'r').read()
-                    _frames_list.append(imageio.v2.imread(_content))
-                    _sum_delay.append(frame.delay)
-            # 均值化处理动图帧时间
-            _avg_delay = sum(_sum_delay) / len(_sum_delay)
-            _avg_duration = _avg_delay / 1000
-            # 生成 gif
-            with BytesIO() as _bf:
-                imageio.mimsave(_bf, _frames_list, 'GIF', duration=_avg_duration)
-                _content = _bf.getvalue()
-            return _content
-
-        # 读取并解析动图帧信息, 生成 gif 文件
-        artwork_model = await self.get_artwork_model()
-        ugoira_file = await self.download_ugoira(original=original)
-        ugoira_content = await run_sync(_generate_frames_sequence)(ugoira_path=ugoira_file, data_model=artwork_model)
-        # 写入文件
-        gif_file_name = f'{self.pid}_ugoira_{"original" if original else "small"}.gif'
-        gif_file = pixiv_resource_config.default_ugoira_gif_folder(gif_file_name)
-        async with gif_file.async_open('wb') as af:
-            await af.write(ugoira_content)
-        return gif_file
+        return await self.generate_ugoira(original=original, format_='gif')
 
     async def format_desc_msg(self, desc_len: int = 64) -> str:
         """获取格式化作品描述文本
@@ -617,8 +742,8 @@ class PixivArtwork(Pixiv):
         recommend_result = await self.query_recommend(init_limit=init_limit, lang=lang)
         # 获取缩略图内容
         name = 'Pixiv Artwork Recommend'
-        preview_request = await _emit_preview_model_from_artwork_pids(preview_name=name,
-                                                                      pids=[x.id for x in recommend_result.illusts])
+        preview_request = await _emit_preview_model_from_artwork_pids(
+            preview_name=name, pids=[x.id for x in recommend_result.illusts], preview_size=(512, 512))
         preview_img_file = await generate_artworks_preview_image(
             preview=preview_request, preview_size=(512, 512), hold_ratio=True, num_of_line=3)
         return preview_img_file
@@ -706,39 +831,72 @@ class PixivUser(Pixiv):
         user_data_result = await self.get_user_model()
         # 获取缩略图内容
         name = f'Pixiv User Artwork  - {user_data_result.name}'
-        preview_request = await _emit_preview_model_from_artwork_pids(preview_name=name,
-                                                                      pids=user_data_result.manga_illusts[:num_limit])
+        preview_request = await _emit_preview_model_from_artwork_pids(
+            preview_name=name, pids=user_data_result.manga_illusts[:num_limit], preview_size=(360, 360))
         preview_img_file = await generate_artworks_preview_image(
             preview=preview_request, preview_size=(360, 360), hold_ratio=True, num_of_line=6)
         return preview_img_file
 
 
-async def _request_artwork_preview_body(pid: int, *, blur_r18: bool = True) -> PixivArtworkPreviewBody:
+async def _request_artwork_preview_body(
+        pid: int,
+        *,
+        blur_r18: bool = True,
+        preview_size: tuple[int, int] = pixiv_resource_config.default_preview_size
+) -> PixivArtworkPreviewBody:
     """生成多个作品的预览图, 获取生成预览图中每个作品的缩略图的数据
 
+    缩略图按 (pid, 尺寸, 是否模糊) 缓存, JPEG 直接以接近缩略图的尺寸解码, 缩小后再进行模糊处理
+
     :param pid: 作品 PID
     :param blur_r18: 是否模糊处理 r18 作品
+    :param preview_size: 预览图中单个缩略图的尺寸
     """
 
-    def _handle_r18_blur(image: bytes) -> bytes:
-        """模糊处理 r18 图"""
-        return ImageUtils.init_from_bytes(image=image).gaussian_blur().get_bytes()
+    def _handle_preview_tile(image: bytes, blur: bool) -> bytes:
+        """缩小作品图片并模糊处理 r18 图"""
+        _image = ImageUtils.init_from_bytes(image=image, draft_size=preview_size).image
+        _image.thumbnail(preview_size)
+        _tile = ImageUtils(image=_image.convert('RGB'))
+        if blur:
+            _tile.gaussian_blur()
+        return _tile.get_bytes()
 
     _artwork = PixivArtwork(pid=pid)
     _artwork_model = await _artwork.get_artwork_model()
-    _artwork_thumb = await _artwork.get_page_bytes(url_type='small')
-
-    if blur_r18 and _artwork_model.is_r18:
-        _artwork_thumb = await run_sync(_handle_r18_blur)(image=_artwork_thumb)
-
     desc_text = format_artwork_preview_desc(
         pid=_artwork_model.pid, title=_artwork_model.title, uname=_artwork_model.uname)
+
+    _need_blur = blur_r18 and _artwork_model.is_r18
+    _tile_file = pixiv_resource_config.default_preview_tile_folder(
+        f'{pid}_{preview_size[0]}x{preview_size[1]}_{"blur" if _need_blur else "raw"}.jpg')
+    if _tile_file.is_file:
+        # 缩略图缓存按最后使用时间清理, 命中时刷新修改时间
+        _tile_file.path.touch()
+        async with _tile_file.async_open('rb') as af:
+            _artwork_thumb = await af.read()
+        return PixivArtworkPreviewBody(desc_text=desc_text, preview_thumb=_artwork_thumb)
+
+    _artwork_thumb = await _artwork.get_page_bytes(url_type='small')
+    _artwork_thumb = await run_sync(_handle_preview_tile)(image=_artwork_thumb, blur=_need_blur)
+    async with _tile_file.async_open('wb') as af:
+        await af.write(_artwork_thumb)
     return PixivArtworkPreviewBody(desc_text=desc_text, preview_thumb=_artwork_thumb)
 
 
-async def _emit_preview_model_from_artwork_pids(preview_name: str, pids: list[int]) -> PixivArtworkPreviewModel:
-    """从作品信息中获取生成预览图所需要的数据模型"""
-    _tasks = [_request_artwork_preview_body(pid=pid) for pid in pids]
+async def _emit_preview_model_from_artwork_pids(
+        preview_name: str,
+        pids: list[int],
+        *,
+        preview_size: tuple[int, int] = pixiv_resource_config.default_preview_size
+) -> PixivArtworkPreviewModel:
+    """从作品信息中获取生成预览图所需要的数据模型
+
+    :param preview_name: 预览图名称
+    :param pids: 作品 PID 列表
+    :param preview_size: 预览图中单个缩略图的尺寸, 需与生成预览图时的尺寸一致以复用缩略图缓存
+    """
+    _tasks = [_request_artwork_preview_body(pid=pid, preview_size=preview_size) for pid in pids]
     _requests_data = await semaphore_gather(tasks=_tasks, semaphore_num=30, filter_exception=True)
     _requests_data = list(_requests_data)
     count = len(_requests_data)
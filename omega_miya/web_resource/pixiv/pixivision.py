@@ -33,7 +33,7 @@ class Pixivision(object):
     async def query_illustration_list(cls, page: int = 1) -> PixivisionIllustrationList:
         """获取并解析 Pixivision Illustration 导览页面内容"""
         params = {'p': page, 'lang': 'zh'}
-        illustration_data = await cls._fetcher.get_text(url=cls._illustration_url, params=params)
+        illustration_data = await cls._fetcher.get_text(url=cls._illustration_url, params=params, cache_ttl=300)
         if illustration_data.status != 200:
             raise PixivisionNetworkError(f'PixivisionNetworkError, {illustration_data.status}')
         # 解析页面
@@ -0,0 +1,161 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/20 21:05
+@FileName       : result_cache.py
+@Project        : nonebot2_miya
+@Description    : Pixiv 排行榜及搜索结果缓存, 同时缓存生成的预览图
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import time
+import shutil
+import hashlib
+import ujson as json
+from datetime import datetime, timedelta, timezone
+
+from nonebot import get_driver, logger
+
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.process_utils import run_sync
+
+from .config import pixiv_resource_config
+
+
+_RANKING_TIMEZONE = timezone(timedelta(hours=9))
+"""Pixiv 排行榜更新时间所在的时区 (JST)"""
+
+_RANKING_UPDATE_HOUR: int = 12
+"""Pixiv 排行榜每天的更新时间"""
+
+_RANKING_NOT_UPDATED_RETRY_TIME: int = 600
+"""到达更新时间但排行榜尚未更新时, 缓存的有效时间"""
+
+
+class PixivResultCache(object):
+    """Pixiv 排行榜及搜索结果缓存
+
+    - 解析后的结果按请求 key 缓存, 排行榜缓存至下次榜单更新, 搜索结果按固定时间缓存
+    - 预览图以预览标题及结果内容的 hash 为 key, 结果不变时直接复用, 仅按保留时间清理
+    """
+    _cache_folder: TmpResource = pixiv_resource_config.default_result_cache_folder
+    _preview_keep_time: int = pixiv_resource_config.default_result_preview_cache_keep_time
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode(encoding='utf8')).hexdigest()
+
+    @staticmethod
+    def get_ranking_latest_date() -> str:
+        """当前应当已经发布的最新一期排行榜日期, 排行榜在每天 12:00 (JST) 更新为前一天的榜单"""
+        now = datetime.now(tz=_RANKING_TIMEZONE)
+        days = 1 if now.hour >= _RANKING_UPDATE_HOUR else 2
+        return (now - timedelta(days=days)).strftime('%Y%m%d')
+
+    @staticmethod
+    def get_ranking_expires_at(ranking_date: str) -> float:
+        """根据获取到的排行榜日期计算缓存的过期时间"""
+        now = datetime.now(tz=_RANKING_TIMEZONE)
+        if ranking_date < PixivResultCache.get_ranking_latest_date():
+            # 已到更新时间但排行榜尚未更新, 稍后重新获取
+            return now.timestamp() + _RANKING_NOT_UPDATED_RETRY_TIME
+
+        next_update = now.replace(hour=_RANKING_UPDATE_HOUR, minute=0, second=0, microsecond=0)
+        if now >= next_update:
+            next_update += timedelta(days=1)
+        return next_update.timestamp()
+
+    def generate_preview_key(self, preview_name: str, result: str) -> str:
+        """根据预览图标题及结果内容生成预览图缓存 key"""
+        return self._hash(f'{preview_name}|{result}')
+
+    def _get_result_file(self, key: str) -> TmpResource:
+        return self._cache_folder('result', f'{self._hash(key)}.json')
+
+    def _get_preview_file(self, preview_key: str) -> TmpResource:
+        return self._cache_folder('preview', f'{preview_key}.jpg')
+
+    async def get(self, key: str) -> str | None:
+        """获取未过期的缓存结果
+
+        :return: 结果的 json 文本
+        """
+        file = self._get_result_file(key=key)
+        if not file.is_file:
+            return None
+        try:
+            async with file.async_open('r', encoding='utf8') as af:
+                data = json.loads(await af.read())
+        except Exception as e:
+            logger.debug(f'PixivResultCache | Loading result cache {key} failed, {e}')
+            return None
+
+        if time.time() >= data['expires_at']:
+            return None
+        return data['result']
+
+    async def set(self, key: str, result: str, *, expires_at: float) -> None:
+        """写入缓存结果
+
+        :param key: 请求 key
+        :param result: 结果的 json 文本
+        :param expires_at: 过期时间戳
+        """
+        file = self._get_result_file(key=key)
+        async with file.async_open('w', encoding='utf8') as af:
+            await af.write(json.dumps({'expires_at': expires_at, 'result': result}, ensure_ascii=False))
+
+    async def get_preview(self, preview_key: str) -> TmpResource | None:
+        """获取已生成的预览图"""
+        file = self._get_preview_file(preview_key=preview_key)
+        return file if file.is_file else None
+
+    async def set_preview(self, preview_key: str, preview: TmpResource) -> TmpResource:
+        """缓存生成的预览图, 返回缓存文件"""
+        file = self._get_preview_file(preview_key=preview_key)
+        file.path.parent.mkdir(parents=True, exist_ok=True)
+        await run_sync(shutil.copyfile)(preview.path, file.path)
+        return file
+
+    def _clear_expired_files(self) -> int:
+        count = 0
+        now = time.time()
+
+        result_folder = self._cache_folder('result')
+        if result_folder.is_dir:
+            for file in result_folder.path.iterdir():
+                try:
+                    with file.open('r', encoding='utf8') as f:
+                        if now < json.loads(f.read())['expires_at']:
+                            continue
+                except Exception as e:
+                    logger.debug(f'PixivResultCache | Result cache file {file} broken, {e}')
+                file.unlink(missing_ok=True)
+                count += 1
+
+        preview_folder = self._cache_folder('preview')
+        if preview_folder.is_dir:
+            for file in preview_folder.path.iterdir():
+                if now - file.stat().st_mtime > self._preview_keep_time:
+                    file.unlink(missing_ok=True)
+                    count += 1
+        return count
+
+    async def clear_expired(self) -> int:
+        """清理过期的结果及超过保留时间的预览图, 返回清理的文件数"""
+        return await run_sync(self._clear_expired_files)()
+
+
+pixiv_result_cache = PixivResultCache()
+
+
+@get_driver().on_startup
+async def _clear_expired_pixiv_result_cache() -> None:
+    """启动时清理过期的排行榜及搜索结果缓存"""
+    count = await pixiv_result_cache.clear_expired()
+    logger.opt(colors=True).debug(f'<lc>Pixiv</lc> | Cleared {count} expired result cache file(s)')
+
+
+__all__ = [
+    'pixiv_result_cache'
+]
@@ -2,6 +2,7 @@ import json
 import hashlib
 import hmac
 import datetime
+from functools import lru_cache
 from typing import Any
 
 from omega_miya.web_resource.http_fetcher import HttpFetcher, HttpFetcherDictResult
@@ -9,8 +10,22 @@ from omega_miya.web_resource.http_fetcher import HttpFetcher, HttpFetcherDictRes
 from .config import tencent_cloud_config
 
 
+def _hmac_sha256(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+@lru_cache(maxsize=32)
+def _derive_signing_key(secret_key: str, date: str, service: str) -> bytes:
+    """计算 TC3-HMAC-SHA256 派生签名密钥, 同一密钥每个服务每天只会变化一次, 缓存复用"""
+    secret_date = _hmac_sha256(f'TC3{secret_key}'.encode("utf-8"), date)
+    secret_service = _hmac_sha256(secret_date, service)
+    return _hmac_sha256(secret_service, "tc3_request")
+
+
 class TencentCloudApi(object):
     """腾讯云 Api"""
+    _timeout: int = 10
+
     def __init__(
             self,
             host: str,
@@ -28,31 +43,29 @@ class TencentCloudApi(object):
             "Host": self._host
         }
 
-        self._request_timestamp = int(datetime.datetime.now().timestamp())
-        self._date = datetime.datetime.utcfromtimestamp(self._request_timestamp).strftime('%Y-%m-%d')
-        self._credential_scope = f'{self._date}/{self._service}/tc3_request'
-
         sort_signed_headers = [f'{x}'.lower() for x in self._headers.keys()]
         sort_signed_headers.sort()
         self._signed_headers = ';'.join(sort_signed_headers)
 
-    def __upgrade_signed_header(self,
-                                action: str,
-                                region: str,
-                                version: str,
-                                payload: dict[str, Any]):
-        self._headers.update({
-            'Authorization': self.__sign_v3(payload=payload),
-            'Content-Type': 'application/json',
-            'Host': self._host,
+    def __signed_headers(self,
+                         action: str,
+                         region: str,
+                         version: str,
+                         payload_str: str) -> dict[str, str]:
+        """生成每次请求的签名头, 时间戳须在每次请求时重新生成"""
+        request_timestamp = int(datetime.datetime.now().timestamp())
+        headers = self._headers.copy()
+        headers.update({
+            'Authorization': self.__sign_v3(payload_str=payload_str, request_timestamp=request_timestamp),
             'X-TC-Action': action,
             'X-TC-Region': region,
-            'X-TC-Timestamp': str(self._request_timestamp),
+            'X-TC-Timestamp': str(request_timestamp),
             'X-TC-Version': version
         })
+        return headers
 
     def __canonical_request(self,
-                            payload: dict[str, Any],
+                            payload_str: str,
                             http_request_method: str = 'POST',
                             canonical_uri: str = '/',
                             canonical_query_string: str = '') -> str:
@@ -60,7 +73,6 @@ class TencentCloudApi(object):
         sort_headers.sort()
         canonical_headers = ''.join(sort_headers)
 
-        payload_str = json.dumps(payload)
         hashed_request_payload = hashlib.sha256(payload_str.encode('utf-8')).hexdigest().lower()
 
         canonical_request = f'{http_request_method}\n' \
@@ -72,32 +84,32 @@ class TencentCloudApi(object):
 
         return canonical_request
 
-    def __string_to_sign(self,
-                         canonical_request: str,
+    @staticmethod
+    def __string_to_sign(canonical_request: str,
+                         request_timestamp: int,
+                         credential_scope: str,
                          algorithm: str = 'TC3-HMAC-SHA256') -> str:
         hashed_canonical_request = hashlib.sha256(canonical_request.encode('utf-8')).hexdigest().lower()
 
         string_to_sign = f'{algorithm}\n' \
-                         f'{self._request_timestamp}\n' \
-                         f'{self._credential_scope}\n' \
+                         f'{request_timestamp}\n' \
+                         f'{credential_scope}\n' \
                          f'{hashed_canonical_request}'
 
         return string_to_sign
 
-    def __sign_v3(self, payload: dict[str, Any]) -> str:
-        # 计算签名摘要函数
-        def __sign(key, msg):
-            return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+    def __sign_v3(self, payload_str: str, request_timestamp: int) -> str:
+        date = datetime.datetime.utcfromtimestamp(request_timestamp).strftime('%Y-%m-%d')
+        credential_scope = f'{date}/{self._service}/tc3_request'
+        secret_signing = _derive_signing_key(secret_key=self._secret_key, date=date, service=self._service)
 
-        secret_date = __sign(f'TC3{self._secret_key}'.encode("utf-8"), self._date)
-        secret_service = __sign(secret_date, self._service)
-        secret_signing = __sign(secret_service, "tc3_request")
-
-        canonical_request = self.__canonical_request(payload=payload)
-        string_to_sign = self.__string_to_sign(canonical_request)
+        canonical_request = self.__canonical_request(payload_str=payload_str)
+        string_to_sign = self.__string_to_sign(canonical_request=canonical_request,
+                                               request_timestamp=request_timestamp,
+                                               credential_scope=credential_scope)
         signature = hmac.new(secret_signing, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
 
-        authorization = f'TC3-HMAC-SHA256 Credential={self._secret_id}/{self._credential_scope}, ' \
+        authorization = f'TC3-HMAC-SHA256 Credential={self._secret_id}/{credential_scope}, ' \
                         f'SignedHeaders={self._signed_headers}, ' \
                         f'Signature={signature}'
 
@@ -105,9 +117,12 @@ class TencentCloudApi(object):
 
     async def post_request(
             self, action: str, region: str, version: str, payload: dict[str, Any]) -> HttpFetcherDictResult:
-        self.__upgrade_signed_header(action=action, region=region, version=version, payload=payload)
+        # 与 aiohttp 发送 json 时使用相同的序列化方式计算签名
+        payload_str = json.dumps(payload)
+        headers = self.__signed_headers(action=action, region=region, version=version, payload_str=payload_str)
 
-        fetcher = HttpFetcher(timeout=10, headers=self._headers)
+        # 使用共享连接池复用与腾讯云的连接
+        fetcher = HttpFetcher(timeout=self._timeout, headers=headers, keep_alive=True)
         result = await fetcher.post_json_dict(url=self._endpoint, json=payload)
         return result
 
@@ -10,7 +10,7 @@
 
 
 from .base_model import BaseTencentCloudErrorResponse as TencentCloudErrorResponse
-from .tmt import TencentCloudTextTranslateResponse
+from .tmt import TencentCloudTextTranslateResponse, TencentCloudTextTranslateBatchResponse
 from .nlp import (TencentCloudChatBotResponse, TencentCloudSentimentAnalysisResponse,
                   TencentCloudLexicalAnalysisResponse, TencentCloudTextCorrectionResponse)
 
@@ -18,6 +18,7 @@ from .nlp import (TencentCloudChatBotResponse, TencentCloudSentimentAnalysisResp
 __all__ = [
     'TencentCloudErrorResponse',
     'TencentCloudTextTranslateResponse',
+    'TencentCloudTextTranslateBatchResponse',
     'TencentCloudChatBotResponse',
     'TencentCloudSentimentAnalysisResponse',
     'TencentCloudLexicalAnalysisResponse',
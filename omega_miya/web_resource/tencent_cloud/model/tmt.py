@@ -23,6 +23,19 @@ class TencentCloudTextTranslateResponse(BaseTencentCloudResponse):
     Response: BaseTencentCloudErrorResponse | TencentCloudTextTranslateSuccessResponse
 
 
+class TencentCloudTextTranslateBatchSuccessResponse(BaseTencentCloudSuccessResponse):
+    """批量文本翻译 Api 调用成功返回内容"""
+    TargetTextList: list[str]
+    Source: str
+    Target: str
+
+
+class TencentCloudTextTranslateBatchResponse(BaseTencentCloudResponse):
+    """批量文本翻译 Api 调用成功返回"""
+    Response: BaseTencentCloudErrorResponse | TencentCloudTextTranslateBatchSuccessResponse
+
+
 __all__ = [
-    'TencentCloudTextTranslateResponse'
+    'TencentCloudTextTranslateResponse',
+    'TencentCloudTextTranslateBatchResponse'
 ]
@@ -9,7 +9,7 @@
 """
 
 from .cloud_api import TencentCloudApi
-from .model import TencentCloudTextTranslateResponse
+from .model import TencentCloudTextTranslateResponse, TencentCloudTextTranslateBatchResponse
 from .exception import TencentCloudNetworkError
 
 
@@ -44,6 +44,27 @@ class TencentTMT(object):
             raise TencentCloudNetworkError(f'TencentCloudNetworkError, status code {result.status}')
         return TencentCloudTextTranslateResponse.parse_obj(result.result)
 
+    async def translate_batch(
+            self,
+            source_text_list: list[str],
+            *,
+            source: str = 'auto',
+            target: str = 'zh',
+            project_id: int = 0) -> TencentCloudTextTranslateBatchResponse:
+        """批量文本翻译, 一次请求翻译多段文本, 结果顺序与输入一致
+
+        :param source_text_list: 待翻译的文本列表, 文本统一使用utf-8格式编码, 总长度需低于2000字符
+        :param source: 源语言
+        :param target: 目标语言
+        :param project_id: 项目ID, 如无配置请填写默认项目ID:0
+        """
+        payload = {'SourceTextList': source_text_list, 'Source': source, 'Target': target, 'ProjectId': project_id}
+        result = await self._api.post_request(
+            action='TextTranslateBatch', version='2018-03-21', region='ap-chengdu', payload=payload)
+        if result.status != 200:
+            raise TencentCloudNetworkError(f'TencentCloudNetworkError, status code {result.status}')
+        return TencentCloudTextTranslateBatchResponse.parse_obj(result.result)
+
 
 __all__ = [
     'TencentTMT'
@@ -0,0 +1,118 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/28 20:10
+@FileName       : conftest.py
+@Project        : nonebot2_miya
+@Description    : 测试公共配置, 初始化 nonebot 并提供基于 HttpFetcher 回放模式的请求 fixture
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import uuid
+import base64
+import shutil
+import socket
+import asyncio
+import ujson as json
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+
+import pytest
+import nonebot
+
+# omega_miya 的各模块在导入时读取 driver 配置, 必须先初始化 nonebot
+# 数据库配置仅用于通过配置验证, 测试中不会实际连接数据库
+nonebot.init(database='mysql', db_driver='asyncmy', db_host='127.0.0.1', db_port=3306,
+             db_user='test', db_password='test', db_name='test', db_prefix='test_')
+
+from yarl import URL
+
+from omega_miya.local_resource import TmpResource
+from omega_miya.web_resource import HttpFetcher
+from omega_miya.web_resource.http_fetcher import replay as replay_module
+from omega_miya.web_resource.http_fetcher.config import HttpFetcherReplayConfig
+
+
+R = TypeVar('R')
+
+
+def _get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@dataclass
+class _ReplayResourceConfig:
+    default_fixture_folder: TmpResource
+
+
+class ReplayFixtures(object):
+    """在测试中为指定请求写入回放响应, 并在回放服务器运行期间执行协程"""
+
+    def __init__(self, fixture_folder: TmpResource) -> None:
+        self.fixture_folder = fixture_folder
+
+    def add(
+            self,
+            method: str,
+            url: str,
+            *,
+            body: dict[str, Any] | list[Any] | str | bytes,
+            status: int = 200,
+            params: dict[str, str] | None = None
+    ) -> None:
+        """为请求追加一个回放响应, 同一请求的多个响应按添加顺序依次返回"""
+        # 与 aiohttp 实际发出的请求一致, 空路径补全为 "/"
+        request_url = URL(url)
+        request_url = request_url.with_path(request_url.path).with_query(request_url.query)
+        request_url = request_url.update_query(params) if params else request_url
+        if isinstance(body, (dict, list)):
+            content, content_type = json.dumps(body, ensure_ascii=False).encode('utf8'), 'application/json'
+        elif isinstance(body, str):
+            content, content_type = body.encode('utf8'), 'text/plain; charset=utf-8'
+        else:
+            content, content_type = body, 'application/octet-stream'
+
+        file = replay_module._get_fixture_file(method=method, url=request_url)
+        fixture = {'key': replay_module._generate_fixture_key(method=method, url=request_url), 'responses': []}
+        if file.is_file:
+            with file.open(mode='r', encoding='utf8') as f:
+                fixture = json.loads(f.read())
+
+        fixture['responses'].append({
+            'status': status,
+            'headers': [['Content-Type', content_type]],
+            'body': base64.b64encode(content).decode('ascii')
+        })
+        with file.open(mode='w', encoding='utf8') as f:
+            f.write(json.dumps(fixture, ensure_ascii=False))
+
+    def run(self, func: Callable[[], Awaitable[R]]) -> R:
+        """启动回放服务器并执行协程"""
+        async def _run() -> R:
+            server = replay_module.ReplayServer()
+            await server.start()
+            try:
+                return await func()
+            finally:
+                await HttpFetcher.close_shared_connector()
+                await server.stop()
+
+        return asyncio.run(_run())
+
+
+@pytest.fixture
+def replay_fixtures(monkeypatch: pytest.MonkeyPatch) -> Iterator[ReplayFixtures]:
+    """将 HttpFetcher 切换为回放模式, 所有请求由测试中添加的回放响应返回"""
+    replay_config = HttpFetcherReplayConfig(http_fetcher_mode='replay', http_fetcher_replay_port=_get_free_port())
+    fixture_folder = TmpResource('http_fetcher', 'test_fixtures', uuid.uuid4().hex)
+
+    monkeypatch.setattr(HttpFetcher, '_replay_config', replay_config)
+    monkeypatch.setattr(replay_module, 'http_fetcher_replay_config', replay_config)
+    monkeypatch.setattr(replay_module, 'http_fetcher_resource_config',
+                        _ReplayResourceConfig(default_fixture_folder=fixture_folder))
+
+    yield ReplayFixtures(fixture_folder=fixture_folder)
+
+    shutil.rmtree(fixture_folder.path, ignore_errors=True)
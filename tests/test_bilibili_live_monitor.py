@@ -0,0 +1,50 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/29 22:10
+@FileName       : test_bilibili_live_monitor.py
+@Project        : nonebot2_miya
+@Description    : Bilibili live monitor tests
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import pytest
+
+# 插件导入链中的 text_utils 在导入时加载字体, 未放置字体资源文件时无法导入
+try:
+    from omega_miya.plugins.bilibili_live_monitor import utils as live_monitor_utils
+except OSError as e:
+    pytest.skip(f'text_utils 字体资源文件加载失败, {e}', allow_module_level=True)
+
+from omega_miya.web_resource.bilibili import BilibiliLiveRoom
+
+
+def _live_room_data(uid: int) -> dict:
+    return {
+        'uid': uid,
+        'room_id': uid + 10000,
+        'short_id': 0,
+        'title': f'live_{uid}',
+        'live_status': 1,
+        'live_time': '2022-12-29 22:00:00'
+    }
+
+
+def test_query_live_room_status_skips_failed_chunk(replay_fixtures, monkeypatch: pytest.MonkeyPatch) -> None:
+    """用户数量超过单批上限时分批查询, 单批失败时只跳过该批用户"""
+    monkeypatch.setattr(live_monitor_utils.plugin_config, 'bilibili_live_monitor_query_chunk_size', 2)
+    # 同一 url 的回放响应按请求顺序返回, 按顺序逐批查询
+    monkeypatch.setattr(live_monitor_utils.plugin_config, 'bilibili_live_monitor_query_concurrency', 1)
+
+    uid_list = [1, 2, 3, 4, 5]
+    replay_fixtures.add('POST', BilibiliLiveRoom._live_by_uids_api_url,
+                        body={'code': 0, 'data': {str(uid): _live_room_data(uid) for uid in (1, 2)}})
+    replay_fixtures.add('POST', BilibiliLiveRoom._live_by_uids_api_url,
+                        body={'code': -412, 'message': '请求被拦截', 'data': {}})
+    replay_fixtures.add('POST', BilibiliLiveRoom._live_by_uids_api_url,
+                        body={'code': 0, 'data': {'5': _live_room_data(5)}})
+
+    result = replay_fixtures.run(lambda: live_monitor_utils._query_live_room_status(uid_list=uid_list))
+
+    assert sorted(result.keys()) == [1, 2, 5]
+    assert result[5].room_id == 10005
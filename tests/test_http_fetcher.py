@@ -0,0 +1,58 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/28 20:32
+@FileName       : test_http_fetcher.py
+@Project        : nonebot2_miya
+@Description    : HttpFetcher tests
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from omega_miya.web_resource import HttpFetcher
+
+
+def _build_response(uids: list[int]) -> dict:
+    return {'code': 0, 'data': {str(i): {'uid': i, 'name': f'user_{i}'} for i in uids}}
+
+
+async def _handle_post(request: web.Request) -> web.Response:
+    payload = await request.json()
+    return web.json_response(_build_response(payload['uids']))
+
+
+async def _post_json_dict(uids: list[int]):
+    app = web.Application()
+    app.router.add_post('/x/test', _handle_post)
+    async with TestServer(app, host='127.0.0.1') as server:
+        return await HttpFetcher().post_json_dict(url=str(server.make_url('/x/test')), json={'uids': uids})
+
+
+@pytest.mark.parametrize('item_count', [1, 2000], ids=['small', 'large'])
+def test_post_json_dict_with_json_payload(item_count: int) -> None:
+    """json 参数不应覆盖模块中的 json 解析函数, 小体积及需要在线程池中解析的大体积响应都能正常解析"""
+    uids = list(range(item_count))
+    result = asyncio.run(_post_json_dict(uids=uids))
+
+    assert result.status == 200
+    assert result.result == _build_response(uids)
+
+
+def test_replay_keeps_non_default_port(replay_fixtures) -> None:
+    """回放时区分同一 host 的不同端口"""
+    replay_fixtures.add('GET', 'http://example.com/api/status', body={'port': 80})
+    replay_fixtures.add('GET', 'http://example.com:8080/api/status', body={'port': 8080})
+
+    async def _get_status() -> tuple[dict, dict]:
+        default_result = await HttpFetcher().get_json_dict(url='http://example.com/api/status')
+        port_result = await HttpFetcher().get_json_dict(url='http://example.com:8080/api/status')
+        return default_result.result, port_result.result
+
+    default_result, port_result = replay_fixtures.run(_get_status)
+
+    assert default_result == {'port': 80}
+    assert port_result == {'port': 8080}
@@ -0,0 +1,190 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/30 22:40
+@FileName       : test_message_delivery.py
+@Project        : nonebot2_miya
+@Description    : MessageDeliveryQueue tests
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+import uuid
+import shutil
+import asyncio
+from typing import Callable, Iterator
+
+import pytest
+
+# message_tools 导入链中的 text_utils 在导入时加载字体, 未放置字体资源文件时无法导入
+try:
+    from omega_miya.utils import message_delivery
+except OSError as e:
+    pytest.skip(f'text_utils 字体资源文件加载失败, {e}', allow_module_level=True)
+
+from nonebot.adapters.onebot.v11.message import Message
+
+from omega_miya.database.internal.entity import BaseInternalEntity, InternalBotGroup
+from omega_miya.local_resource import TmpResource
+from omega_miya.utils.message_delivery import MessageDeliveryQueue
+
+
+_BOT_ID: str = '10001'
+
+
+def _group(group_id: str) -> InternalBotGroup:
+    return InternalBotGroup(bot_id=_BOT_ID, parent_id=_BOT_ID, entity_id=group_id)
+
+
+class _FakeSender(object):
+    """替代 MessageSender, 记录每次发送, 按 should_fail 判断本次发送是否失败"""
+
+    def __init__(self, should_fail: Callable[[str, str], bool] = lambda group_id, text: False) -> None:
+        self.should_fail = should_fail
+        self.attempts: list[tuple[str, str]] = []
+        self.sent: list[tuple[str, str]] = []
+
+    async def send_internal_entity_msg(self, entity: BaseInternalEntity, message: Message) -> int | Exception:
+        record = (entity.entity_id, message.extract_plain_text())
+        self.attempts.append(record)
+        if self.should_fail(*record):
+            return RuntimeError('send failed')
+        self.sent.append(record)
+        return len(self.sent)
+
+
+@pytest.fixture
+def sender(monkeypatch: pytest.MonkeyPatch) -> _FakeSender:
+    """替换 MessageSender 的发送, 并去除限速及重试等待"""
+    fake_sender = _FakeSender()
+    monkeypatch.setattr(message_delivery.MessageSender, 'init_from_bot_id', lambda bot_id: fake_sender)
+    monkeypatch.setattr(message_delivery, '_SEND_RATE', 1000.0)
+    monkeypatch.setattr(message_delivery, '_SEND_BURST', 100)
+    monkeypatch.setattr(message_delivery, '_RETRY_BACKOFF', 0.01)
+    return fake_sender
+
+
+@pytest.fixture
+def pending_file(monkeypatch: pytest.MonkeyPatch) -> Iterator[TmpResource]:
+    """将未完成投递消息的持久化文件替换为单个测试独立的文件"""
+    folder = TmpResource('message_delivery', 'test', uuid.uuid4().hex)
+    file = folder('pending.json')
+    monkeypatch.setattr(message_delivery, '_PENDING_FILE', file)
+    yield file
+    shutil.rmtree(folder.path, ignore_errors=True)
+
+
+def _run_until_delivered(queue: MessageDeliveryQueue, enqueue: Callable[[], None]) -> None:
+    """入队后等待队列全部投递完成"""
+    async def _run() -> None:
+        enqueue()
+        async with asyncio.timeout(5):
+            while queue.pending_count:
+                await asyncio.sleep(0.01)
+
+    asyncio.run(_run())
+
+
+def test_failure_blocks_only_own_target(sender: _FakeSender, pending_file: TmpResource) -> None:
+    """会话发送失败时只有该会话等待重试, 其他会话正常发送"""
+    failed = set()
+
+    def _fail_first_time(group_id: str, text: str) -> bool:
+        if group_id == '20001' and text not in failed:
+            failed.add(text)
+            return True
+        return False
+
+    sender.should_fail = _fail_first_time
+    queue = MessageDeliveryQueue()
+
+    def _enqueue() -> None:
+        queue.enqueue(entity=_group('20001'), message='a1')
+        queue.enqueue(entity=_group('20002'), message='b1')
+
+    _run_until_delivered(queue, _enqueue)
+
+    assert sender.attempts == [('20001', 'a1'), ('20002', 'b1'), ('20001', 'a1')]
+    assert sender.sent == [('20002', 'b1'), ('20001', 'a1')]
+
+
+def test_order_kept_after_backoff(sender: _FakeSender, pending_file: TmpResource) -> None:
+    """发送失败重试后同一会话的消息仍按入队顺序发送"""
+    failed = set()
+
+    def _fail_first_time(group_id: str, text: str) -> bool:
+        if text == 'a2' and text not in failed:
+            failed.add(text)
+            return True
+        return False
+
+    sender.should_fail = _fail_first_time
+    queue = MessageDeliveryQueue()
+
+    def _enqueue() -> None:
+        for text in ('a1', 'a2', 'a3'):
+            queue.enqueue(entity=_group('20001'), message=text)
+
+    _run_until_delivered(queue, _enqueue)
+
+    assert sender.sent == [('20001', 'a1'), ('20001', 'a2'), ('20001', 'a3')]
+
+
+def test_drop_after_max_attempts(sender: _FakeSender, pending_file: TmpResource) -> None:
+    """超过最大发送次数的消息被丢弃, 之后的消息继续发送"""
+    sender.should_fail = lambda group_id, text: text == 'a1'
+    queue = MessageDeliveryQueue()
+
+    def _enqueue() -> None:
+        queue.enqueue(entity=_group('20001'), message='a1')
+        queue.enqueue(entity=_group('20001'), message='a2')
+
+    _run_until_delivered(queue, _enqueue)
+
+    assert sender.attempts.count(('20001', 'a1')) == message_delivery._MAX_ATTEMPTS
+    assert sender.sent == [('20001', 'a2')]
+
+
+def test_coalesce_by_key(sender: _FakeSender, pending_file: TmpResource) -> None:
+    """同一会话中相邻且 coalesce_key 相同的消息合并发送, 每次合并数量有上限"""
+    queue = MessageDeliveryQueue()
+    texts = [f'p{i}' for i in range(message_delivery._MAX_COALESCE_NUM + 1)]
+
+    def _enqueue() -> None:
+        for text in texts:
+            queue.enqueue(entity=_group('20001'), message=text, coalesce_key='pixiv_user_1')
+        queue.enqueue(entity=_group('20001'), message='other')
+        queue.enqueue(entity=_group('20001'), message='q0', coalesce_key='pixiv_user_2')
+
+    _run_until_delivered(queue, _enqueue)
+
+    assert sender.sent == [
+        ('20001', '\n\n'.join(texts[:message_delivery._MAX_COALESCE_NUM])),
+        ('20001', texts[-1]),
+        ('20001', 'other'),
+        ('20001', 'q0')
+    ]
+
+
+def test_load_restores_saved_items(monkeypatch: pytest.MonkeyPatch, pending_file: TmpResource) -> None:
+    """bot 不在线时消息保留在队列中, save 写入的内容可以由 load 完整恢复"""
+    def _bot_offline(bot_id: str):
+        raise KeyError(bot_id)
+
+    monkeypatch.setattr(message_delivery.MessageSender, 'init_from_bot_id', _bot_offline)
+    queue = MessageDeliveryQueue()
+
+    async def _save() -> None:
+        queue.enqueue(entity=_group('20001'), message='a1', coalesce_key='pixiv_user_1')
+        queue.enqueue(entity=_group('20002'), message='b1')
+        # 等待 worker 发现 bot 不在线并退出
+        await asyncio.sleep(0.1)
+        await queue.save()
+
+    asyncio.run(_save())
+    assert queue.pending_count == 2
+
+    restored_queue = MessageDeliveryQueue()
+    restored_count = asyncio.run(restored_queue.load())
+
+    assert restored_count == 2
+    assert restored_queue._dump_items() == queue._dump_items()
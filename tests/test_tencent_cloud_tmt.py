@@ -0,0 +1,46 @@
+"""
+@Author         : Ailitonia
+@Date           : 2022/12/29 21:05
+@FileName       : test_tencent_cloud_tmt.py
+@Project        : nonebot2_miya
+@Description    : TencentTMT tests
+@GitHub         : https://github.com/Ailitonia
+@Software       : PyCharm
+"""
+
+from omega_miya.web_resource.tencent_cloud import TencentTMT
+
+
+_TMT_URL: str = 'https://tmt.tencentcloudapi.com'
+_REQUEST_ID: str = '4d1c5c2e-9f1a-4f55-8d0e-6a0b0e2f7c31'
+
+
+def test_translate_batch(replay_fixtures) -> None:
+    """批量翻译结果按输入顺序返回"""
+    replay_fixtures.add('POST', _TMT_URL, body={'Response': {
+        'TargetTextList': ['你好', '世界'],
+        'Source': 'en',
+        'Target': 'zh',
+        'RequestId': _REQUEST_ID
+    }})
+
+    result = replay_fixtures.run(
+        lambda: TencentTMT(secret_id='id', secret_key='key').translate_batch(source_text_list=['hello', 'world']))
+
+    assert result.success
+    assert result.Response.TargetTextList == ['你好', '世界']
+    assert result.Response.Source == 'en'
+
+
+def test_translate_batch_error_response(replay_fixtures) -> None:
+    """Api 返回错误信息时解析为错误结果"""
+    replay_fixtures.add('POST', _TMT_URL, body={'Response': {
+        'Error': {'Code': 'AuthFailure.SignatureFailure', 'Message': 'The provided credentials could not be validated.'},
+        'RequestId': _REQUEST_ID
+    }})
+
+    result = replay_fixtures.run(
+        lambda: TencentTMT(secret_id='id', secret_key='key').translate_batch(source_text_list=['hello', 'world']))
+
+    assert result.error
+    assert result.Response.Error.Code == 'AuthFailure.SignatureFailure'